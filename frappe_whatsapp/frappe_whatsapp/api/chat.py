@@ -5,30 +5,112 @@ Backend API for the WhatsApp chat interface
 
 import frappe
 from frappe import _
+from frappe.utils import cint, get_datetime
+
+from frappe_whatsapp.utils import inbox_index
+from frappe_whatsapp.utils.conversation import mark_read
+from frappe_whatsapp.utils.etag import conditional_response
+from frappe_whatsapp.utils.sync import get_deleted, make_cursor, parse_cursor
+
+SYNC_PAGE_SIZE = 500
+# contacts sent on a client's first load; older ones are paged in with get_contacts
+INITIAL_CONTACTS = 100
+
+
+CONTACT_FIELDS = """
+	wc.name,
+	wc.mobile_no,
+	wc.contact_name,
+	c.last_message_preview AS last_message,
+	c.last_message_time AS last_message_date,
+	c.unread_count,
+	wc.qualification_status,
+	wc.converted_to_lead,
+	wc.lead_reference
+"""
 
 
 @frappe.whitelist()
-def get_contacts():
-	"""Get all WhatsApp contacts with last message preview."""
-	
-	contacts = frappe.db.sql("""
-		SELECT 
-			wc.name,
-			wc.mobile_no,
-			wc.contact_name,
-			wc.last_message,
-			wc.last_message_date,
-			wc.unread_count,
-			wc.qualification_status,
-			wc.converted_to_lead,
-			wc.lead_reference
-		FROM `tabWhatsApp Contact` wc
-		ORDER BY wc.last_message_date DESC
-	""", as_dict=True)
-	
+def get_contacts(whatsapp_account=None, assigned_to=None, start=0, page_length=None):
+	"""Get WhatsApp contacts with last message preview, most recent first.
+
+	Ordering comes from the Redis inbox index, so a page of the sidebar costs
+	the same no matter how many contacts exist.
+	"""
+	start = cint(start)
+	page_length = cint(page_length) or None
+
+	version = frappe.db.sql("""
+		SELECT
+			(SELECT MAX(modified) FROM `tabWhatsApp Conversation`),
+			(SELECT COUNT(*) FROM `tabWhatsApp Conversation`),
+			(SELECT MAX(modified) FROM `tabWhatsApp Contact`)
+	""")[0]
+
+	return conditional_response(
+		["get_contacts", whatsapp_account, assigned_to, start, page_length],
+		version,
+		lambda: get_contact_list(whatsapp_account, assigned_to, start, page_length),
+	)
+
+
+def get_contact_list(whatsapp_account=None, assigned_to=None, start=0, page_length=None):
+	"""Contacts ordered by the inbox index, falling back to SQL."""
+	names = inbox_index.get_range(whatsapp_account, assigned_to, start, page_length)
+	if names is None:
+		return get_contacts_from_db(whatsapp_account, assigned_to, start, page_length)
+	if not names:
+		return []
+
+	rows = frappe.db.sql(f"""
+		SELECT {CONTACT_FIELDS}, c.whatsapp_account, c.assigned_to
+		FROM `tabWhatsApp Conversation` c
+		INNER JOIN `tabWhatsApp Contact` wc ON wc.name = c.whatsapp_contact
+		WHERE c.name IN %(names)s
+	""", {"names": names}, as_dict=True)
+	by_name = {row.name: row for row in rows}
+
+	contacts = []
+	for name in names:
+		row = by_name.get(name)
+		# Skip members the index has not caught up on (moved account, reassigned, deleted)
+		if not row:
+			continue
+		if whatsapp_account and row.whatsapp_account != whatsapp_account:
+			continue
+		if assigned_to and row.assigned_to != assigned_to:
+			continue
+		del row["whatsapp_account"], row["assigned_to"]
+		contacts.append(row)
+
 	return contacts
 
 
+def get_contacts_from_db(whatsapp_account=None, assigned_to=None, start=0, page_length=None):
+	"""SQL fallback for get_contacts when the inbox index is unavailable."""
+	conditions = []
+	if whatsapp_account:
+		conditions.append("c.whatsapp_account = %(whatsapp_account)s")
+	if assigned_to:
+		conditions.append("c.assigned_to = %(assigned_to)s")
+	where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+	limit_clause = "LIMIT %(start)s, %(page_length)s" if page_length else ""
+
+	return frappe.db.sql(f"""
+		SELECT {CONTACT_FIELDS}
+		FROM `tabWhatsApp Conversation` c
+		INNER JOIN `tabWhatsApp Contact` wc ON wc.name = c.whatsapp_contact
+		{where_clause}
+		ORDER BY c.last_message_time DESC
+		{limit_clause}
+	""", {
+		"whatsapp_account": whatsapp_account,
+		"assigned_to": assigned_to,
+		"start": start,
+		"page_length": page_length,
+	}, as_dict=True)
+
+
 @frappe.whitelist()
 def get_messages(contact_id):
 	"""Get all messages for a specific contact."""
@@ -36,7 +118,20 @@ def get_messages(contact_id):
 	# Verify contact exists
 	if not frappe.db.exists("WhatsApp Contact", contact_id):
 		frappe.throw(_("Contact not found"))
-	
+
+	version = frappe.db.sql("""
+		SELECT MAX(modified), COUNT(*)
+		FROM `tabWhatsApp Message`
+		WHERE whatsapp_contact = %s
+	""", contact_id)[0]
+
+	return conditional_response(
+		["get_messages", contact_id], version, lambda: get_message_list(contact_id)
+	)
+
+
+def get_message_list(contact_id):
+	"""All messages of a contact, oldest first."""
 	messages = frappe.db.sql("""
 		SELECT 
 			name,
@@ -55,6 +150,106 @@ def get_messages(contact_id):
 	return messages
 
 
+@frappe.whitelist()
+def get_message_changes(contact_id, cursor=None, limit=SYNC_PAGE_SIZE, deleted_cursor=None):
+	"""Get messages inserted, updated or deleted for a contact since ``cursor``.
+
+	Inserts come back as full rows, status changes as ``[name, status]``
+	pairs and deletions as names since ``deleted_cursor``. Call again with
+	the returned cursors while ``has_more`` is set.
+	"""
+	if not frappe.db.exists("WhatsApp Contact", contact_id):
+		frappe.throw(_("Contact not found"))
+
+	limit = min(cint(limit) or SYNC_PAGE_SIZE, SYNC_PAGE_SIZE)
+	modified, name = parse_cursor(cursor)
+	since = get_datetime(modified)
+
+	rows = frappe.db.sql("""
+		SELECT
+			name,
+			type,
+			message,
+			message_type,
+			content_type,
+			attach,
+			creation,
+			modified,
+			status
+		FROM `tabWhatsApp Message`
+		WHERE whatsapp_contact = %(contact)s
+			AND (modified > %(modified)s OR (modified = %(modified)s AND name > %(name)s))
+		ORDER BY modified ASC, name ASC
+		LIMIT %(limit)s
+	""", {"contact": contact_id, "modified": modified, "name": name, "limit": limit}, as_dict=True)
+
+	inserts, updates = [], []
+	for row in rows:
+		if not cursor or row.creation > since:
+			inserts.append(row)
+		else:
+			updates.append([row.name, row.status])
+
+	deleted = get_deleted(["WhatsApp Message"], deleted_cursor, limit, match={"whatsapp_contact": contact_id})
+
+	return {
+		"cursor": make_cursor(rows[-1].modified, rows[-1].name) if rows else cursor,
+		"inserts": inserts,
+		"updates": updates,
+		"deleted": deleted["names"],
+		"deleted_cursor": deleted["cursor"],
+		"has_more": len(rows) == limit or deleted["has_more"],
+	}
+
+
+@frappe.whitelist()
+def get_contact_changes(cursor=None, limit=SYNC_PAGE_SIZE, deleted_cursor=None):
+	"""Get inbox rows changed since ``cursor``, in the same shape as get_contacts,
+	and the names of contacts deleted since ``deleted_cursor``.
+
+	Without a cursor only the ``INITIAL_CONTACTS`` most recent conversations are
+	returned, with ``has_older`` set when get_contacts has more to page in.
+	"""
+	limit = min(cint(limit) or SYNC_PAGE_SIZE, SYNC_PAGE_SIZE)
+	deleted = get_deleted(["WhatsApp Contact", "WhatsApp Conversation"], deleted_cursor, limit)
+
+	if not cursor:
+		# taken first, so anything changing while the page is read comes with the next delta
+		latest = frappe.db.sql("""
+			SELECT modified, name FROM `tabWhatsApp Conversation`
+			ORDER BY modified DESC, name DESC
+			LIMIT 1
+		""", as_dict=True)
+		contacts = get_contact_list(start=0, page_length=INITIAL_CONTACTS)
+		return {
+			"cursor": make_cursor(latest[0].modified, latest[0].name) if latest else None,
+			"contacts": contacts,
+			"deleted": [],
+			"deleted_cursor": deleted["cursor"],
+			"has_more": False,
+			"has_older": len(contacts) == INITIAL_CONTACTS,
+		}
+
+	modified, name = parse_cursor(cursor)
+
+	rows = frappe.db.sql(f"""
+		SELECT {CONTACT_FIELDS}, c.modified
+		FROM `tabWhatsApp Conversation` c
+		INNER JOIN `tabWhatsApp Contact` wc ON wc.name = c.whatsapp_contact
+		WHERE c.modified > %(modified)s OR (c.modified = %(modified)s AND c.name > %(name)s)
+		ORDER BY c.modified ASC, c.name ASC
+		LIMIT %(limit)s
+	""", {"modified": modified, "name": name, "limit": limit}, as_dict=True)
+
+	return {
+		"cursor": make_cursor(rows[-1].modified, rows[-1].name) if rows else cursor,
+		"contacts": rows,
+		"deleted": deleted["names"],
+		"deleted_cursor": deleted["cursor"],
+		"has_more": len(rows) == limit or deleted["has_more"],
+	}
+
+
 @frappe.whitelist()
 def send_message(contact_id, message=None, file_url=None):
 	"""Send a WhatsApp message to a contact."""
@@ -126,18 +321,8 @@ def mark_as_read(contact_id):
 	"""Mark all messages from a contact as read."""
 	
 	try:
-		# Use set_value to avoid TimestampMismatchError during high concurrency
-		# update_modified=False preserves the last modified timestamp to avoid conflicts with other updates
-		frappe.db.set_value("WhatsApp Contact", contact_id, {"unread_count": 0, "is_read": 1}, update_modified=False)
-		
-		# Mark all unread messages as read
-		frappe.db.sql("""
-			UPDATE `tabWhatsApp Message`
-			SET status = 'Read'
-			WHERE whatsapp_contact = %s
-			AND type = 'Incoming'
-			AND status != 'Read'
-		""", contact_id)
+		# Clears the conversation's unread count and marks incoming messages read
+		mark_read(contact_id)
 		
 		frappe.db.commit()
 		return {"success": True}
@@ -152,16 +337,17 @@ def search_contacts(query):
 	
 	contacts = frappe.db.sql("""
 		SELECT 
-			name,
-			mobile_no,
-			contact_name,
-			last_message,
-			last_message_date,
-			unread_count
-		FROM `tabWhatsApp Contact`
-		WHERE contact_name LIKE %s 
-			OR mobile_no LIKE %s
-		ORDER BY last_message_date DESC
+			wc.name,
+			wc.mobile_no,
+			wc.contact_name,
+			c.last_message_preview AS last_message,
+			c.last_message_time AS last_message_date,
+			IFNULL(c.unread_count, 0) AS unread_count
+		FROM `tabWhatsApp Contact` wc
+		LEFT JOIN `tabWhatsApp Conversation` c ON c.name = wc.name
+		WHERE wc.contact_name LIKE %s 
+			OR wc.mobile_no LIKE %s
+		ORDER BY c.last_message_time DESC
 		LIMIT 50
 	""", (f"%{query}%", f"%{query}%"), as_dict=True)
 	
@@ -17,9 +17,14 @@ def create(contact_name, mobile_no, email):
 @frappe.whitelist()
 def get(email):
     """Get all contacts assigned to email."""
-    return frappe.db.get_all(
-        "WhatsApp Contact",
-        filters={"email": ['in', [email, '']]},
-        fields=["*"])
-    return data
+    return frappe.db.sql("""
+        SELECT wc.*,
+            c.last_message_preview AS last_message,
+            c.last_message_time AS last_message_date,
+            IFNULL(c.unread_count, 0) AS unread_count,
+            IF(IFNULL(c.unread_count, 0) = 0, 1, 0) AS is_read
+        FROM `tabWhatsApp Contact` wc
+        LEFT JOIN `tabWhatsApp Conversation` c ON c.name = wc.name
+        WHERE IFNULL(wc.email, '') IN (%(email)s, '')
+    """, {"email": email}, as_dict=True)
 
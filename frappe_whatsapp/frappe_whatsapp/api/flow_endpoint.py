@@ -4,8 +4,23 @@
 import json
 import hashlib
 import hmac
+import random
+import time
 import frappe
 from frappe import _
+from werkzeug.wrappers import Response
+
+from frappe_whatsapp.utils.flow_crypto import (
+    FlowDecryptionError,
+    decrypt_request,
+    encrypt_response,
+    get_private_key,
+    is_encrypted,
+)
+from frappe_whatsapp.utils.flow_session import update_session
+
+# Meta allows 10 seconds; slower requests than this are always logged
+LATENCY_BUDGET = 1.0
 
 
 @frappe.whitelist(allow_guest=True)
@@ -14,7 +29,8 @@ def handle_flow_request():
     Handle WhatsApp Flow data exchange requests.
 
     This endpoint receives requests from WhatsApp when a flow needs data
-    or when a user completes a flow.
+    or when a user completes a flow. Encrypted requests are answered with
+    an encrypted response, plaintext ones with JSON.
 
     Endpoint URL to configure in Meta:
     https://your-site.com/api/method/frappe_whatsapp.frappe_whatsapp.api.flow_endpoint.handle_flow_request
@@ -31,51 +47,108 @@ def handle_flow_request():
         if not data:
             frappe.throw(_("No data received"))
 
-        # Log the request for debugging
+        if is_encrypted(data):
+            return handle_encrypted_request(data)
+
+        log_request(data)
+        return dispatch(data)
+
+    except Exception as e:
+        frappe.log_error(f"Flow endpoint error: {str(e)}", "WhatsApp Flow Error")
+        return {
+            "data": {
+                "error": str(e)
+            }
+        }
+
+
+def handle_encrypted_request(data):
+    """Decrypt, dispatch and encrypt a request, timing each step."""
+    started = time.perf_counter()
+    try:
+        payload, cipher, iv = decrypt_request(data, get_private_key())
+    except FlowDecryptionError as e:
+        frappe.log_error(f"Flow decryption failed: {str(e)}", "WhatsApp Flow Error")
+        # tells the client to refresh the public key and retry
+        return Response(status=421)
+    decrypted = time.perf_counter()
+
+    log_request(payload)
+    try:
+        response = dispatch(payload)
+    except Exception as e:
+        frappe.log_error(f"Flow endpoint error: {str(e)}", "WhatsApp Flow Error")
+        response = {"data": {"error": str(e)}}
+    handled = time.perf_counter()
+
+    body = encrypt_response(response, cipher, iv)
+    finished = time.perf_counter()
+
+    timings = {
+        "decrypt": decrypted - started,
+        "handler": handled - decrypted,
+        "encrypt": finished - handled,
+    }
+    if finished - started > LATENCY_BUDGET:
         frappe.log_error(
-            f"WhatsApp Flow Request:\n{json.dumps(data, indent=2)}",
-            "WhatsApp Flow Endpoint"
+            f"Action: {payload.get('action')}\nTimings: {json.dumps(timings)}",
+            "WhatsApp Flow Endpoint Slow"
         )
 
-        # Get action type
-        action = data.get("action")
+    return Response(
+        body,
+        status=200,
+        mimetype="text/plain",
+        headers={"Server-Timing": get_server_timing(timings)},
+    )
 
-        if action == "ping":
-            # Health check
-            return {
-                "data": {
-                    "status": "active"
-                }
-            }
 
-        if action == "INIT":
-            # Initial data request when flow opens
-            flow_token = data.get("flow_token")
-            screen_id = data.get("screen")
+def get_server_timing(timings):
+    return ", ".join(f"{name};dur={duration * 1000:.2f}" for name, duration in timings.items())
 
-            return handle_init(flow_token, screen_id, data)
 
-        if action == "data_exchange":
-            # Data exchange during flow navigation
-            return handle_data_exchange(data)
+def log_request(data):
+    """Log a sample of requests for debugging."""
+    if random.random() < get_log_sample_rate():
+        frappe.log_error(
+            f"WhatsApp Flow Request:\n{json.dumps(data, indent=2)}",
+            "WhatsApp Flow Endpoint"
+        )
 
-        if action == "BACK":
-            # User pressed back button
-            return handle_back(data)
 
-        # Default response
-        return {
-            "data": {}
-        }
+def dispatch(data):
+    """Route a decrypted flow request to its handler."""
+    # Get action type
+    action = data.get("action")
 
-    except Exception as e:
-        frappe.log_error(f"Flow endpoint error: {str(e)}", "WhatsApp Flow Error")
+    if action == "ping":
+        # Health check
         return {
             "data": {
-                "error": str(e)
+                "status": "active"
             }
         }
 
+    if action == "INIT":
+        # Initial data request when flow opens
+        flow_token = data.get("flow_token")
+        screen_id = data.get("screen")
+
+        return handle_init(flow_token, screen_id, data)
+
+    if action == "data_exchange":
+        # Data exchange during flow navigation
+        return handle_data_exchange(data)
+
+    if action == "BACK":
+        # User pressed back button
+        return handle_back(data)
+
+    # Default response
+    return {
+        "data": {}
+    }
+
 
 def handle_init(flow_token, screen_id, data):
     """Handle initial flow request."""
@@ -115,28 +188,22 @@ def handle_back(data):
 
 
 def save_flow_data(flow_token, screen, form_data):
-    """Save flow data for later processing."""
+    """Merge screen data into the flow session.
+
+    Sessions live in Redis and are written to WhatsApp Flow Data once, when
+    the flow completes or expires.
+    """
     try:
-        # Create or update a record to store flow data
-        existing = frappe.db.exists("WhatsApp Flow Data", {"flow_token": flow_token})
-
-        if existing:
-            doc = frappe.get_doc("WhatsApp Flow Data", existing)
-            current_data = json.loads(doc.data or "{}")
-            current_data.update(form_data)
-            doc.data = json.dumps(current_data)
-            doc.last_screen = screen
-            doc.save(ignore_permissions=True)
-        else:
-            # If WhatsApp Flow Data doctype doesn't exist, just log
-            frappe.log_error(
-                f"Flow Token: {flow_token}\nScreen: {screen}\nData: {json.dumps(form_data)}",
-                "WhatsApp Flow Data"
-            )
+        update_session(flow_token, screen, form_data)
     except Exception as e:
         frappe.log_error(f"save_flow_data error: {str(e)}")
 
 
+def get_log_sample_rate():
+    """Share of flow requests to log, set with ``whatsapp_flow_log_sample_rate``."""
+    return float(frappe.conf.get("whatsapp_flow_log_sample_rate", 0.01))
+
+
 def verify_signature(payload, signature, app_secret):
     """Verify the request signature from WhatsApp."""
     expected_signature = hmac.new(
@@ -1,6 +1,9 @@
 import frappe
 import mimetypes
 
+from frappe_whatsapp.utils.conversation import mark_read
+from frappe_whatsapp.utils.read_receipt import enqueue_read_receipts
+
 
 
 @frappe.whitelist()
@@ -132,58 +135,23 @@ def get_messages_by_phone(mobile_no):
 def mark_as_read(room):
     """Mark messages as read in local DB and optionally send read receipts to WhatsApp."""
     try:
-        # Update local contact status
-        frappe.db.set_value("WhatsApp Contact", room, "is_read", 1, update_modified=False)
-        frappe.db.commit()
+        # Update local conversation state
+        mark_read(room)
 
-        # Send read receipts to WhatsApp if enabled
+        # Send read receipts to WhatsApp if enabled; queued on the commit below,
+        # which a GET request wouldn't otherwise make
         send_whatsapp_read_receipts(room)
+        frappe.db.commit()
     except Exception:
         pass  # Ignore concurrent update errors
     return "ok"
 
 
 def send_whatsapp_read_receipts(room):
-    """Send read receipts to WhatsApp for unread incoming messages."""
+    """Queue read receipts to WhatsApp for unread incoming messages."""
     try:
-        # Get the contact's mobile number
-        contact = frappe.get_doc("WhatsApp Contact", room)
-        if not contact.mobile_no:
-            return
-
-        # Find unread incoming messages for this contact
-        unread_messages = frappe.get_all(
-            "WhatsApp Message",
-            filters={
-                "from": contact.mobile_no,
-                "type": "Incoming",
-                "status": ["not in", ["marked as read"]]
-            },
-            fields=["name", "whatsapp_account"],
-            order_by="creation desc",
-            limit=10
-        )
-
-        if not unread_messages:
-            return
-
-        # Check if auto read receipt is enabled for the account
-        for msg in unread_messages:
-            if not msg.whatsapp_account:
-                continue
-
-            allow_auto_read = frappe.db.get_value(
-                "WhatsApp Account",
-                msg.whatsapp_account,
-                "allow_auto_read_receipt"
-            )
-
-            if allow_auto_read:
-                try:
-                    msg_doc = frappe.get_doc("WhatsApp Message", msg.name)
-                    msg_doc.send_read_receipt()
-                except Exception as e:
-                    frappe.log_error(f"Failed to send read receipt for {msg.name}: {str(e)}", "WhatsApp Chat Read Receipt")
+        mobile_no = frappe.db.get_value("WhatsApp Contact", room, "mobile_no")
+        enqueue_read_receipts(mobile_no)
     except Exception as e:
         frappe.log_error(f"send_whatsapp_read_receipts error: {str(e)}", "WhatsApp Chat Read Receipt")
 
@@ -229,31 +197,23 @@ def last_message(doc, method):
         mobile_no = doc.get("from")
 
 
-    contact_name = frappe.db.get_value("WhatsApp Contact", filters={"mobile_no": mobile_no})
-    # If Outgoing (User sent it), mark as read (1). If Incoming, mark as unread (0)
-    is_read = 1 if doc.type == 'Outgoing' else 0
+    contact_name = doc.whatsapp_contact or frappe.db.get_value("WhatsApp Contact", filters={"mobile_no": mobile_no})
 
+    # Inbox state (last message, unread count) is kept in WhatsApp Conversation
+    # by frappe_whatsapp.utils.conversation; only make sure the contact exists.
     if contact_name:
-        # Use set_value to avoid TimestampMismatchError
-        frappe.db.set_value("WhatsApp Contact", contact_name, {
-            "last_message": doc.message,
-            "is_read": is_read,
-            "last_message_date": frappe.utils.now()
-        }, update_modified=False)
-        
-        # Reload doc to get latest state for valid check
-        chat_doc = frappe.get_doc("WhatsApp Contact", contact_name)
+        chat_doc = frappe.db.get_value("WhatsApp Contact", contact_name, ["name", "contact_name"], as_dict=True)
     else:
         chat_doc = frappe.get_doc({
             "doctype": "WhatsApp Contact",
             "mobile_no": mobile_no,
-            "last_message": doc.message,
             "contact_name": mobile_no,
-            "is_read": is_read,
+            "whatsapp_account": doc.whatsapp_account,
             "first_message_date": frappe.utils.now(),
             "last_message_date": frappe.utils.now()
         })
         chat_doc.save(ignore_permissions=True)
+        doc.db_set("whatsapp_contact", chat_doc.name, update_modified=False)
 
     # Publish real-time update
     if doc.type != 'Outgoing':
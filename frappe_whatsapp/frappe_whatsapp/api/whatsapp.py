@@ -5,6 +5,8 @@ to get WhatsApp messages for Leads/Deals.
 """
 import frappe
 
+from frappe_whatsapp.utils.etag import conditional_response
+
 
 @frappe.whitelist()
 def get_whatsapp_messages(reference_doctype=None, reference_name=None, mobile_no=None):
@@ -100,7 +102,23 @@ def get_whatsapp_messages(reference_doctype=None, reference_name=None, mobile_no
         values["wa_contact"] = whatsapp_contact_id
     
     where_clause = " OR ".join(conditions)
-    
+
+    # Cheap version token so repeated polls from the CRM panel get a 304
+    version = frappe.db.sql(f"""
+        SELECT MAX(modified), COUNT(*)
+        FROM `tabWhatsApp Message`
+        WHERE {where_clause}
+    """, values)[0]
+
+    return conditional_response(
+        ["get_whatsapp_messages", sorted(all_variants), whatsapp_contact_id],
+        version,
+        lambda: get_message_list(where_clause, values),
+    )
+
+
+def get_message_list(where_clause, values):
+    """Messages matching ``where_clause``, oldest first."""
     # Query messages with DISTINCT to avoid duplicates
     messages = frappe.db.sql(f"""
         SELECT DISTINCT
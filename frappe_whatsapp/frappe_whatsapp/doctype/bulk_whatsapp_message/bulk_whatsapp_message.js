@@ -39,6 +39,41 @@ frappe.ui.form.on('Bulk WhatsApp Message', {
                 });
             });
             
+            // Campaign controls, applied by the sending job between chunks
+            let set_campaign_status = function(method) {
+                frappe.call({
+                    method: 'frappe_whatsapp.utils.bulk_messaging.' + method,
+                    args: {
+                        name: frm.doc.name
+                    },
+                    callback: function(r) {
+                        if(r.message) {
+                            frm.reload_doc();
+                        }
+                    }
+                });
+            };
+
+            if(['Queued', 'In Progress'].includes(frm.doc.status)) {
+                frm.add_custom_button(__('Pause'), function() {
+                    set_campaign_status('pause_campaign');
+                }, __('Campaign'));
+            }
+
+            if(frm.doc.status == 'Paused') {
+                frm.add_custom_button(__('Resume'), function() {
+                    set_campaign_status('resume_campaign');
+                }, __('Campaign'));
+            }
+
+            if(['Queued', 'In Progress', 'Paused'].includes(frm.doc.status)) {
+                frm.add_custom_button(__('Cancel Sending'), function() {
+                    frappe.confirm(__('Stop sending to the remaining recipients?'), function() {
+                        set_campaign_status('cancel_campaign');
+                    });
+                }, __('Campaign'));
+            }
+
             // Add retry button
             frm.add_custom_button(__('Retry Failed Messages'), function() {
                 frappe.call({
@@ -8,6 +8,10 @@ from frappe.utils import cint, get_datetime, now
 from frappe.model.document import Document
 from frappe.model.naming import make_autoname
 
+from frappe_whatsapp.utils.campaign import RETRY_FIELDS, is_running, queue_retries, start_campaign
+from frappe_whatsapp.utils.idempotency import claim, get_sent_message, make_idempotency_key, release
+from frappe_whatsapp.utils.template_payload import get_compiled_template
+
 # Add these files to your frappe_whatsapp app
 
 # 1. First, create a new DocType for Bulk WhatsApp Messaging
@@ -50,7 +54,7 @@ class BulkWhatsAppMessage(Document):
         
         # If recipient list is provided, count recipients
         if self.recipient_type == 'Recipient List' and self.recipient_list:
-            recipient_count = frappe.db.count("WhatsApp Recipient", {"parent": self.recipient_list})
+            recipient_count = frappe.db.count("WhatsApp List Recipient", {"recipient_list": self.recipient_list})
             if recipient_count == 0:
                 frappe.throw(_("Selected recipient list has no recipients"))
             self.recipient_count = recipient_count
@@ -63,7 +67,7 @@ class BulkWhatsAppMessage(Document):
         if not self.template:
             frappe.throw(_("Please select a template"))
         
-        template_doc = frappe.get_doc("WhatsApp Templates", self.template)
+        template_doc = get_compiled_template(self.template)
         
         # Validate template is approved
         if template_doc.status != "APPROVED":
@@ -71,15 +75,15 @@ class BulkWhatsAppMessage(Document):
         
         # Validate header/attachment requirements
         if template_doc.header_type in ["IMAGE", "VIDEO", "DOCUMENT"]:
-            if not self.attach and not template_doc.sample:
+            if not self.attach and not template_doc.has_sample:
                 frappe.throw(_(f"This template requires a {template_doc.header_type.lower()} attachment. Please upload one."))
         
         # Check if template needs variables
-        if not template_doc.sample_values:
+        if not template_doc.variable_count:
             return  # No variables needed
         
         # Get expected number of variables
-        expected_count = len(template_doc.sample_values.split(","))
+        expected_count = template_doc.variable_count
         
         if self.variable_type:  # Checked = Use template values
             # Convert table to JSON format for processing
@@ -129,40 +133,44 @@ class BulkWhatsAppMessage(Document):
     def on_submit(self):
         self.db_set("status", "Queued")
         self.queue_messages()
-    
+
+    def on_cancel(self):
+        if self.status in ("Queued", "In Progress", "Paused"):
+            self.db_set("status", "Cancelled")
+
     def queue_messages(self):
-        """Queue messages for sending"""
-        if self.recipient_type == 'Recipient List' and self.recipient_list:
-            # Fetch recipients from the recipient list
-            recipients = frappe.get_all(
-                "WhatsApp Recipient", 
-                filters={"parent": self.recipient_list},
-                fields=["mobile_number", "name", "recipient_name", "recipient_data"]
-            )
-            
-            for recipient in recipients:
-                frappe.enqueue_doc(
-                    self.doctype, self.name,
-                    "create_single_message",
-                    "long", 4000,
-                    recipient=recipient
-                )
-        else:
-            # Use recipients from the current document
-            for recipient in self.recipients:
-                frappe.enqueue_doc(
-                    self.doctype, self.name,
-                    "create_single_message",
-                    "long", 4000,
-                    recipient=recipient
-                )
-    
+        """Start sending from the last recipient sent, a chunk per background job"""
+        start_campaign(self.name)
+
+    def set_campaign_status(self, status, allowed_from):
+        self.check_permission("submit")
+        if self.docstatus != 1 or self.status not in allowed_from:
+            frappe.throw(_("Cannot change a {0} campaign to {1}").format(_(self.status), _(status)))
+        self.db_set("status", status)
+
+    def pause(self):
+        """Stop sending after the current chunk"""
+        self.set_campaign_status("Paused", ("Queued", "In Progress"))
+
+    def resume(self):
+        self.set_campaign_status("Queued", ("Paused",))
+        self.queue_messages()
+
+    def cancel_campaign(self):
+        """Stop sending for good; recipients after the last one sent are skipped"""
+        self.set_campaign_status("Cancelled", ("Queued", "In Progress", "Paused"))
+
     def create_single_message(self, recipient):
         """Create a single message in the queue"""
         # message_content = self.message_content
-        
+
+        # RQ retries and re-queued campaigns must not message a recipient twice
+        idempotency_key = make_idempotency_key(
+            self.doctype, self.name, recipient.get("name") or recipient.get("mobile_number")
+        )
+
         # Replace variables in the message if any
-        self.status == "In Progress"
+        variables = {}
         if recipient.get("recipient_data"):
             try:
                 variables = json.loads(recipient.get("recipient_data", "{}"))
@@ -179,7 +187,7 @@ class BulkWhatsAppMessage(Document):
         wa_message.message_type = "Text"
         wa_message.content_type = "text"  # Required for non-template messages
         # wa_message.message = message_content
-        wa_message.flags.custom_ref_doc = json.loads(recipient.get("recipient_data", "{}"))
+        wa_message.flags.custom_ref_doc = variables
         wa_message.bulk_message_reference = self.name
         if self.whatsapp_account:
             wa_message.whatsapp_account = self.whatsapp_account
@@ -200,41 +208,88 @@ class BulkWhatsAppMessage(Document):
             if self.attach:
                 wa_message.attach = self.attach
         
+        if self.send_message(wa_message, idempotency_key) is not None:
+            # Update message count; the campaign status is set when its last chunk is done
+            self.db_set("sent_count", cint(self.sent_count) + 1, update_modified=False)
+
+    def send_message(self, wa_message, idempotency_key):
+        """Insert (and so send) a message once per key. A failed send is kept as a
+        Failed message with its error code, to be retried later."""
+        existing = get_sent_message(idempotency_key)
+        if existing:
+            return
+        if not claim(idempotency_key):
+            return
+
         # Set status to queued (will be updated when sent)
         wa_message.status = "Queued"
+        wa_message.idempotency_key = idempotency_key
         try:
             wa_message.insert(ignore_permissions=True)
             frappe.db.commit()  # Commit immediately to ensure message is created
         except Exception as e:
+            release(idempotency_key)
             frappe.log_error(
-                title=f"Bulk Message Failed: {recipient.get('mobile_number')}",
-                message=f"Bulk Message: {self.name}\nRecipient: {recipient.get('mobile_number')}\nError: {str(e)}"
+                title=f"Bulk Message Failed: {wa_message.to}",
+                message=f"Bulk Message: {self.name}\nRecipient: {wa_message.to}\nError: {str(e)}"
             )
-            self.db_set("status", "Partially Failed")
-        # Update message count
-        self.db_set("sent_count", cint(self.sent_count) + 1)
-        if self.recipient_count == self.sent_count:
-            self.db_set("status", "Completed")
+            if wa_message.message_id:
+                # sent, a later hook failed; retrying would message the recipient twice
+                return wa_message.message_id
+
+            self.insert_failed_message(wa_message)
+        return wa_message.name
+
+    def insert_failed_message(self, wa_message):
+        # saved without hooks, which would try to send again
+        wa_message.status = "Failed"
+        wa_message.idempotency_key = None
+        wa_message.set_user_and_timestamp()
+        wa_message.db_insert()
+        frappe.db.commit()
+
+    def record_failed_recipient(self, recipient):
+        """Keep a recipient whose message could not even be built as a Failed message"""
+        wa_message = frappe.new_doc("WhatsApp Message")
+        wa_message.to = recipient.get("mobile_number")
+        wa_message.type = "Outgoing"
+        wa_message.message_type = "Template" if self.use_template else "Text"
+        wa_message.content_type = "text"
+        wa_message.use_template = self.use_template
+        wa_message.template = self.template
+        wa_message.bulk_message_reference = self.name
+        wa_message.whatsapp_account = self.whatsapp_account
+        self.insert_failed_message(wa_message)
+        self.db_set("sent_count", cint(self.sent_count) + 1, update_modified=False)
+
+    def retry_message(self, failed):
+        """Send a failed message of this campaign again"""
+        wa_message = frappe.new_doc("WhatsApp Message")
+        for field in RETRY_FIELDS:
+            wa_message.set(field, failed.get(field))
+        wa_message.bulk_message_reference = self.name
+
+        # a failed message is retried at most once, even if this job is re-run
+        self.send_message(wa_message, make_idempotency_key(self.doctype, self.name, "retry", failed.name))
+        frappe.db.set_value("WhatsApp Message", failed.name, "status", "Retried", update_modified=False)
+        frappe.db.commit()
+
+    def retry_failed(self, error_codes=None):
+        """Queue failed messages to be sent again by the campaign's sending job.
+        Messages that failed with a permanent error, such as an invalid number,
+        are skipped; pass ``error_codes`` to retry only those errors."""
+        if self.docstatus != 1 or self.status == "Cancelled":
+            frappe.throw(_("Only submitted campaigns that are not cancelled can be retried"))
+
+        count = queue_retries(self.name, error_codes)
+        if count and self.status in ("Completed", "Partially Failed"):
+            self.db_set("status", "Queued")
+            self.queue_messages()
+        elif count and self.status in ("Queued", "In Progress") and not is_running(self.name):
+            self.queue_messages()
 
-    def retry_failed(self):
-        """Retry failed messages"""
-        failed_messages = frappe.get_all(
-            "WhatsApp Message",
-            filters={
-                "bulk_message_reference": self.name,
-                "status": "Failed"
-            },
-            fields=["name"]
-        )
-        
-        count = 0
-        for msg in failed_messages:
-            message_doc = frappe.get_doc("WhatsApp Message", msg.name)
-            message_doc.status = "Queued"
-            message_doc.save(ignore_permissions=True)
-            count += 1
-        
         frappe.msgprint(_("{0} messages have been requeued for sending").format(count))
+        return count
         
     def get_progress(self):
         """Get sending progress for this bulk message"""
@@ -249,7 +304,7 @@ class BulkWhatsAppMessage(Document):
         })
         queued = frappe.db.count("WhatsApp Message", {
             "bulk_message_reference": self.name,
-            "status": "Queued"
+            "status": ["in", ["Queued", "Retrying"]]
         })
         
         return {
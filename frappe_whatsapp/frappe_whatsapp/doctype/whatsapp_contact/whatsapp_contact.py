@@ -5,6 +5,14 @@ import frappe
 from frappe.model.document import Document
 import re
 
+from frappe_whatsapp.utils.conversation import (
+	ensure_conversation,
+	mark_read,
+	remove_conversation,
+	set_assignee,
+	touch_conversation,
+)
+
 
 class WhatsAppContact(Document):
 	def autoname(self):
@@ -19,6 +27,21 @@ class WhatsAppContact(Document):
 			if match and not self.country_code:
 				self.country_code = match.group(1)
 	
+	def after_insert(self):
+		"""Make the contact visible in the inbox."""
+		ensure_conversation(self)
+
+	def on_update(self):
+		"""Follow assignment changes in the inbox and send edits to chat clients."""
+		if self.has_value_changed("email"):
+			set_assignee(self.name, self.email)
+		# contact fields are synced with the conversation's modified
+		touch_conversation(self.name)
+
+	def on_trash(self):
+		"""Remove the contact from the inbox."""
+		remove_conversation(self.name)
+
 	def before_save(self):
 		"""Update conversion tracking."""
 		if self.converted_to_lead and not self.converted_date:
@@ -57,8 +80,8 @@ class WhatsAppContact(Document):
 	@frappe.whitelist()
 	def mark_as_read(self):
 		"""Reset unread count."""
-		self.unread_count = 0
-		self.save(ignore_permissions=True)
+		mark_read(self.name)
+		self.db_set({"unread_count": 0, "is_read": 1}, update_modified=False)
 		frappe.msgprint("Marked as read")
 	
 	@frappe.whitelist()
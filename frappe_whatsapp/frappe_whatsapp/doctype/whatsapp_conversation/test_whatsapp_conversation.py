@@ -0,0 +1,8 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+
+class TestWhatsAppConversation(FrappeTestCase):
+	pass
@@ -0,0 +1,20 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppConversation(Document):
+	"""Inbox state for a WhatsApp Contact.
+
+	Rows are written only by ``frappe_whatsapp.utils.conversation``.
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Conversation", ["last_message_time"])
+	frappe.db.add_index("WhatsApp Conversation", ["modified"])
+	frappe.db.add_index("WhatsApp Conversation", ["whatsapp_account", "last_message_time"])
+	frappe.db.add_index("WhatsApp Conversation", ["assigned_to", "last_message_time"])
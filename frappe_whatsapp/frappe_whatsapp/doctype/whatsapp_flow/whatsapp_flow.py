@@ -1,17 +1,35 @@
 # Copyright (c) 2025, Shridhar Patil and contributors
 # For license information, please see license.txt
 
+import hashlib
 import json
+import textwrap
+import time
 import frappe
 from frappe import _
 from frappe.model.document import Document
 from frappe.integrations.utils import make_post_request, make_request
 
+# Components that only display content; they are not part of the form payload
+DISPLAY_FIELD_TYPES = (
+    "TextHeading", "TextSubheading", "TextBody",
+    "TextCaption", "Image", "EmbeddedLink", "Footer"
+)
+SCREEN_FIELDS = ("screen_id", "screen_title", "terminal", "refresh_on_back")
+FIELD_FIELDS = (
+    "field_type", "field_name", "label", "required", "helper_text",
+    "init_value", "min_chars", "max_chars", "error_message", "options"
+)
+SCREEN_CACHE_PREFIX = "whatsapp_flow_screen"
+SCREEN_CACHE_TTL = 24 * 60 * 60
+# bump when the generated screen JSON changes, so cached screens are rebuilt
+SCREEN_CACHE_VERSION = 1
+
 
 class WhatsAppFlow(Document):
     def before_save(self):
         """Generate flow JSON before saving."""
-        self.flow_json = json.dumps(self.generate_flow_json(), indent=2)
+        self.flow_json = self.render_flow_json()
 
     def validate(self):
         """Validate flow configuration."""
@@ -44,60 +62,87 @@ class WhatsAppFlow(Document):
         """
         flow = {
             "version": self.data_api_version or "6.0",
-            "screens": []
+            "screens": [
+                self.build_screen(screen, context)
+                for screen, context in self.get_screen_contexts()
+            ]
         }
 
-        # Build a map of which fields are passed to each screen from previous screens
-        screen_incoming_data = self.build_screen_data_map()
-
-        for screen in self.screens:
-            screen_data = self.build_screen(screen, screen_incoming_data.get(screen.screen_id, {}))
-            flow["screens"].append(screen_data)
-
         # Note: We intentionally do NOT include 'routing_model' or 'data_api_version'
         # This creates a client-only flow that doesn't require an endpoint
         # Data is returned via webhook (nfm_reply) when the flow completes
 
         return flow
 
-    def build_screen_data_map(self):
-        """Build a map of fields passed to each screen from previous screens.
+    def render_flow_json(self, use_cache=True):
+        """Flow JSON as indented text, the same as ``json.dumps(generate_flow_json(), indent=2)``.
 
-        Returns:
-            dict: {screen_id: {field_name: {"type": "string", "__example__": ""}}}
+        Each screen is rendered on its own and cached under a hash of everything
+        it depends on, so saving a large flow only rebuilds the screens that changed.
         """
-        screen_data_map = {}
-        accumulated_fields = {}  # Fields accumulated from all previous screens
+        fragments = []
+        for screen, context in self.get_screen_contexts():
+            key = get_screen_key(screen, context)
+            fragment = frappe.cache().get_value(key) if use_cache else None
+            if fragment is None:
+                fragment = textwrap.indent(
+                    json.dumps(self.build_screen(screen, context), indent=2), " " * 4
+                )
+                if use_cache:
+                    frappe.cache().set_value(key, fragment, expires_in_sec=SCREEN_CACHE_TTL)
+            fragments.append(fragment)
+
+        version = self.data_api_version or "6.0"
+        if not fragments:
+            return json.dumps({"version": version, "screens": []}, indent=2)
+        return (
+            f'{{\n  "version": {json.dumps(version)},\n  "screens": [\n'
+            + ",\n".join(fragments)
+            + "\n  ]\n}"
+        )
+
+    def get_fields_by_screen(self):
+        """Enabled fields grouped by screen id, in table order."""
+        fields_by_screen = {}
+        for field in self.fields:
+            if field.enabled:
+                fields_by_screen.setdefault(field.screen, []).append(field)
+        return fields_by_screen
+
+    def get_screen_contexts(self):
+        """Yield each screen with what its JSON depends on, in one pass.
+
+        The context holds the screen's fields, the data declared from previous
+        screens, the footer payload and the next screen.
+        """
+        fields_by_screen = self.get_fields_by_screen()
+        # Fields accumulated from all previous screens, as an ordered set
+        previous_inputs = {}
 
         for i, screen in enumerate(self.screens):
-            # Current screen receives all accumulated fields from previous screens
-            if accumulated_fields:
-                screen_data_map[screen.screen_id] = accumulated_fields.copy()
-
-            # Add this screen's input fields to accumulated fields for next screens
-            for field in self.fields:
-                if field.screen != screen.screen_id:
-                    continue
-                if not field.enabled:
-                    continue
-                # Only input fields (not display components) are passed in payload
-                if field.field_type not in [
-                    "TextHeading", "TextSubheading", "TextBody",
-                    "TextCaption", "Image", "EmbeddedLink", "Footer"
-                ]:
-                    accumulated_fields[field.field_name] = {
-                        "type": "string",
-                        "__example__": ""
-                    }
-
-        return screen_data_map
-
-    def build_screen(self, screen, incoming_data=None):
+            fields = fields_by_screen.get(screen.screen_id, [])
+            inputs = [f.field_name for f in fields if f.field_type not in DISPLAY_FIELD_TYPES]
+
+            payload = {name: "${data." + name + "}" for name in previous_inputs}
+            payload.update({name: "${form." + name + "}" for name in inputs})
+
+            yield screen, frappe._dict(
+                fields=fields,
+                incoming_data={
+                    name: {"type": "string", "__example__": ""} for name in previous_inputs
+                },
+                payload=payload,
+                next_screen=self.screens[i + 1] if i + 1 < len(self.screens) else None,
+            )
+
+            previous_inputs.update(dict.fromkeys(inputs))
+
+    def build_screen(self, screen, context):
         """Build a single screen definition."""
         screen_data = {
             "id": screen.screen_id,
             "title": screen.screen_title,
-            "data": incoming_data or {},
+            "data": context.incoming_data,
             "layout": {
                 "type": "SingleColumnLayout",
                 "children": []
@@ -112,24 +157,18 @@ class WhatsAppFlow(Document):
             screen_data["refresh_on_back"] = True
 
         # Build fields for this screen
-        children = self.build_screen_fields(screen)
+        children = self.build_screen_fields(screen, context)
         screen_data["layout"]["children"] = children
 
         return screen_data
 
-    def build_screen_fields(self, screen):
+    def build_screen_fields(self, screen, context):
         """Build field components for a screen."""
         children = []
         has_footer = False
 
-        # Get fields that belong to this screen from the fields table
-        for field in self.fields:
-            if field.screen != screen.screen_id:
-                continue
-            if not field.enabled:
-                continue
-
-            component = self.build_field_component(field, screen)
+        for field in context.fields:
+            component = self.build_field_component(field, screen, context)
             if component:
                 children.append(component)
                 if field.field_type == "Footer":
@@ -137,7 +176,7 @@ class WhatsAppFlow(Document):
 
         # Always add a Footer if not present (required by WhatsApp)
         if not has_footer:
-            footer_action = self.build_footer_action(None, screen)
+            footer_action = self.build_footer_action(screen, context)
             children.append({
                 "type": "Footer",
                 "label": "Continue" if not screen.terminal else "Complete",
@@ -146,7 +185,7 @@ class WhatsAppFlow(Document):
 
         return children
 
-    def build_field_component(self, field, screen):
+    def build_field_component(self, field, screen, context):
         """Build a single field component."""
         field_type = field.field_type
 
@@ -180,7 +219,7 @@ class WhatsAppFlow(Document):
 
         # Footer (submit button)
         if field_type == "Footer":
-            action = self.build_footer_action(field, screen)
+            action = self.build_footer_action(screen, context)
             return {
                 "type": "Footer",
                 "label": field.label or "Submit",
@@ -226,73 +265,24 @@ class WhatsAppFlow(Document):
 
         return component
 
-    def build_footer_action(self, field, screen):
+    def build_footer_action(self, screen, context):
         """Build the action for a footer button."""
-        if screen.terminal:
+        if screen.terminal or not context.next_screen:
             # Complete the flow
             return {
                 "name": "complete",
-                "payload": self.build_payload(screen)
+                "payload": context.payload
             }
-        else:
-            # Navigate to next screen
-            next_screen = self.get_next_screen(screen)
-            if next_screen:
-                return {
-                    "name": "navigate",
-                    "next": {
-                        "type": "screen",
-                        "name": next_screen.screen_id
-                    },
-                    "payload": self.build_payload(screen)
-                }
-            else:
-                return {
-                    "name": "complete",
-                    "payload": self.build_payload(screen)
-                }
 
-    def build_payload(self, screen):
-        """Build payload with all field values up to and including this screen."""
-        payload = {}
-
-        # Include all fields from previous screens (passed via data) as data references
-        found_current = False
-        for s in self.screens:
-            if s.screen_id == screen.screen_id:
-                found_current = True
-                # For current screen, use form references
-                for field in self.fields:
-                    if field.screen != s.screen_id:
-                        continue
-                    if field.enabled and field.field_type not in [
-                        "TextHeading", "TextSubheading", "TextBody",
-                        "TextCaption", "Image", "EmbeddedLink", "Footer"
-                    ]:
-                        payload[field.field_name] = "${form." + field.field_name + "}"
-                break
-            else:
-                # For previous screens, use data references (already passed in)
-                for field in self.fields:
-                    if field.screen != s.screen_id:
-                        continue
-                    if field.enabled and field.field_type not in [
-                        "TextHeading", "TextSubheading", "TextBody",
-                        "TextCaption", "Image", "EmbeddedLink", "Footer"
-                    ]:
-                        payload[field.field_name] = "${data." + field.field_name + "}"
-
-        return payload
-
-    def get_next_screen(self, current_screen):
-        """Get the next screen in sequence."""
-        found_current = False
-        for screen in self.screens:
-            if found_current:
-                return screen
-            if screen.screen_id == current_screen.screen_id:
-                found_current = True
-        return None
+        # Navigate to next screen
+        return {
+            "name": "navigate",
+            "next": {
+                "type": "screen",
+                "name": context.next_screen.screen_id
+            },
+            "payload": context.payload
+        }
 
     def parse_options(self, options_json):
         """Parse options JSON string to list."""
@@ -353,14 +343,14 @@ class WhatsAppFlow(Document):
         url = f"{account.url}/{account.version}/{self.flow_id}/assets"
 
         # Generate fresh flow JSON
-        flow_json = self.generate_flow_json()
+        flow_json = self.render_flow_json()
 
         headers = {
             "Authorization": f"Bearer {token}"
         }
 
         files = {
-            "file": ("flow.json", json.dumps(flow_json), "application/json"),
+            "file": ("flow.json", flow_json, "application/json"),
             "name": (None, "flow.json"),
             "asset_type": (None, "FLOW_JSON")
         }
@@ -676,6 +666,63 @@ class WhatsAppFlow(Document):
             return None
 
 
+def get_screen_key(screen, context):
+    """Cache key of a screen's JSON, from every value the screen is built from."""
+    rows = [
+        SCREEN_CACHE_VERSION,
+        [screen.get(f) for f in SCREEN_FIELDS],
+        [[field.get(f) for f in FIELD_FIELDS] for field in context.fields],
+        list(context.incoming_data),
+        context.payload,
+        context.next_screen.screen_id if context.next_screen else None,
+    ]
+    digest = hashlib.sha1(json.dumps(rows, default=str).encode()).hexdigest()
+    return f"{SCREEN_CACHE_PREFIX}:{digest}"
+
+
+def benchmark_flow_json(screens=50, fields_per_screen=10, iterations=20):
+    """Saves per second of a synthetic flow where one field changes between saves,
+    rebuilding every screen vs only the changed one."""
+    screens, fields_per_screen, iterations = int(screens), int(fields_per_screen), int(iterations)
+    flow = frappe.new_doc("WhatsApp Flow")
+    flow.data_api_version = "7.3"
+    for i in range(screens):
+        flow.append("screens", {
+            "screen_id": f"SCREEN_{i}",
+            "screen_title": f"Screen {i}",
+            "terminal": 1 if i == screens - 1 else 0
+        })
+        flow.append("fields", {
+            "screen": f"SCREEN_{i}", "field_name": f"heading_{i}",
+            "field_type": "TextHeading", "label": f"Step {i}", "enabled": 1
+        })
+        for j in range(fields_per_screen - 1):
+            flow.append("fields", {
+                "screen": f"SCREEN_{i}", "field_name": f"field_{i}_{j}",
+                "field_type": "TextInput", "label": f"Field {j}", "enabled": 1
+            })
+
+    # the last screen changes, as its payload depends on every previous one
+    edited = flow.fields[-1]
+
+    def run(use_cache):
+        start = time.perf_counter()
+        for n in range(iterations):
+            edited.label = f"Field {n}"
+            flow.render_flow_json(use_cache=use_cache)
+        return time.perf_counter() - start
+
+    full = run(use_cache=False)
+    incremental = run(use_cache=True)
+
+    return {
+        "screens": screens,
+        "fields": len(flow.fields),
+        "full_per_sec": round(iterations / full, 1),
+        "incremental_per_sec": round(iterations / incremental, 1),
+    }
+
+
 @frappe.whitelist()
 def get_whatsapp_flows(whatsapp_account):
     """Get list of all flows from WhatsApp Business Account.
@@ -818,94 +865,19 @@ def fetch_flow_json_by_id(whatsapp_account, flow_id):
 def sync_all_flows(whatsapp_account):
     """Sync all flows from WhatsApp Business Account.
 
-    Imports new flows and updates existing ones.
+    Imports new flows and updates changed ones; flows whose content hash
+    matches the last sync are not written.
 
     Args:
         whatsapp_account: Name of WhatsApp Account document
 
     Returns:
-        Dict with counts: imported, updated, skipped
+        Dict with counts: imported, updated, unchanged, skipped
     """
-    account = frappe.get_doc("WhatsApp Account", whatsapp_account)
-    token = account.get_password("token")
-
-    url = f"{account.url}/{account.version}/{account.business_id}/flows?fields=id,name,status,categories"
-
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-
-    result = {"imported": 0, "updated": 0, "skipped": 0}
+    from frappe_whatsapp.utils.flow_sync import sync_flows
 
     try:
-        import requests
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        data = response.json()
-        flows = data.get("data", [])
-
-        for flow in flows:
-            flow_id = flow.get("id")
-            flow_name = flow.get("name")
-
-            # Check if flow exists locally
-            existing = frappe.db.exists("WhatsApp Flow", {"flow_id": flow_id})
-
-            if existing:
-                # Update existing flow
-                try:
-                    flow_doc = frappe.get_doc("WhatsApp Flow", existing)
-                    flow_doc.status = flow.get("status", "Draft").title()
-                    if flow.get("categories"):
-                        flow_doc.category = flow["categories"][0]
-
-                    # Try to fetch flow JSON and update screens/fields
-                    flow_json = fetch_flow_json_by_id(whatsapp_account, flow_id)
-                    if flow_json:
-                        flow_doc.flow_json = json.dumps(flow_json, indent=2)
-                        flow_doc.data_api_version = flow_json.get("version", "6.0")
-
-                        # Clear existing screens and fields, then re-parse
-                        flow_doc.screens = []
-                        flow_doc.fields = []
-                        parse_flow_json_to_screens(flow_doc, flow_json)
-
-                    flow_doc.flags.ignore_validate = True
-                    flow_doc.save(ignore_permissions=True)
-                    result["updated"] += 1
-                except Exception as e:
-                    frappe.log_error(f"Failed to update flow {flow_id}: {str(e)}")
-                    result["skipped"] += 1
-            else:
-                # Import new flow
-                try:
-                    flow_doc = frappe.get_doc({
-                        "doctype": "WhatsApp Flow",
-                        "flow_name": flow_name or f"Flow {flow_id}",
-                        "whatsapp_account": whatsapp_account,
-                        "flow_id": flow_id,
-                        "status": flow.get("status", "Draft").title(),
-                        "category": flow["categories"][0] if flow.get("categories") else "OTHER"
-                    })
-
-                    # Try to fetch and parse flow JSON
-                    flow_json = fetch_flow_json_by_id(whatsapp_account, flow_id)
-                    if flow_json:
-                        flow_doc.flow_json = json.dumps(flow_json, indent=2)
-                        flow_doc.data_api_version = flow_json.get("version", "6.0")
-                        parse_flow_json_to_screens(flow_doc, flow_json)
-
-                    flow_doc.flags.ignore_validate = True
-                    flow_doc.insert(ignore_permissions=True)
-                    result["imported"] += 1
-                except Exception as e:
-                    frappe.log_error(f"Failed to import flow {flow_id}: {str(e)}")
-                    result["skipped"] += 1
-
-        frappe.db.commit()
-        return result
-
+        return sync_flows(whatsapp_account)
     except Exception as e:
         frappe.throw(_("Failed to sync flows: {0}").format(str(e)))
 
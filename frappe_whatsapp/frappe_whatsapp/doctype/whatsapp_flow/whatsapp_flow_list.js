@@ -25,8 +25,8 @@ frappe.listview_settings["WhatsApp Flow"] = {
                         if (r.message) {
                             frappe.msgprint({
                                 title: __("Sync Complete"),
-                                message: __("Imported: {0}<br>Updated: {1}<br>Skipped: {2}",
-                                    [r.message.imported, r.message.updated, r.message.skipped]),
+                                message: __("Imported: {0}<br>Updated: {1}<br>Unchanged: {2}<br>Skipped: {3}",
+                                    [r.message.imported, r.message.updated, r.message.unchanged, r.message.skipped]),
                                 indicator: "green"
                             });
                             listview.refresh();
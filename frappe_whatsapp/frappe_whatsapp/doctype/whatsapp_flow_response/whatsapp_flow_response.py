@@ -0,0 +1,15 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppFlowResponse(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Flow Response", ["flow", "field_name"])
+	frappe.db.add_index("WhatsApp Flow Response", ["whatsapp_contact", "flow"])
+	frappe.db.add_index("WhatsApp Flow Response", ["whatsapp_message"])
@@ -0,0 +1,26 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+from frappe_whatsapp.utils.recipient_import import normalize_number, update_recipient_count
+
+
+class WhatsAppListRecipient(Document):
+	def validate(self):
+		self.mobile_number = normalize_number(self.mobile_number)
+
+	def after_insert(self):
+		update_recipient_count(self.recipient_list)
+
+	def after_delete(self):
+		update_recipient_count(self.recipient_list)
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"WhatsApp List Recipient", ["recipient_list", "mobile_number"], constraint_name="unique_list_mobile"
+	)
+	# campaigns read a list by keyset on name
+	frappe.db.add_index("WhatsApp List Recipient", ["recipient_list", "name"])
@@ -7,6 +7,14 @@ from frappe.model.document import Document
 from frappe.integrations.utils import make_post_request
 
 from frappe_whatsapp.utils import get_whatsapp_account, format_number
+from frappe_whatsapp.utils.template_payload import (
+    body_component,
+    build_template_payload,
+    get_compiled_template,
+    header_component,
+    quick_reply_components,
+    url_button_component,
+)
 
 class WhatsAppMessage(Document):
     def validate(self):
@@ -28,7 +36,7 @@ class WhatsAppMessage(Document):
     
     def validate_template_compliance(self):
         """Validate message complies with template requirements"""
-        template_doc = frappe.get_doc("WhatsApp Templates", self.template)
+        template_doc = get_compiled_template(self.template)
         
         # Check template is approved
         if template_doc.status != "APPROVED":
@@ -36,12 +44,12 @@ class WhatsAppMessage(Document):
         
         # Check header/attachment requirements
         if template_doc.header_type in ["IMAGE", "VIDEO", "DOCUMENT"]:
-            if not self.attach and not template_doc.sample:
+            if not self.attach and not template_doc.has_sample:
                 frappe.throw(_(f"This template requires a {template_doc.header_type.lower()} attachment."))
         
         # Check variable count if template has variables
-        if template_doc.sample_values and self.body_param:
-            expected_count = len(template_doc.sample_values.split(","))
+        if template_doc.variable_count and self.body_param:
+            expected_count = template_doc.variable_count
             try:
                 params = json.loads(self.body_param)
                 if isinstance(params, list):
@@ -240,8 +248,9 @@ class WhatsAppMessage(Document):
                     data["interactive"]["action"]["parameters"]["mode"] = flow_mode
 
                 # Add flow token - generate one if not provided (required by WhatsApp)
-                flow_token = self.flow_token or frappe.generate_hash(length=16)
-                data["interactive"]["action"]["parameters"]["flow_token"] = flow_token
+                # kept on the message so responses can be traced back to the flow
+                self.flow_token = self.flow_token or frappe.generate_hash(length=16)
+                data["interactive"]["action"]["parameters"]["flow_token"] = self.flow_token
 
             try:
                 self.notify(data)
@@ -256,22 +265,11 @@ class WhatsAppMessage(Document):
 
     def send_template(self):
         """Send template."""
-        template = frappe.get_doc("WhatsApp Templates", self.template)
-        data = {
-            "messaging_product": "whatsapp",
-            "to": format_number(self.to),
-            "type": "template",
-            "template": {
-                "name": template.actual_name or template.template_name,
-                "language": {"code": template.language_code},
-                "components": [],
-            },
-        }
+        template = get_compiled_template(self.template)
+        data = build_template_payload(template, format_number(self.to))
 
-        if template.sample_values:
-            field_names = template.field_names.split(",") if template.field_names else template.sample_values.split(",")
-            parameters = []
-            template_parameters = []
+        if template.body_fields:
+            field_names = template.body_fields
 
             if self.body_param is not None:
                 parsed_param = json.loads(self.body_param)
@@ -286,109 +284,45 @@ class WhatsAppMessage(Document):
                 else:
                     params = [parsed_param]
                 
-                for param in params:
-                    parameters.append({"type": "text", "text": str(param)})
-                    template_parameters.append(param)
+                parameters = [str(param) for param in params]
+                template_parameters = params
             elif self.flags.custom_ref_doc:
                 custom_values = self.flags.custom_ref_doc
-                for field_name in field_names:
-                    value = custom_values.get(field_name.strip())
-                    parameters.append({"type": "text", "text": value})
-                    template_parameters.append(value)                    
+                parameters = [custom_values.get(field_name) for field_name in field_names]
+                template_parameters = parameters
 
             else:
                 ref_doc = frappe.get_doc(self.reference_doctype, self.reference_name)
-                for field_name in field_names:
-                    value = ref_doc.get_formatted(field_name.strip())
-                    parameters.append({"type": "text", "text": value})
-                    template_parameters.append(value)
+                parameters = [ref_doc.get_formatted(field_name) for field_name in field_names]
+                template_parameters = parameters
 
             self.template_parameters = json.dumps(template_parameters)
-            data["template"]["components"].append(
-                {
-                    "type": "body",
-                    "parameters": parameters,
-                }
-            )
+            data["template"]["components"].append(body_component(parameters))
 
         # Only send header parameters if:
         # 1. User explicitly attached a file (override template header)
         # 2. Template has dynamic header that needs an image URL
         # Do NOT send if template has static image (baked into Meta template)
-        if template.header_type and self.attach:
-            if template.header_type == 'IMAGE':
-                if self.attach.startswith("http"):
-                    url = f'{self.attach}'
-                else:
-                    url = f'{frappe.utils.get_url()}{self.attach}'
-                data['template']['components'].append({
-                    "type": "header",
-                    "parameters": [{
-                        "type": "image",
-                        "image": {
-                            "link": url
-                        }
-                    }]
-                })
-            elif template.header_type == 'VIDEO':
-                if self.attach.startswith("http"):
-                    url = f'{self.attach}'
-                else:
-                    url = f'{frappe.utils.get_url()}{self.attach}'
-                data['template']['components'].append({
-                    "type": "header",
-                    "parameters": [{
-                        "type": "video",
-                        "video": {
-                            "link": url
-                        }
-                    }]
-                })
-            elif template.header_type == 'DOCUMENT':
-                if self.attach.startswith("http"):
-                    url = f'{self.attach}'
-                else:
-                    url = f'{frappe.utils.get_url()}{self.attach}'
-                data['template']['components'].append({
-                    "type": "header",
-                    "parameters": [{
-                        "type": "document",
-                        "document": {
-                            "link": url
-                        }
-                    }]
-                })
+        if template.header_type in ("IMAGE", "VIDEO", "DOCUMENT") and self.attach:
+            if self.attach.startswith("http"):
+                url = f'{self.attach}'
+            else:
+                url = f'{frappe.utils.get_url()}{self.attach}'
+            data['template']['components'].append(
+                header_component(template.header_type.lower(), link=url)
+            )
         # NOTE: If template.sample exists but no self.attach, header is STATIC
         # Static headers are baked into the Meta template - don't send params
 
         if template.buttons:
-            button_parameters = []
-            quick_reply_idx = 0  # Separate counter for quick reply buttons
-            for idx, btn in enumerate(template.buttons):
-                if btn.button_type == "Quick Reply":
-                    # Use unique payload format for Meta API compliance
-                    payload = f"QR_{quick_reply_idx}_{btn.button_label[:50]}"
-                    button_parameters.append({
-                        "type": "button",
-                        "sub_type": "quick_reply",
-                        "index": str(quick_reply_idx),
-                        "parameters": [{"type": "payload", "payload": payload}]
-                    })
-                    quick_reply_idx += 1
+            button_parameters = quick_reply_components(template)
+            ref_doc = None
+            for btn in template.buttons:
                 # Only send URL button parameter if it's Dynamic
-                elif btn.button_type == "Visit Website" and btn.url_type == "Dynamic":
-                    ref_doc = frappe.get_doc(self.reference_doctype, self.reference_name)
+                if btn.is_dynamic_url:
+                    ref_doc = ref_doc or frappe.get_doc(self.reference_doctype, self.reference_name)
                     url = ref_doc.get_formatted(btn.website_url)
-                    # For dynamic URL, index counts only URL buttons with dynamic suffix
-                    # Get count of dynamic URL buttons before this one
-                    dynamic_url_idx = sum(1 for b in template.buttons[:idx] 
-                                         if b.button_type == "Visit Website" and b.url_type == "Dynamic")
-                    button_parameters.append({
-                        "type": "button",
-                        "sub_type": "url",
-                        "index": str(dynamic_url_idx),
-                        "parameters": [{"type": "text", "text": url}]
-                    })
+                    button_parameters.append(url_button_component(btn.dynamic_url_index, url))
                 # Static phone and static URL buttons: NO parameters needed!
                 # WhatsApp gets these from the approved template itself
 
@@ -430,6 +364,8 @@ class WhatsAppMessage(Document):
                 if frappe.flags.integration_request:
                     res = frappe.flags.integration_request.json().get("error", {})
                     error_message = res.get("Error", res.get("message"))
+                    # kept so failed campaign sends can be retried by cause
+                    self.error_code = res.get("code")
             except:
                 pass
             
@@ -505,6 +441,10 @@ class WhatsAppMessage(Document):
 
 def on_doctype_update():
     frappe.db.add_index("WhatsApp Message", ["reference_doctype", "reference_name"])
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_contact", "modified"])
+    frappe.db.add_index("WhatsApp Message", ["flow_token"])
+    frappe.db.add_index("WhatsApp Message", ["message_id"])
+    frappe.db.add_index("WhatsApp Message", ["bulk_message_reference", "status"])
 
 
 @frappe.whitelist()
@@ -7,10 +7,25 @@ from frappe import _dict, _
 from frappe.model.document import Document
 from frappe.utils.safe_exec import get_safe_globals, safe_exec
 from frappe.integrations.utils import make_post_request
-from frappe.desk.form.utils import get_pdf_link
-from frappe.utils import add_to_date, nowdate, datetime
+from frappe.utils import datetime
 
 from frappe_whatsapp.utils import get_whatsapp_account
+from frappe_whatsapp.utils.condition import evaluate_condition
+from frappe_whatsapp.utils.document_print import get_document_media_id
+from frappe_whatsapp.utils.idempotency import claim, get_sent_message, keep, make_idempotency_key, release
+from frappe_whatsapp.utils.template_payload import (
+    body_component,
+    build_template_payload,
+    get_compiled_template,
+    header_component,
+    url_button_component,
+)
+from frappe_whatsapp.utils.notification_runner import (
+    clear_scheduled_notifications_cache,
+    queue_date_notification,
+    queue_date_notifications,
+    queue_scheduled_chunks,
+)
 
 
 class WhatsAppNotification(Document):
@@ -49,58 +64,42 @@ class WhatsAppNotification(Document):
             self.condition, get_safe_globals(), dict(doc=self)
         )
 
-        template = frappe.db.get_value(
-            "WhatsApp Templates", self.template,
-            fieldname='*'
-        )
-
-        if template and template.language_code:
+        if get_compiled_template(self.template).language_code:
             if self.get("_contact_list"):
                 # send simple template without a doc to get field data.
-                self.send_simple_template(template)
+                queue_scheduled_chunks(self, contact_list=self._contact_list)
             elif self.get("_data_list"):
                 # allow send a dynamic template using schedule event config
                 # _doc_list shoud be [{"name": "xxx", "phone_no": "123"}]
-                for data in self._data_list:
-                    doc = frappe.get_doc(self.reference_doctype, data.get("name"))
-
-                    self.send_template_message(doc, data.get("phone_no"), template, True)
+                queue_scheduled_chunks(self, data_list=self._data_list)
         # return _globals.frappe.flags
 
 
     def send_simple_template(self, template):
         """ send simple template without a doc to get field data """
         for contact in self._contact_list:
-            data = {
-                "messaging_product": "whatsapp",
-                "to": self.format_number(contact),
-                "type": "template",
-                "template": {
-                    "name": template.actual_name,
-                    "language": {
-                        "code": template.language_code
-                    },
-                    "components": []
-                }
-            }
-            self.content_type = template.get("header_type", "text").lower()
+            data = build_template_payload(template, self.format_number(contact))
+            self.content_type = (template.header_type or "text").lower()
             self.notify(data, template_account=template.get("whatsapp_account"))
 
 
-    def send_template_message(self, doc: Document, phone_no=None, default_template=None, ignore_condition=False):
+    def send_template_message(self, doc: Document, phone_no=None, default_template=None, ignore_condition=False, idempotency_key=None):
         """Specific to Document Event triggered Server Scripts."""
         if self.disabled:
             return
 
-        doc_data = doc.as_dict()
         if self.condition and not ignore_condition:
             # check if condition satisfies
-            if not frappe.safe_eval(
-                self.condition, get_safe_globals(), dict(doc=doc_data)
-            ):
+            if not evaluate_condition(self.condition, doc):
                 return
 
-        template = default_template or frappe.get_doc("WhatsApp Templates", self.template)
+        if idempotency_key and get_sent_message(idempotency_key):
+            # already sent by an earlier run of the same event
+            return True
+
+        doc_data = doc.as_dict()
+
+        template = default_template or get_compiled_template(self.template)
 
         if template:
             if self.field_name:
@@ -108,18 +107,7 @@ class WhatsAppNotification(Document):
             else:
                 phone_number = phone_no
 
-            data = {
-                "messaging_product": "whatsapp",
-                "to": self.format_number(phone_number),
-                "type": "template",
-                "template": {
-                    "name": template.actual_name,
-                    "language": {
-                        "code": template.language_code
-                    },
-                    "components": []
-                }
-            }
+            data = build_template_payload(template, self.format_number(phone_number))
 
             # Pass parameter values
             if self.fields:
@@ -133,43 +121,20 @@ class WhatsAppNotification(Document):
                         if isinstance(doc_data[field.field_name], (datetime.date, datetime.datetime)):
                             value = str(doc_data[field.field_name])
 
-                    parameters.append({
-                        "type": "text",
-                        "text": value
-                    })
+                    parameters.append(value)
 
-                data['template']["components"] = [{
-                    "type": "body",
-                    "parameters": parameters
-                }]
+                data['template']["components"] = [body_component(parameters)]
 
+            media_id = url = filename = None
             if self.attach_document_print:
-                # frappe.db.begin()
-                key = doc.get_document_share_key()  # noqa
-                frappe.db.commit()
-                print_format = "Standard"
-                doctype = frappe.get_doc("DocType", doc_data['doctype'])
-                if doctype.custom:
-                    if doctype.default_print_format:
-                        print_format = doctype.default_print_format
-                else:
-                    default_print_format = frappe.db.get_value(
-                        "Property Setter",
-                        filters={
-                            "doc_type": doc_data['doctype'],
-                            "property": "default_print_format"
-                        },
-                        fieldname="value"
-                    )
-                    print_format = default_print_format if default_print_format else print_format
-                link = get_pdf_link(
+                # rendered here in the background job and uploaded to Meta,
+                # instead of Meta fetching the print from a web worker
+                media_id = get_document_media_id(
                     doc_data['doctype'],
                     doc_data['name'],
-                    print_format=print_format
+                    template.whatsapp_account or get_whatsapp_account(account_type='outgoing').name,
                 )
-
                 filename = f'{doc_data["name"]}.pdf'
-                url = f'{frappe.utils.get_url()}{link}&key={key}'
 
             elif self.custom_attachment:
                 filename = self.file_name
@@ -189,47 +154,28 @@ class WhatsAppNotification(Document):
                     url = f'{frappe.utils.get_url()}{file_url}'
 
             if template.header_type == 'DOCUMENT':
-                data['template']['components'].append({
-                    "type": "header",
-                    "parameters": [{
-                        "type": "document",
-                        "document": {
-                            "link": url,
-                            "filename": filename
-                        }
-                    }]
-                })
+                data['template']['components'].append(
+                    header_component("document", link=url, media_id=media_id, filename=filename)
+                )
             elif template.header_type == 'IMAGE':
-                data['template']['components'].append({
-                    "type": "header",
-                    "parameters": [{
-                        "type": "image",
-                        "image": {
-                            "link": url
-                        }
-                    }]
-                })
+                data['template']['components'].append(
+                    header_component("image", link=url, media_id=media_id)
+                )
             self.content_type = template.header_type.lower()
 
             if template.buttons:
                 button_fields = self.button_fields.split(",") if self.button_fields else []
-                for idx, btn in enumerate(template.buttons):
-                    if btn.button_type == "Visit Website" and btn.url_type == "Dynamic":
-                        if button_fields:
-                            data['template']['components'].append({
-                                "type": "button",
-                                "sub_type": "url",
-                                "index": str(idx),
-                                "parameters": [
-                                    {"type": "text", "text": doc.get(button_fields.pop(0))}
-                                ]
-                            })
-
-
-            self.notify(data, doc_data, template_account=template.whatsapp_account)
-
-    def notify(self, data, doc_data=None, template_account=None):
-        """Notify."""
+                for btn in template.buttons:
+                    if btn.is_dynamic_url and button_fields:
+                        data['template']['components'].append(
+                            url_button_component(btn.position, doc.get(button_fields.pop(0)))
+                        )
+
+
+            return self.notify(data, doc_data, template_account=template.whatsapp_account, idempotency_key=idempotency_key)
+
+    def notify(self, data, doc_data=None, template_account=None, idempotency_key=None):
+        """Notify. Returns True if the message was accepted."""
         # Use template's whatsapp account if available, otherwise use default outgoing account
         if template_account:
             whatsapp_account = frappe.get_doc("WhatsApp Account", template_account)
@@ -239,6 +185,10 @@ class WhatsAppNotification(Document):
         if not whatsapp_account:
             frappe.throw(_("Please set a default outgoing WhatsApp Account"))
 
+        if idempotency_key and not claim(idempotency_key):
+            # the same send is in flight on another worker
+            return False
+
         token = whatsapp_account.get_password("token")
 
         headers = {
@@ -246,57 +196,11 @@ class WhatsAppNotification(Document):
             "content-type": "application/json"
         }
         try:
-            success = False
             response = make_post_request(
                 f"{whatsapp_account.url}/{whatsapp_account.version}/{whatsapp_account.phone_id}/messages",
                 headers=headers, data=json.dumps(data)
             )
-
-            if not self.get("content_type"):
-                self.content_type = 'text'
-
-            parameters = None
-            if data["template"]["components"]:
-                parameters = [param["text"] for param in data["template"]["components"][0]["parameters"]]
-                parameters = frappe.json.dumps(parameters, default=str)
-
-            new_doc = {
-                "doctype": "WhatsApp Message",
-                "type": "Outgoing",
-                "message": str(data['template']),
-                "to": data['to'],
-                "message_type": "Template",
-                "message_id": response['messages'][0]['id'],
-                "content_type": self.content_type,
-                "use_template": 1,
-                "template": self.template,
-                "template_parameters": parameters,
-                "whatsapp_account": whatsapp_account.name,
-            }
-
-            if doc_data:
-                new_doc.update({
-                    "reference_doctype": doc_data.doctype,
-                    "reference_name": doc_data.name,
-                })
-
-            frappe.get_doc(new_doc).save(ignore_permissions=True)
-
-            if doc_data and self.set_property_after_alert and self.property_value:
-                if doc_data.doctype and doc_data.name:
-                    fieldname = self.set_property_after_alert
-                    value = self.property_value
-                    meta = frappe.get_meta(doc_data.get("doctype"))
-                    df = meta.get_field(fieldname)
-                    if df:
-                        if df.fieldtype in frappe.model.numeric_fieldtypes:
-                            value = frappe.utils.cint(value)
-
-                        frappe.db.set_value(doc_data.get("doctype"), doc_data.get("name"), fieldname, value)
-
-            frappe.msgprint("WhatsApp Message Triggered", indicator="green", alert=True)
-            success = True
-
+            message_id = response['messages'][0]['id']
         except Exception as e:
             error_message = str(e)
             if frappe.flags.integration_request:
@@ -309,21 +213,92 @@ class WhatsAppNotification(Document):
                 indicator="red",
                 alert=True
             )
-        finally:
-            if not success:
-                meta = {"error": error_message}
-            else:
-                meta = frappe.flags.integration_request.json()
+            if idempotency_key:
+                release(idempotency_key)
+            self.log_notification({"error": error_message})
+            return False
+
+        # WhatsApp accepted the message: from here on the claim is kept even if
+        # recording it fails, so a retry can't send it a second time
+        self.log_notification(frappe.flags.integration_request.json() if frappe.flags.integration_request else response)
+        try:
+            self.record_sent_message(data, message_id, whatsapp_account, doc_data, idempotency_key)
+            frappe.msgprint("WhatsApp Message Triggered", indicator="green", alert=True)
+        except Exception:
+            if idempotency_key:
+                keep(idempotency_key)
+            frappe.log_error(
+                title=f"WhatsApp Notification {self.name}: sent message {message_id} not recorded",
+                message=frappe.get_traceback()
+            )
+
+        return True
+
+    def log_notification(self, meta):
+        try:
             frappe.get_doc({
                 "doctype": "WhatsApp Notification Log",
                 "template": self.template,
                 "meta_data": meta
             }).insert(ignore_permissions=True)
+        except Exception:
+            frappe.log_error(title="WhatsApp Notification Log", message=frappe.get_traceback())
+
+    def record_sent_message(self, data, message_id, whatsapp_account, doc_data=None, idempotency_key=None):
+        """Save the WhatsApp Message of a sent notification and set the property after alert."""
+        if not self.get("content_type"):
+            self.content_type = 'text'
+
+        parameters = None
+        body = next((c for c in data["template"]["components"] if c.get("type") == "body"), None)
+        if body:
+            parameters = [param.get("text") for param in body["parameters"]]
+            parameters = frappe.json.dumps(parameters, default=str)
+
+        new_doc = {
+            "doctype": "WhatsApp Message",
+            "type": "Outgoing",
+            "message": str(data['template']),
+            "to": data['to'],
+            "message_type": "Template",
+            "message_id": message_id,
+            "content_type": self.content_type,
+            "use_template": 1,
+            "template": self.template,
+            "template_parameters": parameters,
+            "whatsapp_account": whatsapp_account.name,
+            "idempotency_key": idempotency_key,
+        }
+
+        if doc_data:
+            new_doc.update({
+                "reference_doctype": doc_data.doctype,
+                "reference_name": doc_data.name,
+            })
 
+        frappe.get_doc(new_doc).save(ignore_permissions=True)
+
+        if doc_data and self.set_property_after_alert and self.property_value:
+            if doc_data.doctype and doc_data.name:
+                fieldname = self.set_property_after_alert
+                value = self.property_value
+                meta = frappe.get_meta(doc_data.get("doctype"))
+                df = meta.get_field(fieldname)
+                if df:
+                    if df.fieldtype in frappe.model.numeric_fieldtypes:
+                        value = frappe.utils.cint(value)
+
+                    frappe.db.set_value(doc_data.get("doctype"), doc_data.get("name"), fieldname, value)
+
+
+    def on_update(self):
+        """Refresh the cached list of scheduled notifications."""
+        clear_scheduled_notifications_cache()
 
     def on_trash(self):
         """On delete remove from schedule."""
         frappe.cache().delete_value("whatsapp_notification_map")
+        clear_scheduled_notifications_cache()
 
 
     def format_number(self, number):
@@ -334,30 +309,25 @@ class WhatsAppNotification(Document):
         return number
 
     def get_documents_for_today(self):
-        """get list of documents that will be triggered today"""
-        docs = []
-
-        diff_days = self.days_in_advance
-        if self.doctype_event == "Days After":
-            diff_days = -diff_days
-
-        reference_date = add_to_date(nowdate(), days=diff_days)
-        reference_date_start = reference_date + " 00:00:00.000000"
-        reference_date_end = reference_date + " 23:59:59.000000"
-
-        doc_list = frappe.get_all(
-            self.reference_doctype,
-            fields="name",
-            filters=[
-                {self.date_changed: (">=", reference_date_start)},
-                {self.date_changed: ("<=", reference_date_end)},
-            ],
-        )
+        """Queue the documents that will be triggered today."""
+        queue_date_notification(self.name)
 
-        for d in doc_list:
-            doc = frappe.get_doc(self.reference_doctype, d.name)
-            self.send_template_message(doc)
-            # print(doc.name)
+
+def send_doc_event_notification(notification, reference_doctype, reference_name, doc_event, snapshot=None, modified=None):
+    """Background job: send a doc event notification for a committed document."""
+    if snapshot:
+        doc = frappe.get_doc(snapshot)
+    elif frappe.db.exists(reference_doctype, reference_name):
+        doc = frappe.get_doc(reference_doctype, reference_name)
+    else:
+        return
+
+    frappe.get_doc("WhatsApp Notification", notification).send_template_message(
+        doc,
+        idempotency_key=make_idempotency_key(
+            notification, reference_doctype, reference_name, doc_event, modified or doc.modified
+        ),
+    )
 
 
 @frappe.whitelist()
@@ -378,10 +348,5 @@ def trigger_notifications(method="daily"):
         return
 
     if method == "daily":
-        doc_list = frappe.get_all(
-            "WhatsApp Notification", filters={"doctype_event": ("in", ("Days Before", "Days After")), "disabled": 0}
-        )
-        for d in doc_list:
-            alert = frappe.get_doc("WhatsApp Notification", d.name)
-            alert.get_documents_for_today()
+        queue_date_notifications()
            
@@ -1,4 +1,27 @@
 frappe.ui.form.on('WhatsApp Recipient List', {
+    setup: function(frm) {
+        frappe.realtime.on('whatsapp_recipient_import', function(data) {
+            if(data.list_name !== frm.doc.name) {
+                return;
+            }
+
+            if(!data.finished) {
+                frappe.show_progress(__('Importing Recipients'), data.done, data.total,
+                    data.description || __('{0} of {1} records read', [data.done, data.total]));
+                return;
+            }
+
+            frappe.hide_progress();
+            if(data.error) {
+                frappe.msgprint({message: data.error, indicator: 'red'});
+            } else {
+                frappe.msgprint(__('{0} recipients imported, {1} duplicate or empty numbers skipped',
+                    [data.imported, data.skipped]));
+            }
+            frm.reload_doc();
+        });
+    },
+
     refresh: function(frm) {
         frm.fields_dict.import_button.onclick = function() {
             if(!frm.doc.doctype_to_import || !frm.doc.mobile_field) {
@@ -29,13 +52,83 @@ frappe.ui.form.on('WhatsApp Recipient List', {
                 },
                 callback: function(r) {
                     if(r.message) {
-                        frappe.msgprint(__(`${r.message} recipients imported successfully`));
-                        frm.reload_doc();
+                        frappe.show_alert({
+                            message: __('Import started, recipients are added in the background'),
+                            indicator: 'blue'
+                        });
                     }
                 }
             });
         };
         
+        if(frm.is_new()) {
+            return;
+        }
+
+        frm.add_custom_button(__('View Recipients'), function() {
+            frappe.set_route('List', 'WhatsApp List Recipient', {recipient_list: frm.doc.name});
+        });
+
+        frm.add_custom_button(__('Import from File'), function() {
+            let d = new frappe.ui.Dialog({
+                title: __('Import Recipients from CSV/XLSX'),
+                fields: [
+                    {
+                        label: __('File'), fieldname: 'file_url', fieldtype: 'Attach', reqd: 1,
+                        description: __('The first row must contain column names'),
+                        onchange: function() {
+                            let file_url = d.get_value('file_url');
+                            if(!file_url) {
+                                return;
+                            }
+                            frappe.call({
+                                method: 'frappe_whatsapp.utils.bulk_messaging.get_file_columns',
+                                args: {file_url: file_url},
+                                callback: function(r) {
+                                    let columns = r.message || [];
+                                    d.set_df_property('mobile_column', 'options', columns);
+                                    d.set_df_property('name_column', 'options', [''].concat(columns));
+                                    d.set_df_property('data_columns', 'options',
+                                        columns.map(c => ({label: c, value: c})));
+                                }
+                            });
+                        }
+                    },
+                    {label: __('Mobile Number Column'), fieldname: 'mobile_column', fieldtype: 'Select', reqd: 1},
+                    {label: __('Name Column'), fieldname: 'name_column', fieldtype: 'Select'},
+                    {
+                        label: __('Variable Columns'), fieldname: 'data_columns', fieldtype: 'MultiCheck',
+                        description: __('Stored as recipient data for template variables. Leave empty to use all other columns.')
+                    },
+                    {label: __('Replace Existing Recipients'), fieldname: 'replace', fieldtype: 'Check'}
+                ],
+                primary_action_label: __('Import'),
+                primary_action: function(values) {
+                    frappe.call({
+                        method: 'frappe_whatsapp.utils.bulk_messaging.import_recipients_from_file',
+                        args: {
+                            list_name: frm.doc.name,
+                            file_url: values.file_url,
+                            mobile_column: values.mobile_column,
+                            name_column: values.name_column,
+                            data_columns: values.data_columns,
+                            replace: values.replace
+                        },
+                        callback: function(r) {
+                            if(r.message) {
+                                d.hide();
+                                frappe.show_alert({
+                                    message: __('Import started, recipients are added in the background'),
+                                    indicator: 'blue'
+                                });
+                            }
+                        }
+                    });
+                }
+            });
+            d.show();
+        });
+
         // Add a button to add a test recipient
         frm.add_custom_button(__('Add Test Recipient'), function() {
             let d = new frappe.ui.Dialog({
@@ -62,18 +155,20 @@ frappe.ui.form.on('WhatsApp Recipient List', {
                         }
                     }
                     
-                    frm.add_child('recipients', {
-                        mobile_number: values.mobile_number,
-                        recipient_name: values.recipient_name,
-                        recipient_data: values.recipient_data
-                    });
-                    
-                    frm.refresh_field('recipients');
-                    d.hide();
-                    
-                    frappe.show_alert({
-                        message: __('Test recipient added'),
-                        indicator: 'green'
+                    frappe.call({
+                        method: 'frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_recipient_list.whatsapp_recipient_list.add_recipients',
+                        args: {
+                            list_name: frm.doc.name,
+                            recipients: [values]
+                        },
+                        callback: function() {
+                            d.hide();
+                            frm.reload_doc();
+                            frappe.show_alert({
+                                message: __('Test recipient added'),
+                                indicator: 'green'
+                            });
+                        }
                     });
                 }
             });
@@ -82,46 +177,35 @@ frappe.ui.form.on('WhatsApp Recipient List', {
         
         // Add a button to validate all recipients
         frm.add_custom_button(__('Validate Recipients'), function() {
-            let invalid = [];
-            
-            (frm.doc.recipients || []).forEach(function(row, idx) {
-                let mobile = row.mobile_number || '';
-                
-                // Remove non-numeric characters except '+'
-                mobile = mobile.replace(/[^\d+]/g, '');
-                
-                // Basic validation - should start with + or number and be at least 10 digits
-                if(!/^(\+|[0-9])/.test(mobile) || mobile.replace(/\+/g, '').length < 10) {
-                    invalid.push({
-                        idx: idx + 1,
-                        mobile: row.mobile_number,
-                        reason: 'Invalid format'
-                    });
+            frappe.call({
+                method: 'frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_recipient_list.whatsapp_recipient_list.get_invalid_numbers',
+                args: {list_name: frm.doc.name},
+                callback: function(r) {
+                    let invalid = r.message;
+                    if(invalid.count) {
+                        let html = '<div class="text-danger">Found ' + invalid.count + ' invalid numbers:</div><table class="table table-bordered">';
+                        html += '<thead><tr><th>Number</th><th>Reason</th></tr></thead><tbody>';
+                        
+                        invalid.numbers.forEach(function(row) {
+                            html += '<tr><td>' + frappe.utils.escape_html(row.mobile_number) + '</td><td>Invalid format</td></tr>';
+                        });
+                        
+                        html += '</tbody></table>';
+                        
+                        frappe.msgprint({
+                            title: __('Validation Results'),
+                            indicator: 'red',
+                            message: html
+                        });
+                    } else {
+                        frappe.msgprint({
+                            title: __('Validation Results'),
+                            indicator: 'green',
+                            message: __('All recipients have valid numbers')
+                        });
+                    }
                 }
             });
-            
-            if(invalid.length) {
-                let html = '<div class="text-danger">Found ' + invalid.length + ' invalid numbers:</div><table class="table table-bordered">';
-                html += '<thead><tr><th>Row</th><th>Number</th><th>Reason</th></tr></thead><tbody>';
-                
-                invalid.forEach(function(row) {
-                    html += '<tr><td>' + row.idx + '</td><td>' + row.mobile + '</td><td>' + row.reason + '</td></tr>';
-                });
-                
-                html += '</tbody></table>';
-                
-                frappe.msgprint({
-                    title: __('Validation Results'),
-                    indicator: 'red',
-                    message: html
-                });
-            } else {
-                frappe.msgprint({
-                    title: __('Validation Results'),
-                    indicator: 'green',
-                    message: __('All recipients have valid numbers')
-                });
-            }
         });
     }
 });
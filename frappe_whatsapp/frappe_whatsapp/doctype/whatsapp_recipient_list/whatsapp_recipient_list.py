@@ -1,79 +1,124 @@
 import frappe
 import json
-from frappe import _
 from frappe.model.document import Document
 
+from frappe_whatsapp.utils.recipient_import import (
+	RecipientWriter,
+	enqueue_import_from_doctype,
+	normalize_number,
+	update_recipient_count,
+)
+
+PAGE_LENGTH = 100
+
 
 class WhatsAppRecipientList(Document):
-	def validate(self):
-		self.validate_recipients()
-	
-	def validate_recipients(self):
-		if not self.is_new():
-			if not self.recipients:
-				frappe.throw(_("At least one recipient is required"))
-	
+	"""Recipients are rows of WhatsApp List Recipient, so loading or saving a list
+	doesn't depend on its size. Use the functions below to read and edit them."""
+
+	def on_trash(self):
+		frappe.db.delete("WhatsApp List Recipient", {"recipient_list": self.name})
+
 	def import_list_from_doctype(self, doctype, mobile_field, name_field=None, filters=None, limit=None, data_fields=None):
-		"""Import recipients from another DocType"""
+		"""Import recipients from another DocType in a background job"""
 		self.doctype_to_import = doctype
 		self.mobile_field = mobile_field
-		self.filters = filters
+		self.name_field = name_field
+		if filters:
+			self.import_filters = json.dumps(filters)
 		if data_fields:
 			self.data_fields = json.dumps(data_fields)
-
 		if limit:
 			self.import_limit = limit
 
-		fields = [mobile_field]
-		if name_field:
-			fields.append(name_field)
-		if data_fields:
-			meta = frappe.get_meta(doctype)
-			# print(meta.fields)
-			for field in meta.fields:
-				if field.fieldname not in fields and field.fieldname in data_fields:
-					fields.append(field.fieldname)
-		# Get records from the doctype
-		records = frappe.get_all(
-			doctype,
+		# recipients are written by the job, not by saving this document
+		for field in ("doctype_to_import", "mobile_field", "name_field", "import_filters", "data_fields", "import_limit"):
+			self.db_set(field, self.get(field), update_modified=False)
+
+		enqueue_import_from_doctype(
+			self.name,
+			doctype=doctype,
+			mobile_field=mobile_field,
+			name_field=name_field,
 			filters=filters,
+			limit=limit,
+			data_fields=data_fields,
+		)
+
+
+def iter_recipients(list_name, fields=None, page_length=1000, after=""):
+	"""Yield pages of recipients of a list by keyset on name, starting ``after`` a name."""
+	fields = fields or ["name", "mobile_number", "recipient_name", "recipient_data"]
+	while True:
+		page = frappe.get_all(
+			"WhatsApp List Recipient",
+			filters={"recipient_list": list_name, "name": (">", after)},
 			fields=fields,
-			limit=limit
+			order_by="name asc",
+			limit=page_length,
 		)
-		
-		# Clear existing recipients
-		self.recipients = []
-		
-		# Add recipients
-		for record in records:
-			if not record.get(mobile_field):
-				continue
-				
-			# Format mobile number
-			mobile = record.get(mobile_field)
-			# Remove any non-numeric characters except '+'
-			mobile = ''.join(char for char in mobile if char.isdigit() or char == '+')
-			
-			if not mobile:
-				continue
-
-			recipient_data = {}
-			if data_fields:
-				for field in data_fields:
-					if record.get(field):
-						# Use field name as the variable name in recipient data
-						variable_name = field.lower().replace(" ", "_")
-						recipient_data[variable_name] = record.get(field)
-
-				
-			recipient = {
-				"mobile_number": mobile,
-				"recipient_data": json.dumps(recipient_data)
-			}
-			
-			if name_field and record.get(name_field):
-				recipient["recipient_name"] = record.get(name_field)
-				
-			self.append("recipients", recipient)
-		
-		return len(self.recipients)
\ No newline at end of file
+		if not page:
+			return
+		yield page
+		after = page[-1].name
+
+
+@frappe.whitelist()
+def get_recipients(list_name, after=None, page_length=PAGE_LENGTH, search=None):
+	"""A page of recipients; pass the last ``name`` of a page as ``after`` for the next one."""
+	frappe.has_permission("WhatsApp Recipient List", "read", list_name, throw=True)
+	filters = {"recipient_list": list_name, "name": (">", after or "")}
+	if search:
+		filters["mobile_number"] = ("like", f"%{normalize_number(search)}%")
+	return frappe.get_all(
+		"WhatsApp List Recipient",
+		filters=filters,
+		fields=["name", "mobile_number", "recipient_name", "recipient_data"],
+		order_by="name asc",
+		limit=min(frappe.utils.cint(page_length) or PAGE_LENGTH, 1000),
+	)
+
+
+@frappe.whitelist()
+def add_recipients(list_name, recipients):
+	"""Add recipients (dicts of mobile_number, recipient_name, recipient_data); numbers
+	already in the list are skipped. Returns the new recipient count."""
+	frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+	if isinstance(recipients, str):
+		recipients = json.loads(recipients)
+
+	writer = RecipientWriter(list_name)
+	for recipient in recipients:
+		data = recipient.get("recipient_data") or {}
+		if isinstance(data, str):
+			data = json.loads(data)
+		writer.add(recipient.get("mobile_number"), recipient.get("recipient_name"), data)
+	return writer.finish()
+
+
+@frappe.whitelist()
+def remove_recipients(list_name, names):
+	frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+	if isinstance(names, str):
+		names = json.loads(names)
+	frappe.db.delete("WhatsApp List Recipient", {"recipient_list": list_name, "name": ("in", names)})
+	return update_recipient_count(list_name)
+
+
+@frappe.whitelist()
+def get_invalid_numbers(list_name, limit=100):
+	"""Count and a sample of numbers that don't look like mobile numbers with country code."""
+	frappe.has_permission("WhatsApp Recipient List", "read", list_name, throw=True)
+	condition = "recipient_list = %(list_name)s AND mobile_number NOT REGEXP '^[+]?[0-9]{10,15}$'"
+	values = {"list_name": list_name, "limit": frappe.utils.cint(limit)}
+	return {
+		"count": frappe.db.sql(
+			f"SELECT COUNT(*) FROM `tabWhatsApp List Recipient` WHERE {condition}", values
+		)[0][0],
+		"numbers": frappe.db.sql(
+			f"""SELECT name, mobile_number FROM `tabWhatsApp List Recipient`
+			WHERE {condition} ORDER BY name LIMIT %(limit)s""",
+			values,
+			as_dict=True,
+		),
+	}
@@ -2,15 +2,17 @@
 
 # Copyright (c) 2022, Shridhar Patil and contributors
 # For license information, please see license.txt
-import os
 import json
 import frappe
-import magic
+from frappe import _, throw
 from frappe.model.document import Document
 from frappe.integrations.utils import make_post_request, make_request
 from frappe.desk.form.utils import get_pdf_link
 
 from frappe_whatsapp.utils import get_whatsapp_account
+from frappe_whatsapp.utils.template_payload import clear_compiled_template
+from frappe_whatsapp.utils.resumable_upload import get_header_handle
+from frappe_whatsapp.utils.template_sync import sync_templates
 
 class WhatsAppTemplates(Document):
     """Create whatsapp template."""
@@ -22,14 +24,16 @@ class WhatsAppTemplates(Document):
             self.language_code = lang_code.replace("-", "_")
 
         if self.header_type in ["IMAGE", "DOCUMENT"] and self.sample:
-            self.get_session_id()
-            self.get_media_id()
+            self.set_header_handle()
 
         # DISABLED: Auto-push to Meta on save causes errors for approved templates
         # Use 'Fetch from Meta' action or create new template in Meta Business Manager
         # if not self.is_new() and self.has_meta_changes():
         #     self.update_template()
     
+    def on_update(self):
+        clear_compiled_template(self.name)
+
     def has_meta_changes(self):
         """Check if any Meta-related fields have changed."""
         meta_fields = [
@@ -56,45 +60,13 @@ class WhatsAppTemplates(Document):
             else:
                 self.whatsapp_account = default_whatsapp_account.name
 
-    def get_session_id(self):
-        """Upload media."""
-        self.get_settings()
-        file_path = self.get_absolute_path(self.sample)
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_file(file_path)
-
-        payload = {
-            'file_length': os.path.getsize(file_path),
-            'file_type': file_type,
-            'messaging_product': 'whatsapp'
-        }
-
-        response = make_post_request(
-            f"{self._url}/{self._version}/{self._app_id}/uploads",
-            headers=self._headers,
-            data=json.loads(json.dumps(payload))
-        )
-        self._session_id = response['id']
-
-    def get_media_id(self):
+    def set_header_handle(self):
+        """Upload the header sample, unless this file was uploaded before."""
         self.get_settings()
-
-        headers = {
-                "authorization": f"OAuth {self._token}"
-            }
-        file_name = self.get_absolute_path(self.sample)
-        with open(file_name, mode='rb') as file: # b is important -> binary
-            file_content = file.read()
-
-        payload = file_content
-        response = make_post_request(
-            f"{self._url}/{self._version}/{self._session_id}",
-            headers=headers,
-            data=payload
+        self._media_id = get_header_handle(
+            self._url, self._version, self._app_id, self._token, self.get_absolute_path(self.sample)
         )
 
-        self._media_id = response['h']
-
     def get_absolute_path(self, file_name):
         if(file_name.startswith('/files/')):
             file_path = f'{frappe.utils.get_bench_path()}/sites/{frappe.utils.get_site_base_path()[2:]}/public{file_name}'
@@ -234,6 +206,7 @@ class WhatsAppTemplates(Document):
         }
 
     def on_trash(self):
+        clear_compiled_template(self.name)
         self.get_settings()
         url = f"{self._url}/{self._version}/{self._business_id}/message_templates?name={self.actual_name}"
         try:
@@ -269,121 +242,15 @@ class WhatsAppTemplates(Document):
         return header
 
 @frappe.whitelist()
-def fetch():
+def fetch(whatsapp_account=None):
     """Fetch templates from meta."""
-    """Later improve this code to pass a whatsapp account remove the js funcation so that it is called from whatsapp account doctype """
-    whatsapp_accounts = frappe.get_all('WhatsApp Account', filters={'status': 'Active'}, fields=['name', 'token', 'url', 'version', 'business_id'])
+    summary = sync_templates(whatsapp_account)
+    failed = [account for account, result in summary.items() if result is None]
+    if failed:
+        frappe.throw(_("Failed to sync templates for {0}, see Error Log").format(", ".join(failed)))
 
-    for account in whatsapp_accounts:
-        # get credentials
-        token = frappe.get_doc("WhatsApp Account", account.name).get_password("token")
-        url = account.url
-        version = account.version
-        business_id = account.business_id
-
-        headers = {"authorization": f"Bearer {token}", "content-type": "application/json"}
-
-        try:
-            response = make_request(
-                "GET",
-                f"{url}/{version}/{business_id}/message_templates",
-                headers=headers,
-            )
-
-            for template in response["data"]:
-                # set flag to insert or update
-                flags = 1
-                if frappe.db.exists("WhatsApp Templates", {"actual_name": template["name"]}):
-                    doc = frappe.get_doc("WhatsApp Templates", {"actual_name": template["name"]})
-                else:
-                    flags = 0
-                    doc = frappe.new_doc("WhatsApp Templates")
-                    doc.template_name = template["name"]
-                    doc.actual_name = template["name"]
-
-                doc.status = template["status"]
-                doc.language_code = template["language"]
-                doc.category = template["category"]
-                doc.id = template["id"]
-                doc.whatsapp_account = account.name
-
-                # update components
-                for component in template["components"]:
-
-                    # update header
-                    if component["type"] == "HEADER":
-                        doc.header_type = component["format"]
-
-                        # if format is text update sample text
-                        if component["format"] == "TEXT":
-                            doc.header = component["text"]
-                    # Update footer text
-                    elif component["type"] == "FOOTER":
-                        doc.footer = component["text"]
-
-                    # update template text
-                    elif component["type"] == "BODY":
-                        doc.template = component["text"]
-                        if component.get("example"):
-    			            # Check if 'body_text' exists before trying to access it
-                            if component["example"].get("body_text"):
-                                doc.sample_values = ",".join(
-            	                    component["example"]["body_text"][0]
-                    	        )
-
-                    # Update buttons
-                    elif component["type"] == "BUTTONS":
-                        doc.set("buttons", [])
-                        frappe.db.delete("WhatsApp Button", {"parent": doc.name, "parenttype": "WhatsApp Templates"})
-                        typeMap = {
-                            "URL": "Visit Website",
-                            "PHONE_NUMBER": "Call Phone",
-                            "QUICK_REPLY": "Quick Reply",
-                            "FLOW": "Flow"
-                        }
-
-                        for i, button in enumerate(component.get("buttons", []), start=1):
-                            btn = {}
-                            btn["button_type"] = typeMap[button["type"]]
-                            btn["button_label"] = button.get("text")
-                            btn["sequence"] = i
-
-                            if button["type"] == "URL":
-                                btn["website_url"] = button.get("url")
-                                if "{{" in btn["website_url"]:
-                                    btn["url_type"] = "Dynamic"
-                                else:
-                                    btn["url_type"] = "Static"
-
-                                if button.get("example"):
-                                    btn["example_url"] = ",".join(button["example"])
-                            elif button["type"] == "PHONE_NUMBER":
-                                btn["phone_number"] = button.get("phone_number")
-                            elif button["type"] == "FLOW":
-                                btn["flow"] = button.get("flow")
-
-                            doc.append("buttons", btn)
-
-                upsert_doc_without_hooks(doc, "WhatsApp Button", "buttons")
-
-            return "Successfully fetched templates from meta"
-
-        except Exception as e:
-            # Check if frappe.flags.integration_request is set and has a .json() method
-            if hasattr(frappe.flags.integration_request, 'json'):
-                try:
-                    res = frappe.flags.integration_request.json().get("error", {})
-                    error_message = res.get("error_user_msg", res.get("message"))
-                    frappe.throw(
-                        msg=error_message,
-                        title=res.get("error_user_title", "Error"),
-                    )
-                except (json.JSONDecodeError, KeyError):
-                    # Handle cases where the response is not valid JSON or lacks the 'error' key
-                    frappe.throw(f"An unexpected error occurred while fetching templates: {e}")
-            else:
-                # Handle cases where frappe.flags.integration_request doesn't exist or isn't a proper response object
-                frappe.throw(f"An unexpected server error occurred: {e}")
+    changed = sum(result["changed"] for result in summary.values())
+    return _("Successfully fetched templates from meta ({0} updated)").format(changed)
 
 def upsert_doc_without_hooks(doc, child_dt, child_field):
     """Insert or update a parent document and its children without hooks."""
@@ -398,3 +265,4 @@ def upsert_doc_without_hooks(doc, child_dt, child_field):
         d.parentfield = child_field
         d.db_insert()
     frappe.db.commit()
+    clear_compiled_template(doc.name)
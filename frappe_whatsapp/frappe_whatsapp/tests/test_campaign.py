@@ -0,0 +1,145 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.frappe_whatsapp.doctype.bulk_whatsapp_message.bulk_whatsapp_message import (
+    BulkWhatsAppMessage,
+)
+from frappe_whatsapp.utils import campaign
+from frappe_whatsapp.utils.campaign import get_next_recipients, queue_retries, run_campaign_chunk
+
+BULK_MODULE = "frappe_whatsapp.frappe_whatsapp.doctype.bulk_whatsapp_message.bulk_whatsapp_message"
+
+
+def make_campaign(numbers, insert=True):
+    doc = frappe.get_doc({
+        "doctype": "Bulk WhatsApp Message",
+        "title": "Test Campaign",
+        "recipient_type": "Individual",
+        "recipients": [{"mobile_number": number} for number in numbers],
+    })
+    if insert:
+        doc.insert(ignore_permissions=True)
+        # submitted without on_submit, which would start sending
+        doc.db_set({"docstatus": 1, "status": "Queued"})
+        doc.reload()
+    return doc
+
+
+class TestCampaignRunner(FrappeTestCase):
+    """Test cases for sending campaigns in checkpointed chunks."""
+
+    def tearDown(self):
+        for name in frappe.get_all("Bulk WhatsApp Message", {"title": "Test Campaign"}, pluck="name"):
+            frappe.db.delete("WhatsApp Message", {"bulk_message_reference": name})
+            frappe.db.delete("WhatsApp Recipient", {"parent": name})
+            frappe.db.delete("Bulk WhatsApp Message", {"name": name})
+        frappe.db.commit()
+
+    def test_cursor(self):
+        doc = make_campaign(["919876543210", "919876543211", "919876543212"], insert=False)
+
+        with patch.object(campaign, "CHUNK_SIZE", 2):
+            first = get_next_recipients(doc, None)
+            second = get_next_recipients(doc, first[-1][0])
+            last = get_next_recipients(doc, second[-1][0])
+
+        self.assertEqual([position for position, _recipient in first], ["1", "2"])
+        self.assertEqual([recipient.mobile_number for _position, recipient in second], ["919876543212"])
+        self.assertEqual(last, [])
+
+    def test_pause_resume_cancel(self):
+        doc = make_campaign(["919876543210"])
+
+        doc.pause()
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Paused")
+        self.assertRaises(frappe.ValidationError, doc.pause)
+
+        with patch(f"{BULK_MODULE}.start_campaign") as start_campaign:
+            doc.resume()
+        start_campaign.assert_called_once_with(doc.name)
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Queued")
+
+        doc.cancel_campaign()
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Cancelled")
+        self.assertRaises(frappe.ValidationError, doc.resume)
+
+    def test_paused_campaign_sends_nothing(self):
+        doc = make_campaign(["919876543210"])
+        doc.pause()
+
+        with patch.object(BulkWhatsAppMessage, "create_single_message") as send:
+            run_campaign_chunk(doc.name)
+        send.assert_not_called()
+
+    def test_finish(self):
+        doc = make_campaign(["919876543210", "919876543211"])
+        doc.db_set("last_recipient", "2")
+
+        run_campaign_chunk(doc.name)
+
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Completed")
+
+    def test_failing_recipient_is_skipped(self):
+        doc = make_campaign(["919876543210", "919876543211"])
+
+        with patch.object(BulkWhatsAppMessage, "create_single_message", side_effect=ValueError), \
+                patch.object(campaign, "start_campaign"):
+            run_campaign_chunk(doc.name)
+
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "last_recipient"), "2")
+        self.assertEqual(
+            frappe.db.count("WhatsApp Message", {"bulk_message_reference": doc.name, "status": "Failed"}), 2
+        )
+
+        run_campaign_chunk(doc.name)
+        self.assertEqual(frappe.db.get_value(doc.doctype, doc.name, "status"), "Partially Failed")
+
+
+class TestCampaignRetries(FrappeTestCase):
+    """Test cases for retrying failed campaign messages."""
+
+    def tearDown(self):
+        frappe.db.delete("WhatsApp Message", {"bulk_message_reference": "BULK-WA-TEST-RETRY"})
+
+    def make_failed_message(self, error_code=None):
+        message = frappe.new_doc("WhatsApp Message")
+        message.update({
+            "type": "Outgoing",
+            "to": "919876543210",
+            "status": "Failed",
+            "error_code": error_code,
+            "bulk_message_reference": "BULK-WA-TEST-RETRY",
+            "idempotency_key": frappe.generate_hash(),
+        })
+        message.set_user_and_timestamp()
+        # without hooks, which would send it
+        message.db_insert()
+        return message.name
+
+    def get_status(self, name):
+        return frappe.db.get_value("WhatsApp Message", name, "status")
+
+    def test_permanent_errors_are_skipped(self):
+        invalid_number = self.make_failed_message("131026")
+        rate_limited = self.make_failed_message("130429")
+        unknown = self.make_failed_message()
+
+        self.assertEqual(queue_retries("BULK-WA-TEST-RETRY"), 2)
+        self.assertEqual(self.get_status(invalid_number), "Failed")
+        self.assertEqual(self.get_status(rate_limited), "Retrying")
+        self.assertEqual(self.get_status(unknown), "Retrying")
+        # retries are sent under a new key
+        self.assertIsNone(frappe.db.get_value("WhatsApp Message", rate_limited, "idempotency_key"))
+
+    def test_retry_by_error_code(self):
+        rate_limited = self.make_failed_message("130429")
+        unavailable = self.make_failed_message("131016")
+
+        self.assertEqual(queue_retries("BULK-WA-TEST-RETRY", ["131016"]), 1)
+        self.assertEqual(self.get_status(rate_limited), "Failed")
+        self.assertEqual(self.get_status(unavailable), "Retrying")
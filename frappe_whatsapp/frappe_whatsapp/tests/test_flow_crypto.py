@@ -0,0 +1,92 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import base64
+import json
+import os
+from unittest.mock import patch
+
+import frappe
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.frappe_whatsapp.api.flow_endpoint import handle_encrypted_request
+from frappe_whatsapp.utils.flow_crypto import OAEP
+
+
+class TestFlowCrypto(FrappeTestCase):
+    """Round trips through the encrypted endpoint, encrypting like Meta does."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.pem = cls.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+
+    def setUp(self):
+        conf = {"whatsapp_flow_private_key": self.pem, "whatsapp_flow_log_sample_rate": 0}
+        patcher = patch.dict(frappe.conf, conf)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def encrypt_request(self, payload):
+        """Encrypt ``payload`` the way Meta does; returns the body and what decrypts the reply."""
+        aes_key = AESGCM.generate_key(bit_length=128)
+        iv = os.urandom(16)
+        body = {
+            "encrypted_aes_key": base64.b64encode(self.private_key.public_key().encrypt(aes_key, OAEP)).decode(),
+            "initial_vector": base64.b64encode(iv).decode(),
+            "encrypted_flow_data": base64.b64encode(
+                AESGCM(aes_key).encrypt(iv, json.dumps(payload).encode(), None)
+            ).decode(),
+        }
+        return body, aes_key, iv
+
+    def decrypt_response(self, response, aes_key, iv):
+        flipped_iv = bytes(b ^ 0xFF for b in iv)
+        return json.loads(AESGCM(aes_key).decrypt(flipped_iv, base64.b64decode(response.get_data()), None))
+
+    def test_ping_round_trip(self):
+        """A ping is decrypted, answered and encrypted with the flipped IV."""
+        body, aes_key, iv = self.encrypt_request({"version": "3.0", "action": "ping"})
+        response = handle_encrypted_request(body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("decrypt;dur=", response.headers["Server-Timing"])
+        self.assertEqual(self.decrypt_response(response, aes_key, iv), {"data": {"status": "active"}})
+
+    def test_tampered_request(self):
+        """Requests that don't decrypt get 421 so the client refreshes the key."""
+        body, _, _ = self.encrypt_request({"action": "ping"})
+        data = bytearray(base64.b64decode(body["encrypted_flow_data"]))
+        data[0] ^= 1
+        body["encrypted_flow_data"] = base64.b64encode(bytes(data)).decode()
+
+        self.assertEqual(handle_encrypted_request(body).status_code, 421)
+
+    def test_malformed_plaintext(self):
+        """Plaintext that isn't a JSON object gets 421 too, not a server error."""
+        for plaintext in (b"not json", b"\xff\xfe", b"[1, 2]"):
+            aes_key = AESGCM.generate_key(bit_length=128)
+            iv = os.urandom(16)
+            body = {
+                "encrypted_aes_key": base64.b64encode(self.private_key.public_key().encrypt(aes_key, OAEP)).decode(),
+                "initial_vector": base64.b64encode(iv).decode(),
+                "encrypted_flow_data": base64.b64encode(AESGCM(aes_key).encrypt(iv, plaintext, None)).decode(),
+            }
+            self.assertEqual(handle_encrypted_request(body).status_code, 421)
+
+    def test_many_requests(self):
+        """Every request decrypts and gets its own answer; timing lives in flow_crypto.benchmark."""
+        for i in range(20):
+            body, aes_key, iv = self.encrypt_request(
+                {"version": "3.0", "action": "INIT", "screen": "WELCOME", "flow_token": f"token-{i}"}
+            )
+            response = handle_encrypted_request(body)
+            self.assertEqual(self.decrypt_response(response, aes_key, iv)["screen"], "WELCOME")
@@ -0,0 +1,30 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.utils.flow_session import get_index_key, get_key, get_session, update_session
+
+
+class TestFlowSession(FrappeTestCase):
+    """Test cases for flow sessions kept in Redis."""
+
+    flow_token = "test-flow-session-token"
+
+    def tearDown(self):
+        frappe.cache().delete(get_key(self.flow_token))
+        frappe.cache().zrem(get_index_key(), self.flow_token)
+
+    def test_update_and_get_session(self):
+        update_session(self.flow_token, "WELCOME", {"name": "Asha", "tags": ["a", "b"]})
+        update_session(self.flow_token, "DETAILS", {"age": 30})
+
+        data, last_screen, last_seen = get_session(self.flow_token)
+
+        self.assertEqual(data, {"name": "Asha", "tags": ["a", "b"], "age": 30})
+        self.assertEqual(last_screen, "DETAILS")
+        self.assertTrue(last_seen)
+
+    def test_missing_session(self):
+        self.assertEqual(get_session("no-such-flow-token"), ({}, None, None))
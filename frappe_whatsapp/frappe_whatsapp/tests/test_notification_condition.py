@@ -0,0 +1,42 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.utils.condition import (
+    compile_condition,
+    evaluate_condition,
+    get_referenced_fields,
+)
+
+
+class TestNotificationCondition(FrappeTestCase):
+    """Test cases for compiled WhatsApp Notification conditions."""
+
+    def test_referenced_fields(self):
+        """Only fields read from doc are collected."""
+        self.assertEqual(
+            get_referenced_fields('doc.status == "Open" and doc.get("grand_total") > 5 and doc["customer"]'),
+            {"status", "grand_total", "customer"}
+        )
+
+    def test_whole_doc_usage(self):
+        """Passing doc around needs the full document."""
+        self.assertIsNone(get_referenced_fields("frappe.as_json(doc)"))
+        self.assertIsNone(get_referenced_fields("doc.get(fieldname)"))
+
+    def test_evaluate(self):
+        """Conditions evaluate against documents and plain dicts."""
+        doc = frappe.get_doc({"doctype": "ToDo", "description": "Test", "status": "Open"})
+        self.assertTrue(evaluate_condition('doc.status == "Open"', doc))
+        self.assertFalse(evaluate_condition('doc.status == "Closed"', doc))
+        self.assertTrue(evaluate_condition('doc.get("status") == "Open"', {"status": "Open"}))
+        self.assertTrue(evaluate_condition("", doc))
+
+    def test_compiled_once(self):
+        """The same condition is compiled only once."""
+        compile_condition.cache_clear()
+        evaluate_condition('doc.status == "Open"', {"status": "Open"})
+        evaluate_condition('doc.status == "Open"', {"status": "Closed"})
+        self.assertEqual(compile_condition.cache_info().misses, 1)
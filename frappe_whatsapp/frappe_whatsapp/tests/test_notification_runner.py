@@ -0,0 +1,24 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.utils.notification_runner import get_format_fields
+
+
+class TestNotificationRunner(FrappeTestCase):
+    """Test cases for batched notification runs."""
+
+    def test_format_fields(self):
+        """Currency parameters bring the field naming their currency."""
+        self.assertEqual(
+            get_format_fields(frappe._dict(fieldtype="Currency", options="currency")), {"currency"}
+        )
+        self.assertEqual(
+            get_format_fields(frappe._dict(fieldtype="Currency", options="Company:company:default_currency")),
+            {"company"},
+        )
+        self.assertEqual(get_format_fields(frappe._dict(fieldtype="Currency")), set())
+        self.assertEqual(get_format_fields(frappe._dict(fieldtype="Data", options="Email")), set())
+        self.assertEqual(get_format_fields(None), set())
@@ -0,0 +1,68 @@
+# Copyright (c) 2025, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from frappe_whatsapp.utils.recipient_import import import_from_file, normalize_number
+
+
+class TestRecipientImport(FrappeTestCase):
+    """Test cases for streaming recipient imports."""
+
+    def setUp(self):
+        if not frappe.db.exists("WhatsApp Recipient List", "Test Import List"):
+            frappe.get_doc({
+                "doctype": "WhatsApp Recipient List",
+                "list_name": "Test Import List"
+            }).insert(ignore_permissions=True)
+
+    def tearDown(self):
+        frappe.delete_doc("WhatsApp Recipient List", "Test Import List", force=True)
+
+    def test_normalize_number(self):
+        self.assertEqual(normalize_number("+91 98765-43210"), "+919876543210")
+        self.assertEqual(normalize_number(None), "")
+
+    def make_file(self, content):
+        file_doc = frappe.get_doc({
+            "doctype": "File",
+            "file_name": "test_recipients.csv",
+            "content": content,
+            "is_private": 1
+        }).insert(ignore_permissions=True)
+        self.addCleanup(frappe.delete_doc, "File", file_doc.name, force=True)
+        return file_doc
+
+    def test_csv_import(self):
+        """Rows are normalized, invalid and duplicate numbers skipped, columns kept as data."""
+        content = "\n".join([
+            "Phone,Name,Order No",
+            "+91 98765 43210,Asha,SO-1",
+            "919876543211,Ravi,SO-2",
+            "+91-98765-43210,Asha again,SO-3",
+            "12345,Too Short,SO-4",
+        ])
+        file_doc = self.make_file(content)
+
+        imported = import_from_file("Test Import List", file_doc.file_url, "Phone", name_column="Name")
+
+        self.assertEqual(imported, 2)
+        self.assertEqual(frappe.db.get_value("WhatsApp Recipient List", "Test Import List", "recipient_count"), 2)
+
+        recipient = frappe.get_all(
+            "WhatsApp List Recipient",
+            filters={"recipient_list": "Test Import List", "mobile_number": "+919876543210"},
+            fields=["recipient_name", "recipient_data"]
+        )[0]
+        self.assertEqual(recipient.recipient_name, "Asha")
+        self.assertEqual(json.loads(recipient.recipient_data), {"order_no": "SO-1"})
+
+    def test_reimport_skips_numbers_in_list(self):
+        file_doc = self.make_file("Phone\n919876543210\n919876543211")
+
+        self.assertEqual(import_from_file("Test Import List", file_doc.file_url, "Phone"), 2)
+        self.assertEqual(import_from_file("Test Import List", file_doc.file_url, "Phone"), 0)
+        self.assertEqual(frappe.db.get_value("WhatsApp Recipient List", "Test Import List", "recipient_count"), 2)
@@ -255,6 +255,27 @@ class TestWhatsAppFlow(FrappeTestCase):
         self.assertIn("active", field_names)
         self.assertNotIn("disabled", field_names)
 
+    def test_incremental_flow_json(self):
+        """Cached screens render the same JSON as a full generation, and edits show up."""
+        screens = [
+            {"screen_id": "screen1", "screen_title": "Screen 1", "terminal": 0},
+            {"screen_id": "screen2", "screen_title": "Screen 2", "terminal": 1}
+        ]
+        fields = [
+            {"screen": "screen1", "field_name": "name", "field_type": "TextInput", "label": "Name", "enabled": 1},
+            {"screen": "screen2", "field_name": "email", "field_type": "TextInput", "label": "Email", "enabled": 1}
+        ]
+
+        flow = self.create_test_flow("Test Incremental", screens, fields)
+        self.assertEqual(flow.flow_json, json.dumps(flow.generate_flow_json(), indent=2))
+
+        flow.fields[1].label = "Work Email"
+        flow.save(ignore_permissions=True)
+        flow_json = json.loads(flow.flow_json)
+
+        self.assertEqual(flow_json["screens"][1]["layout"]["children"][0]["label"], "Work Email")
+        self.assertEqual(flow.flow_json, flow.render_flow_json(use_cache=False))
+
     def test_validation_requires_screen(self):
         """Test that flow validation requires at least one screen."""
         with self.assertRaises(frappe.ValidationError):
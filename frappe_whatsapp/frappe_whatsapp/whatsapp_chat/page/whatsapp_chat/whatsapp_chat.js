@@ -97,6 +97,7 @@ class WhatsAppChat {
 		
 		frappe.call({
 			method: 'frappe_whatsapp.frappe_whatsapp.api.chat.get_contacts',
+			type: 'GET',
 			callback: function(r) {
 				if (r.message) {
 					me.contacts = r.message;
@@ -185,6 +186,7 @@ class WhatsAppChat {
 		// Load messages
 		frappe.call({
 			method: 'frappe_whatsapp.frappe_whatsapp.api.chat.get_messages',
+			type: 'GET',
 			args: { contact_id: contactId },
 			callback: function(r) {
 				if (r.message) {
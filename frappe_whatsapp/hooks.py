@@ -109,20 +109,25 @@ app_include_js = []
 
 scheduler_events = {
     "all": [
-        "frappe_whatsapp.utils.trigger_whatsapp_notifications_all"
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_all",
+        "frappe_whatsapp.utils.flow_session.persist_expired_sessions",
+        "frappe_whatsapp.utils.campaign.resume_stalled_campaigns",
     ],
     "hourly": [
-        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly"
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly",
+        "frappe_whatsapp.utils.notification_runner.resume_date_notifications",
     ],
     "hourly_long": [
-        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly_long"
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly_long",
+        "frappe_whatsapp.utils.template_sync.sync_templates",
     ],
     "daily": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_daily",
         "frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_notification.whatsapp_notification.trigger_notifications",
     ],
     "daily_long": [
-        "frappe_whatsapp.utils.trigger_whatsapp_notifications_daily_long"
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_daily_long",
+        "frappe_whatsapp.utils.conversation.rebuild_conversations",
     ],
     "weekly": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_weekly"
@@ -213,7 +218,10 @@ doc_events = {
         "on_update_after_submit": "frappe_whatsapp.utils.run_server_script_for_doc_event"
     },
     "WhatsApp Message": {
-        "after_insert": "frappe_whatsapp.frappe_whatsapp.api.message.last_message"
+        "after_insert": [
+            "frappe_whatsapp.frappe_whatsapp.api.message.last_message",
+            "frappe_whatsapp.utils.conversation.on_message_insert",
+        ]
     },
     "CRM Lead": {
         "validate": "frappe_whatsapp.utils.crm_integration.link_whatsapp_contact_to_lead"
@@ -0,0 +1,8 @@
+import frappe
+
+from frappe_whatsapp.utils.conversation import rebuild_conversations
+
+
+def execute():
+    frappe.reload_doc("frappe_whatsapp", "doctype", "whatsapp_conversation")
+    rebuild_conversations()
@@ -0,0 +1,8 @@
+import frappe
+
+from frappe_whatsapp.utils.flow_response import backfill_flow_responses
+
+
+def execute():
+    frappe.reload_doc("frappe_whatsapp", "doctype", "whatsapp_flow_response")
+    backfill_flow_responses()
@@ -0,0 +1,26 @@
+import frappe
+
+
+def execute():
+    """Move recipients of WhatsApp Recipient Lists out of the child table."""
+    frappe.reload_doc("frappe_whatsapp", "doctype", "whatsapp_list_recipient")
+    frappe.reload_doc("frappe_whatsapp", "doctype", "whatsapp_recipient_list")
+
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabWhatsApp List Recipient`
+            (name, creation, modified, owner, modified_by, docstatus,
+            recipient_list, mobile_number, recipient_name, recipient_data)
+        SELECT name, creation, modified, owner, modified_by, 0,
+            parent, REGEXP_REPLACE(mobile_number, '[^0-9+]', ''), recipient_name, recipient_data
+        FROM `tabWhatsApp Recipient`
+        WHERE parenttype = 'WhatsApp Recipient List'
+            AND REGEXP_REPLACE(mobile_number, '[^0-9+]', '') != ''
+    """)
+    frappe.db.delete("WhatsApp Recipient", {"parenttype": "WhatsApp Recipient List"})
+
+    frappe.db.sql("""
+        UPDATE `tabWhatsApp Recipient List` l
+        SET recipient_count = (
+            SELECT COUNT(*) FROM `tabWhatsApp List Recipient` r WHERE r.recipient_list = l.name
+        )
+    """)
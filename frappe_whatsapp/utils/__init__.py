@@ -3,6 +3,8 @@ import frappe
 
 from frappe.core.doctype.server_script.server_script_utils import EVENT_MAP
 
+DELETE_EVENTS = ("Before Delete", "After Delete")
+
 
 def run_server_script_for_doc_event(doc, event):
     """Run on each event."""
@@ -23,12 +25,40 @@ def run_server_script_for_doc_event(doc, event):
     ).get(EVENT_MAP[event], None)
 
     if notification:
-        # run all scripts for this doctype + event
+        # queue all notifications for this doctype + event
         for notification_name in notification:
-            frappe.get_doc(
-                "WhatsApp Notification",
-                notification_name
-            ).send_template_message(doc)
+            queue_doc_event_notification(notification_name, doc, EVENT_MAP[event])
+
+
+def queue_doc_event_notification(notification_name, doc, event):
+    """Send a doc event notification in the background once the transaction commits.
+
+    Nothing is sent if the transaction rolls back, and the document save does
+    not wait on the Graph API. Deleted documents are sent from a snapshot.
+    """
+    snapshot = doc.as_dict() if event in DELETE_EVENTS else None
+    # the version that raised this event, so each committed change sends once
+    modified = str(doc.modified)
+
+    def enqueue():
+        frappe.enqueue(
+            "frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_notification.whatsapp_notification.send_doc_event_notification",
+            queue=get_notification_queue(),
+            notification=notification_name,
+            reference_doctype=doc.doctype,
+            reference_name=doc.name,
+            doc_event=event,
+            snapshot=snapshot,
+            modified=modified,
+        )
+
+    # the name of a new document is only known once it has been inserted
+    frappe.db.after_commit.add(enqueue)
+
+
+def get_notification_queue():
+    """RQ queue for WhatsApp Notifications, set ``whatsapp_notification_queue`` in site config."""
+    return frappe.conf.get("whatsapp_notification_queue") or "default"
 
 
 def get_notifications_map():
@@ -107,19 +137,9 @@ def trigger_whatsapp_notifications_monthly_long():
 
 def trigger_whatsapp_notifications(event):
     """Run cron."""
-    wa_notify_list = frappe.get_list(
-        "WhatsApp Notification",
-        filters={
-            "event_frequency": event,
-            "disabled": 0,
-        }
-    )
+    from frappe_whatsapp.utils.notification_runner import queue_scheduled_notifications
 
-    for wa in wa_notify_list:
-        frappe.get_doc(
-            "WhatsApp Notification",
-            wa.name,
-        ).send_scheduled_message()
+    queue_scheduled_notifications(event)
 
 def get_whatsapp_account(phone_id=None, account_type='incoming'):
     """map whatsapp account with message"""
@@ -1,7 +1,10 @@
 import json
 import frappe
+from frappe import _
 from frappe.utils import cint
 
+from frappe_whatsapp.utils.recipient_import import enqueue_import_from_file, get_file_path, get_header
+
 
 @frappe.whitelist()
 def get_progress(name):
@@ -10,15 +13,36 @@ def get_progress(name):
     return doc.get_progress()
 
 @frappe.whitelist()
-def retry_failed(name):
-    """Retry failed messages"""
+def retry_failed(name, error_codes=None):
+    """Retry failed messages, optionally only those with the given error codes"""
+    if error_codes and isinstance(error_codes, str) and error_codes.startswith("["):
+        error_codes = json.loads(error_codes)
+
     doc = frappe.get_doc("Bulk WhatsApp Message", name)
-    doc.retry_failed()
+    doc.check_permission("submit")
+    return doc.retry_failed(error_codes)
+
+@frappe.whitelist()
+def pause_campaign(name):
+    """Stop sending a bulk message after its current chunk"""
+    frappe.get_doc("Bulk WhatsApp Message", name).pause()
+    return True
+
+@frappe.whitelist()
+def resume_campaign(name):
+    """Continue sending a paused bulk message from its last recipient"""
+    frappe.get_doc("Bulk WhatsApp Message", name).resume()
+    return True
+
+@frappe.whitelist()
+def cancel_campaign(name):
+    """Stop sending a bulk message for good"""
+    frappe.get_doc("Bulk WhatsApp Message", name).cancel_campaign()
     return True
 
 @frappe.whitelist()
 def import_recipients(list_name, doctype, mobile_field, name_field=None, filters=None, limit=None, data_fields=None):
-    """Import recipients from a DocType"""
+    """Start importing recipients from a DocType in the background"""
     if filters and isinstance(filters, str):
         filters = json.loads(filters)
 
@@ -26,10 +50,38 @@ def import_recipients(list_name, doctype, mobile_field, name_field=None, filters
         data_fields = json.loads(data_fields)
         
     doc = frappe.get_doc("WhatsApp Recipient List", list_name)
-    count = doc.import_list_from_doctype(doctype, mobile_field, name_field, filters, limit, data_fields)
-    doc.save()
+    doc.check_permission("write")
+    doc.import_list_from_doctype(doctype, mobile_field, name_field, filters, limit, data_fields)
     
-    return count
+    return True
+
+@frappe.whitelist()
+def get_file_columns(file_url):
+    """Column names in the first row of an uploaded CSV or XLSX file"""
+    return [column for column in get_header(get_file_path(file_url)) if column]
+
+@frappe.whitelist()
+def import_recipients_from_file(list_name, file_url, mobile_column, name_column=None, data_columns=None, replace=0):
+    """Start importing recipients from a CSV or XLSX file in the background"""
+    frappe.has_permission("WhatsApp Recipient List", "write", list_name, throw=True)
+
+    if data_columns and isinstance(data_columns, str):
+        data_columns = json.loads(data_columns)
+
+    header = get_header(get_file_path(file_url))
+    for column in [mobile_column, name_column, *(data_columns or [])]:
+        if column and column not in header:
+            frappe.throw(_("Column {0} not found in the file").format(column))
+
+    enqueue_import_from_file(
+        list_name,
+        file_url=file_url,
+        mobile_column=mobile_column,
+        name_column=name_column,
+        data_columns=data_columns,
+        replace=cint(replace),
+    )
+    return True
 
 @frappe.whitelist()
 def schedule_bulk_messages():
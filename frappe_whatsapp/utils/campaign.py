@@ -0,0 +1,201 @@
+"""Campaign dispatcher for Bulk WhatsApp Messages.
+
+A campaign is sent by a chain of jobs, each handling one chunk of recipients
+in order: recipient list members by name, individual recipients by row
+index. The position of every sent recipient is saved as ``last_recipient``
+and the status is read again between chunks, so Pause and Cancel take
+effect within one chunk and a resumed or restarted campaign continues right
+after the last recipient sent. Sends are paced to ``whatsapp_campaign_rate``
+messages per second per campaign.
+
+Failed messages are retried through the same jobs: :func:`queue_retries`
+marks them ``Retrying`` in one update and, once the recipients are done,
+chunks of them are sent again at the same pace.
+"""
+import time
+
+import frappe
+from frappe.utils import cint
+
+from frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_recipient_list.whatsapp_recipient_list import iter_recipients
+
+
+CHUNK_SIZE = 100
+DEFAULT_RATE = 20
+# a campaign without a heartbeat for this long has lost its job
+STALL_AFTER = 15 * 60
+ACTIVE_STATUSES = ("Queued", "In Progress")
+# Graph API errors that fail again however often they are retried
+PERMANENT_ERROR_CODES = (
+	"100",  # invalid parameter
+	"131008",  # required parameter missing
+	"131009",  # parameter value invalid
+	"131021",  # recipient is the sender
+	"131026",  # undeliverable, e.g. not a WhatsApp number
+	"131030",  # recipient not in allowed list
+	"131050",  # recipient stopped marketing messages
+	"131051",  # unsupported message type
+	"132000",  # template parameter count mismatch
+	"132001",  # template does not exist
+	"132012",  # template parameter format mismatch
+)
+RETRY_FIELDS = [
+	"to", "type", "message_type", "content_type", "use_template", "template",
+	"body_param", "attach", "whatsapp_account",
+]
+
+
+def get_key(prefix, name):
+	return frappe.cache().make_key(f"whatsapp_campaign_{prefix}:{name}")
+
+
+def beat(name):
+	frappe.cache().set(get_key("heartbeat", name), 1, ex=STALL_AFTER)
+
+
+def is_running(name):
+	return bool(frappe.cache().get(get_key("heartbeat", name)))
+
+
+def start_campaign(name):
+	beat(name)
+	frappe.enqueue(
+		"frappe_whatsapp.utils.campaign.run_campaign_chunk",
+		queue="long",
+		timeout=4000,
+		enqueue_after_commit=True,
+		name=name,
+	)
+
+
+def get_send_interval():
+	return 1 / max(float(frappe.conf.get("whatsapp_campaign_rate") or DEFAULT_RATE), 0.01)
+
+
+def get_next_recipients(doc, cursor):
+	"""The chunk of recipients after ``cursor``, with each one's position."""
+	if doc.recipient_type == "Recipient List" and doc.recipient_list:
+		recipients = next(iter_recipients(doc.recipient_list, page_length=CHUNK_SIZE, after=cursor or ""), [])
+		return [(r.name, r) for r in recipients]
+
+	after = cint(cursor)
+	return [(str(r.idx), r) for r in doc.recipients if r.idx > after][:CHUNK_SIZE]
+
+
+def run_campaign_chunk(name):
+	"""Send the next chunk of a campaign and queue the one after it."""
+	lock = get_key("lock", name)
+	if not frappe.cache().set(lock, 1, nx=True, ex=STALL_AFTER):
+		# another job of this campaign is running
+		return
+
+	proceed = False
+	try:
+		doc = frappe.get_doc("Bulk WhatsApp Message", name)
+		if doc.docstatus != 1 or doc.status not in ACTIVE_STATUSES:
+			return
+
+		beat(name)
+		chunk = get_next_recipients(doc, doc.last_recipient)
+		send = doc.create_single_message
+		if not chunk:
+			chunk = [(None, message) for message in get_retry_chunk(name)]
+			send = doc.retry_message
+		if not chunk:
+			finish_campaign(doc)
+			return
+
+		if doc.status != "In Progress":
+			doc.db_set("status", "In Progress")
+			frappe.db.commit()
+
+		interval = get_send_interval()
+		for position, recipient in chunk:
+			started = time.monotonic()
+			try:
+				send(recipient)
+			except Exception:
+				# skip it rather than stall the campaign on it forever
+				frappe.db.rollback()
+				frappe.log_error(title=f"Bulk WhatsApp Message: {name}", message=frappe.get_traceback())
+				skip_recipient(doc, position, recipient)
+			if position:
+				doc.db_set("last_recipient", position, update_modified=False)
+			frappe.db.commit()
+			time.sleep(max(0, interval - (time.monotonic() - started)))
+
+		proceed = frappe.db.get_value("Bulk WhatsApp Message", name, "status") in ACTIVE_STATUSES
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title=f"Bulk WhatsApp Message: {name}", message=frappe.get_traceback())
+	finally:
+		# before the next job is queued, or it could find the lock still held
+		frappe.cache().delete(lock)
+
+	if proceed:
+		start_campaign(name)
+		frappe.db.commit()
+
+
+def skip_recipient(doc, position, recipient):
+	"""Record a recipient whose send raised as failed, so the cursor can move on."""
+	try:
+		if position:
+			doc.record_failed_recipient(recipient)
+		else:
+			# a retry: back to Failed, retried again only if asked to
+			frappe.db.set_value("WhatsApp Message", recipient.name, "status", "Failed", update_modified=False)
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title=f"Bulk WhatsApp Message: {doc.name}", message=frappe.get_traceback())
+
+
+def finish_campaign(doc):
+	failed = frappe.db.count("WhatsApp Message", {"bulk_message_reference": doc.name, "status": "Failed"})
+	doc.db_set("status", "Partially Failed" if failed else "Completed")
+	frappe.db.commit()
+
+
+def get_retry_chunk(name):
+	return frappe.get_all(
+		"WhatsApp Message",
+		filters={"bulk_message_reference": name, "status": "Retrying"},
+		fields=["name", *RETRY_FIELDS],
+		order_by="name asc",
+		limit=CHUNK_SIZE,
+	)
+
+
+def queue_retries(name, error_codes=None):
+	"""Mark failed messages of a campaign for its sending job to retry, and
+	return how many there are. Permanent errors are never retried; messages
+	that failed without an error code are, unless ``error_codes`` is given."""
+	conditions = ["IFNULL(error_code, '') NOT IN %(permanent)s"]
+	values = {"name": name, "permanent": PERMANENT_ERROR_CODES}
+	if error_codes:
+		if isinstance(error_codes, str):
+			error_codes = [code.strip() for code in error_codes.split(",")]
+		conditions.append("error_code IN %(error_codes)s")
+		values["error_codes"] = tuple(str(code) for code in error_codes)
+
+	frappe.db.sql(
+		f"""
+		UPDATE `tabWhatsApp Message`
+		SET status = 'Retrying', idempotency_key = NULL
+		WHERE bulk_message_reference = %(name)s AND status = 'Failed' AND {" AND ".join(conditions)}
+		""",
+		values,
+	)
+	return frappe.db.count("WhatsApp Message", {"bulk_message_reference": name, "status": "Retrying"})
+
+
+def resume_stalled_campaigns():
+	"""Restart campaigns whose job chain was lost, e.g. to a worker restart."""
+	for name in frappe.get_all(
+		"Bulk WhatsApp Message",
+		filters={"docstatus": 1, "status": ("in", ACTIVE_STATUSES)},
+		pluck="name",
+	):
+		if not is_running(name):
+			start_campaign(name)
@@ -0,0 +1,166 @@
+"""Notification conditions.
+
+Conditions are compiled once per distinct source string and cached for the
+life of the worker, so editing a notification's condition naturally yields
+a new cache entry. Only the fields a condition reads from ``doc`` are
+handed to it; conditions that use ``doc`` in any other way get the full
+document dict as before.
+
+Run ``bench --site <site> execute frappe_whatsapp.utils.condition.benchmark
+--kwargs '{"condition": "doc.grand_total > 1000", "doctype": "Sales Invoice"}'``
+to compare against plain ``frappe.safe_eval``.
+"""
+import ast
+import functools
+import time
+import unicodedata
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils.safe_exec import get_safe_globals
+
+try:
+	from RestrictedPython import compile_restricted
+	from frappe.utils.safe_exec import (
+		WHITELISTED_SAFE_EVAL_GLOBALS,
+		FrappeTransformer,
+		_validate_safe_eval_syntax,
+	)
+except ImportError:
+	# older frappe: evaluate through safe_eval, still with narrowed fields
+	compile_restricted = None
+
+
+CACHE_SIZE = 512
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_condition(condition):
+	"""Return ``(code, fields)`` for a condition.
+
+	``code`` is None when conditions can't be precompiled on this version of
+	frappe. ``fields`` is None when the condition needs the whole document.
+	"""
+	condition = unicodedata.normalize("NFKC", condition)
+	fields = get_referenced_fields(condition)
+
+	if not compile_restricted:
+		return None, fields
+
+	_validate_safe_eval_syntax(condition)
+	code = compile_restricted(
+		condition, filename="<whatsapp_notification_condition>", policy=FrappeTransformer, mode="eval"
+	)
+	return code, fields
+
+
+def get_referenced_fields(condition, name="doc"):
+	"""Fields read as ``doc.field``, ``doc["field"]`` or ``doc.get("field")``.
+
+	Returns None if ``doc`` is used any other way, e.g. passed to a function.
+	"""
+	try:
+		tree = ast.parse(condition, mode="eval")
+	except SyntaxError:
+		return None
+
+	parents = {}
+	for node in ast.walk(tree):
+		for child in ast.iter_child_nodes(node):
+			parents[child] = node
+
+	fields = set()
+	for node in ast.walk(tree):
+		if not (isinstance(node, ast.Name) and node.id == name):
+			continue
+
+		parent = parents.get(node)
+		if isinstance(parent, ast.Attribute):
+			if parent.attr != "get":
+				fields.add(parent.attr)
+				continue
+
+			call = parents.get(parent)
+			if (
+				isinstance(call, ast.Call)
+				and call.func is parent
+				and call.args
+				and isinstance(call.args[0], ast.Constant)
+				and isinstance(call.args[0].value, str)
+			):
+				fields.add(call.args[0].value)
+				continue
+		elif (
+			isinstance(parent, ast.Subscript)
+			and isinstance(parent.slice, ast.Constant)
+			and isinstance(parent.slice.value, str)
+		):
+			fields.add(parent.slice.value)
+			continue
+
+		return None
+
+	return fields
+
+
+def get_condition_context(doc, fields):
+	"""The ``doc`` a condition sees: only ``fields``, or the full dict."""
+	if fields is None:
+		return doc.as_dict() if isinstance(doc, Document) else frappe._dict(doc)
+
+	context = frappe._dict()
+	for fieldname in fields:
+		value = doc.get(fieldname)
+		if isinstance(value, list):
+			value = [d.as_dict() if isinstance(d, Document) else d for d in value]
+		context[fieldname] = value
+	return context
+
+
+def get_eval_globals():
+	"""Safe globals, built once per request or job."""
+	if not getattr(frappe.local, "whatsapp_condition_globals", None):
+		eval_globals = get_safe_globals()
+		if compile_restricted:
+			eval_globals["__builtins__"] = {}
+			eval_globals.update(WHITELISTED_SAFE_EVAL_GLOBALS)
+		frappe.local.whatsapp_condition_globals = eval_globals
+	return frappe.local.whatsapp_condition_globals
+
+
+def evaluate_condition(condition, doc):
+	"""Evaluate a notification condition against ``doc``."""
+	if not condition:
+		return True
+
+	code, fields = compile_condition(condition)
+	context = {"doc": get_condition_context(doc, fields)}
+
+	if code is None:
+		return frappe.safe_eval(condition, get_safe_globals(), context)
+
+	return eval(code, get_eval_globals(), context)
+
+
+def benchmark(condition, doctype, name=None, iterations=10000):
+	"""Evaluations per second of ``condition``, uncached vs compiled."""
+	iterations = int(iterations)
+	doc = frappe.get_doc(doctype, name or frappe.db.get_value(doctype, {}, "name"))
+
+	start = time.perf_counter()
+	for _ in range(iterations):
+		frappe.safe_eval(condition, get_safe_globals(), {"doc": doc.as_dict()})
+	safe_eval_time = time.perf_counter() - start
+
+	compile_condition.cache_clear()
+	start = time.perf_counter()
+	for _ in range(iterations):
+		evaluate_condition(condition, doc)
+	compiled_time = time.perf_counter() - start
+
+	return {
+		"iterations": iterations,
+		"fields": sorted(compile_condition(condition)[1] or []),
+		"safe_eval_per_sec": round(iterations / safe_eval_time),
+		"compiled_per_sec": round(iterations / compiled_time),
+	}
@@ -0,0 +1,268 @@
+"""Conversation state.
+
+Single writer for ``WhatsApp Conversation``, the narrow inbox table that
+holds one row per WhatsApp Contact. Nothing else should write to it. Its
+counters are mirrored onto the legacy WhatsApp Contact fields as they change.
+"""
+import frappe
+
+from frappe_whatsapp.utils import inbox_index
+from frappe_whatsapp.utils.sync import publish_sync
+
+
+PREVIEW_LENGTH = 500
+READ_STATUSES = ("Read", "marked as read")
+
+
+def on_message_insert(doc, method=None):
+	"""Doc event: fold a new WhatsApp Message into its conversation."""
+	record_message(doc)
+
+
+def record_message(message):
+	"""Upsert the conversation row for ``message`` in a single statement."""
+	if not message.whatsapp_contact:
+		return
+
+	preview = message.message or message.attach or ""
+
+	# MariaDB applies ON DUPLICATE KEY assignments left to right, so the
+	# last_message_time comparison must come last.
+	frappe.db.sql(
+		"""
+		INSERT INTO `tabWhatsApp Conversation`
+			(name, whatsapp_contact, whatsapp_account, assigned_to,
+			last_message, last_message_type, last_message_time, last_message_preview,
+			unread_count, total_messages,
+			creation, modified, owner, modified_by, docstatus, idx)
+		VALUES
+			(%(contact)s, %(contact)s, %(account)s,
+			(SELECT email FROM `tabWhatsApp Contact` WHERE name = %(contact)s),
+			%(message)s, %(type)s, %(time)s, %(preview)s,
+			%(unread)s, 1,
+			%(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0)
+		ON DUPLICATE KEY UPDATE
+			unread_count = unread_count + VALUES(unread_count),
+			total_messages = total_messages + 1,
+			modified = VALUES(modified),
+			whatsapp_account = IF(last_message_time IS NULL OR VALUES(last_message_time) >= last_message_time,
+				IFNULL(VALUES(whatsapp_account), whatsapp_account), whatsapp_account),
+			last_message = IF(last_message_time IS NULL OR VALUES(last_message_time) >= last_message_time,
+				VALUES(last_message), last_message),
+			last_message_type = IF(last_message_time IS NULL OR VALUES(last_message_time) >= last_message_time,
+				VALUES(last_message_type), last_message_type),
+			last_message_preview = IF(last_message_time IS NULL OR VALUES(last_message_time) >= last_message_time,
+				VALUES(last_message_preview), last_message_preview),
+			last_message_time = GREATEST(IFNULL(last_message_time, VALUES(last_message_time)), VALUES(last_message_time))
+		""",
+		{
+			"contact": message.whatsapp_contact,
+			"account": message.whatsapp_account,
+			"message": message.name,
+			"type": message.type,
+			"time": message.creation,
+			"preview": preview[:PREVIEW_LENGTH],
+			"unread": 1 if message.type == "Incoming" else 0,
+			"now": frappe.utils.now(),
+		},
+	)
+
+	state = frappe.db.get_value(
+		"WhatsApp Conversation",
+		message.whatsapp_contact,
+		["whatsapp_account", "assigned_to", "last_message_time"],
+		as_dict=True,
+	)
+	if state:
+		inbox_index.touch(message.whatsapp_contact, state.whatsapp_account, state.assigned_to, state.last_message_time)
+
+	refresh_contact_fields(message.whatsapp_contact)
+	publish_sync(message.whatsapp_contact, message.modified, message.name)
+
+
+def ensure_conversation(contact):
+	"""Create an empty conversation row so new contacts show up in the inbox."""
+	frappe.db.sql(
+		"""
+		INSERT IGNORE INTO `tabWhatsApp Conversation`
+			(name, whatsapp_contact, whatsapp_account, assigned_to, last_message_time,
+			unread_count, total_messages,
+			creation, modified, owner, modified_by, docstatus, idx)
+		VALUES
+			(%(contact)s, %(contact)s, %(account)s, %(assigned_to)s, %(time)s,
+			0, 0,
+			%(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0)
+		""",
+		{
+			"contact": contact.name,
+			"account": contact.whatsapp_account,
+			"assigned_to": contact.email,
+			"time": contact.last_message_date or contact.creation,
+			"now": frappe.utils.now(),
+		},
+	)
+	inbox_index.touch(contact.name, contact.whatsapp_account, contact.email, contact.last_message_date or contact.creation)
+
+
+def set_assignee(contact, assigned_to):
+	"""Keep the conversation assignee in step with the contact."""
+	state = frappe.db.get_value(
+		"WhatsApp Conversation", contact, ["assigned_to", "last_message_time"], as_dict=True
+	)
+	if not state:
+		return
+
+	frappe.db.sql(
+		"""
+		UPDATE `tabWhatsApp Conversation`
+		SET assigned_to = %(assigned_to)s, modified = %(now)s
+		WHERE name = %(contact)s
+		""",
+		{"contact": contact, "assigned_to": assigned_to or None, "now": frappe.utils.now()},
+	)
+	inbox_index.reassign(contact, state.assigned_to, assigned_to, state.last_message_time)
+
+
+def touch_conversation(contact):
+	"""Bump the conversation so chat clients sync an edit of its contact."""
+	now = frappe.utils.now()
+	frappe.db.sql(
+		"""
+		UPDATE `tabWhatsApp Conversation`
+		SET modified = %(now)s
+		WHERE name = %(contact)s
+		""",
+		{"contact": contact, "now": now},
+	)
+	publish_sync(contact, now, "")
+
+
+def remove_conversation(contact):
+	"""Drop the conversation of a deleted contact."""
+	state = frappe.db.get_value(
+		"WhatsApp Conversation", contact, ["whatsapp_account", "assigned_to"], as_dict=True
+	)
+	if not state:
+		return
+
+	frappe.db.delete("WhatsApp Conversation", {"name": contact})
+	inbox_index.remove(contact, state.whatsapp_account, state.assigned_to)
+
+
+def mark_read(contact):
+	"""Clear the unread counter and flag the contact's inbound messages read."""
+	now = frappe.utils.now()
+	frappe.db.sql(
+		"""
+		UPDATE `tabWhatsApp Conversation`
+		SET unread_count = 0, modified = %(now)s
+		WHERE name = %(contact)s
+		""",
+		{"contact": contact, "now": now},
+	)
+	frappe.db.sql(
+		"""
+		UPDATE `tabWhatsApp Message`
+		SET status = 'Read', modified = %(now)s
+		WHERE whatsapp_contact = %(contact)s
+			AND type = 'Incoming'
+			AND IFNULL(status, '') NOT IN %(read_statuses)s
+		""",
+		{"contact": contact, "read_statuses": READ_STATUSES, "now": now},
+	)
+	refresh_contact_fields(contact)
+	publish_sync(contact, now, "")
+
+
+def refresh_contact_fields(contact=None):
+	"""Copy inbox state to the legacy WhatsApp Contact fields read by the desk
+	form and chat widget; every contact's when ``contact`` is not given."""
+	frappe.db.sql(
+		f"""
+		UPDATE `tabWhatsApp Contact` wc
+		INNER JOIN `tabWhatsApp Conversation` c ON c.name = wc.name
+		SET
+			wc.last_message = c.last_message_preview,
+			wc.last_message_date = c.last_message_time,
+			wc.unread_count = c.unread_count,
+			wc.total_messages = c.total_messages,
+			wc.is_read = (c.unread_count = 0)
+		{"WHERE wc.name = %(contact)s" if contact else ""}
+		""",
+		{"contact": contact},
+	)
+
+
+def rebuild_conversations():
+	"""Reconcile every conversation from WhatsApp Message in bulk."""
+	now = frappe.utils.now()
+
+	frappe.db.sql(
+		"""
+		INSERT INTO `tabWhatsApp Conversation`
+			(name, whatsapp_contact, whatsapp_account, assigned_to,
+			last_message, last_message_type, last_message_time, last_message_preview,
+			unread_count, total_messages,
+			creation, modified, owner, modified_by, docstatus, idx)
+		SELECT
+			m.whatsapp_contact, m.whatsapp_contact, m.whatsapp_account, wc.email,
+			m.name, m.type, m.creation, LEFT(COALESCE(m.message, m.attach, ''), %(preview_length)s),
+			stats.unread_count, stats.total_messages,
+			%(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0
+		FROM (
+			SELECT
+				whatsapp_contact,
+				MAX(creation) AS last_message_time,
+				COUNT(*) AS total_messages,
+				SUM(type = 'Incoming' AND IFNULL(status, '') NOT IN %(read_statuses)s) AS unread_count
+			FROM `tabWhatsApp Message`
+			WHERE IFNULL(whatsapp_contact, '') != ''
+			GROUP BY whatsapp_contact
+		) stats
+		INNER JOIN `tabWhatsApp Message` m
+			ON m.whatsapp_contact = stats.whatsapp_contact
+			AND m.creation = stats.last_message_time
+		INNER JOIN `tabWhatsApp Contact` wc ON wc.name = stats.whatsapp_contact
+		ON DUPLICATE KEY UPDATE
+			whatsapp_account = VALUES(whatsapp_account),
+			assigned_to = VALUES(assigned_to),
+			last_message = VALUES(last_message),
+			last_message_type = VALUES(last_message_type),
+			last_message_time = VALUES(last_message_time),
+			last_message_preview = VALUES(last_message_preview),
+			unread_count = VALUES(unread_count),
+			total_messages = VALUES(total_messages),
+			modified = VALUES(modified)
+		""",
+		{"now": now, "preview_length": PREVIEW_LENGTH, "read_statuses": READ_STATUSES},
+	)
+
+	# Contacts that have never exchanged a message
+	frappe.db.sql(
+		"""
+		INSERT IGNORE INTO `tabWhatsApp Conversation`
+			(name, whatsapp_contact, whatsapp_account, assigned_to, last_message_time,
+			unread_count, total_messages,
+			creation, modified, owner, modified_by, docstatus, idx)
+		SELECT
+			wc.name, wc.name, wc.whatsapp_account, wc.email, IFNULL(wc.last_message_date, wc.creation),
+			0, 0,
+			%(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0
+		FROM `tabWhatsApp Contact` wc
+		""",
+		{"now": now},
+	)
+
+	# Orphans left behind by deleted or renamed contacts
+	frappe.db.sql(
+		"""
+		DELETE c FROM `tabWhatsApp Conversation` c
+		LEFT JOIN `tabWhatsApp Contact` wc ON wc.name = c.whatsapp_contact
+		WHERE wc.name IS NULL
+		"""
+	)
+
+	refresh_contact_fields()
+
+	frappe.db.commit()
+	inbox_index.rebuild_inbox_index()
@@ -0,0 +1,99 @@
+"""Pre-rendered document prints for notification attachments.
+
+PDFs are rendered once per (doctype, name, print format, modified) in the
+background job that sends the notification and kept as a private File on
+the document. They are then uploaded to Meta as media, and the media id is
+cached per account, so Meta never has to fetch a print from our web workers.
+"""
+import hashlib
+
+import frappe
+import requests
+
+
+MEDIA_ID_TTL = 25 * 24 * 60 * 60  # Meta keeps uploaded media for 30 days
+FILE_PREFIX = "whatsapp-print-"
+
+
+def get_print_format(doctype):
+	"""Default print format of a doctype, property setters included."""
+	return frappe.get_meta(doctype).default_print_format or "Standard"
+
+
+def get_print_key(doctype, name, print_format):
+	modified = frappe.db.get_value(doctype, name, "modified")
+	return hashlib.sha1(f"{doctype}|{name}|{print_format}|{modified}".encode()).hexdigest()[:20]
+
+
+def get_document_pdf(doctype, name, print_format=None, key=None):
+	"""Return the File of the current print of a document, rendering it if needed."""
+	print_format = print_format or get_print_format(doctype)
+	file_name = f"{FILE_PREFIX}{key or get_print_key(doctype, name, print_format)}.pdf"
+
+	existing = frappe.db.get_value(
+		"File",
+		{"attached_to_doctype": doctype, "attached_to_name": name, "file_name": file_name},
+		"name",
+	)
+	if existing:
+		return frappe.get_doc("File", existing)
+
+	pdf = frappe.get_print(doctype, name, print_format, as_pdf=True)
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": file_name,
+		"attached_to_doctype": doctype,
+		"attached_to_name": name,
+		"is_private": 1,
+		"content": pdf,
+	}).insert(ignore_permissions=True)
+
+	# prints of earlier revisions are never sent again
+	for stale in frappe.get_all(
+		"File",
+		filters={
+			"attached_to_doctype": doctype,
+			"attached_to_name": name,
+			"file_name": ("like", f"{FILE_PREFIX}%.pdf"),
+			"name": ("!=", file_doc.name),
+		},
+		pluck="name",
+	):
+		frappe.delete_doc("File", stale, ignore_permissions=True)
+
+	return file_doc
+
+
+def get_document_media_id(doctype, name, whatsapp_account, print_format=None):
+	"""Media id of a document's current print on ``whatsapp_account``."""
+	print_format = print_format or get_print_format(doctype)
+	key = get_print_key(doctype, name, print_format)
+	cache_key = f"whatsapp_print_media:{whatsapp_account}:{key}"
+
+	media_id = frappe.cache().get_value(cache_key)
+	if media_id:
+		return media_id
+
+	file_doc = get_document_pdf(doctype, name, print_format, key)
+	media_id = upload_media(whatsapp_account, f"{name}.pdf", file_doc.get_content(), "application/pdf")
+	frappe.cache().set_value(cache_key, media_id, expires_in_sec=MEDIA_ID_TTL)
+	return media_id
+
+
+def upload_media(whatsapp_account, filename, content, content_type):
+	"""Upload a file to Meta and return its media id."""
+	account = frappe.get_doc("WhatsApp Account", whatsapp_account)
+	token = account.get_password("token")
+
+	response = requests.post(
+		f"{account.url}/{account.version}/{account.phone_id}/media",
+		headers={"Authorization": f"Bearer {token}"},
+		files={
+			"file": (filename, content, content_type),
+			"messaging_product": (None, "whatsapp"),
+			"type": (None, content_type),
+		},
+		timeout=60,
+	)
+	response.raise_for_status()
+	return response.json()["id"]
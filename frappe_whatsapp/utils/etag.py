@@ -0,0 +1,41 @@
+"""Conditional responses for read endpoints.
+
+Read endpoints compute a cheap version token for what they would return
+(typically ``MAX(modified)`` and ``COUNT(*)`` over their scope). The token
+becomes a weak ETag: a matching ``If-None-Match`` gets a 304, and otherwise
+the serialized body is served from a short-lived cache keyed by the ETag,
+so identical polls never re-run the full query or re-serialize.
+"""
+import hashlib
+import frappe
+from werkzeug.wrappers import Response
+
+
+RESPONSE_CACHE_TTL = 30
+
+
+def make_etag(scope, version):
+	digest = hashlib.sha1(frappe.as_json([scope, version], indent=None).encode()).hexdigest()
+	return f'W/"{digest}"'
+
+
+def conditional_response(scope, version, build, ttl=RESPONSE_CACHE_TTL):
+	"""Return ``build()`` as a JSON response, or a 304 if the client is current.
+
+	``scope`` identifies the endpoint and its arguments, ``version`` is the
+	token that changes whenever the result would.
+	"""
+	etag = make_etag(scope, version)
+	headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+	if_none_match = frappe.get_request_header("If-None-Match") or ""
+	if etag in [tag.strip() for tag in if_none_match.split(",")]:
+		return Response(status=304, headers=headers)
+
+	cache_key = f"whatsapp_response:{etag}"
+	body = frappe.cache().get_value(cache_key)
+	if body is None:
+		body = frappe.as_json({"message": build()}, indent=None)
+		frappe.cache().set_value(cache_key, body, expires_in_sec=ttl)
+
+	return Response(body, status=200, headers=headers, mimetype="application/json")
@@ -0,0 +1,104 @@
+"""Encryption for the flow data exchange endpoint.
+
+Meta encrypts each request with a fresh AES-128-GCM key, wrapped with the
+business's RSA public key (OAEP, SHA-256). The response is encrypted with
+the same AES key and the bit-flipped IV. The private key is read from site
+config and parsed once per process; the AES-GCM context of a request is
+reused to encrypt its response, never across requests.
+"""
+import base64
+import json
+import os
+import time
+from functools import lru_cache
+
+import frappe
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+class FlowDecryptionError(Exception):
+	"""Meta expects HTTP 421 for these, so the client refreshes the public key."""
+
+
+def is_encrypted(data):
+	return bool(data) and "encrypted_aes_key" in data
+
+
+def get_private_key():
+	"""Private key from ``whatsapp_flow_private_key`` (PEM) in site config."""
+	pem = frappe.conf.get("whatsapp_flow_private_key")
+	if not pem:
+		return None
+	return load_private_key(pem, frappe.conf.get("whatsapp_flow_private_key_passphrase"))
+
+
+@lru_cache(maxsize=8)
+def load_private_key(pem, passphrase=None):
+	return serialization.load_pem_private_key(
+		pem.encode(), password=passphrase.encode() if passphrase else None
+	)
+
+
+def decrypt_request(data, private_key):
+	"""Return ``(payload, cipher, iv)``; pass ``cipher`` and ``iv`` to :func:`encrypt_response`."""
+	if not private_key:
+		raise FlowDecryptionError("whatsapp_flow_private_key is not configured")
+
+	try:
+		aes_key = private_key.decrypt(base64.b64decode(data["encrypted_aes_key"]), OAEP)
+		iv = base64.b64decode(data["initial_vector"])
+		cipher = AESGCM(aes_key)
+		# the GCM tag is appended to the ciphertext, which is what AESGCM expects
+		plaintext = cipher.decrypt(iv, base64.b64decode(data["encrypted_flow_data"]), None)
+		# ValueError covers plaintext that isn't UTF-8 JSON
+		payload = json.loads(plaintext)
+	except (KeyError, ValueError, InvalidTag) as e:
+		raise FlowDecryptionError(str(e)) from e
+
+	if not isinstance(payload, dict):
+		raise FlowDecryptionError("Decrypted payload is not a JSON object")
+	return payload, cipher, iv
+
+
+def encrypt_response(response, cipher, iv):
+	flipped_iv = bytes(b ^ 0xFF for b in iv)
+	encrypted = cipher.encrypt(flipped_iv, json.dumps(response).encode(), None)
+	return base64.b64encode(encrypted).decode()
+
+
+def benchmark(requests=300):
+	"""Requests per second and slowest request of decrypting and encrypting
+	Meta-style requests, with a throwaway 2048 bit key."""
+	requests = int(requests)
+	private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	bodies = []
+	for i in range(requests):
+		aes_key = AESGCM.generate_key(bit_length=128)
+		iv = os.urandom(16)
+		payload = json.dumps({"version": "3.0", "action": "INIT", "flow_token": f"token-{i}"}).encode()
+		bodies.append({
+			"encrypted_aes_key": base64.b64encode(private_key.public_key().encrypt(aes_key, OAEP)).decode(),
+			"initial_vector": base64.b64encode(iv).decode(),
+			"encrypted_flow_data": base64.b64encode(AESGCM(aes_key).encrypt(iv, payload, None)).decode(),
+		})
+
+	slowest = 0
+	started = time.perf_counter()
+	for body in bodies:
+		request_started = time.perf_counter()
+		payload, cipher, iv = decrypt_request(body, private_key)
+		encrypt_response({"screen": "WELCOME", "data": {}}, cipher, iv)
+		slowest = max(slowest, time.perf_counter() - request_started)
+	elapsed = time.perf_counter() - started
+
+	return {
+		"requests": requests,
+		"requests_per_sec": round(requests / elapsed),
+		"slowest_ms": round(slowest * 1000, 2),
+	}
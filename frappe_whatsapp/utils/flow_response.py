@@ -0,0 +1,134 @@
+"""Flattened flow responses.
+
+Each answer of a completed flow (``nfm_reply``) is written as one
+``WhatsApp Flow Response`` row of (flow, field, contact, value) when the
+message arrives. Multi-select answers get a row per selected option. Per
+question aggregates and exports then run as indexed SQL, without parsing
+``WhatsApp Message.flow_response`` for every submission.
+"""
+import json
+
+import frappe
+
+
+FIELDS = [
+	"name", "creation", "modified", "owner", "modified_by", "docstatus",
+	"flow", "field_name", "value", "whatsapp_contact", "whatsapp_message", "flow_token",
+]
+BACKFILL_PAGE_SIZE = 1000
+
+
+def get_answers(flow_response):
+	"""Yield ``(field_name, value)`` pairs of a flow response."""
+	for field_name, value in flow_response.items():
+		if field_name == "flow_token" or value is None:
+			continue
+		for item in value if isinstance(value, list) else [value]:
+			if isinstance(item, dict):
+				item = json.dumps(item, sort_keys=True)
+			yield field_name, str(item)
+
+
+def get_flow(flow_token=None, reply_to_message_id=None):
+	"""WhatsApp Flow of the outgoing message that started this response."""
+	flow = None
+	if flow_token:
+		flow = frappe.db.get_value(
+			"WhatsApp Message", {"flow_token": flow_token, "type": "Outgoing"}, "flow"
+		)
+	if not flow and reply_to_message_id:
+		flow = frappe.db.get_value("WhatsApp Message", {"message_id": reply_to_message_id}, "flow")
+	return flow
+
+
+def get_rows(message, flow_response):
+	flow_token = flow_response.get("flow_token")
+	flow = get_flow(flow_token, message.reply_to_message_id)
+	now = frappe.utils.now()
+	user = frappe.session.user
+	return [
+		(
+			frappe.generate_hash(), now, now, user, user, 0,
+			flow, field_name, value, message.whatsapp_contact, message.name, flow_token,
+		)
+		for field_name, value in get_answers(flow_response)
+	]
+
+
+def store_flow_response(message, flow_response):
+	"""Write the answers of an incoming flow message."""
+	try:
+		rows = get_rows(message, flow_response)
+		if rows:
+			frappe.db.bulk_insert("WhatsApp Flow Response", FIELDS, rows)
+	except Exception:
+		# the message keeps the raw response and can be backfilled
+		frappe.log_error(title="WhatsApp Flow Response", message=frappe.get_traceback())
+
+
+@frappe.whitelist()
+def get_field_summary(flow, field_name):
+	"""Number of responses per answer to one question of a flow."""
+	frappe.has_permission("WhatsApp Flow Response", throw=True)
+	return frappe.db.sql(
+		"""
+		SELECT value, COUNT(*) AS count
+		FROM `tabWhatsApp Flow Response`
+		WHERE flow = %(flow)s AND field_name = %(field_name)s
+		GROUP BY value
+		ORDER BY count DESC
+		""",
+		{"flow": flow, "field_name": field_name},
+		as_dict=True,
+	)
+
+
+def backfill_flow_responses():
+	"""Flatten flow responses of messages received before the table existed.
+
+	A page that fails to insert is logged and skipped; calling this again
+	writes only messages that have no responses yet.
+	"""
+	last_name = ""
+	while True:
+		messages = frappe.db.sql(
+			"""
+			SELECT name, whatsapp_contact, reply_to_message_id, flow_response
+			FROM `tabWhatsApp Message`
+			WHERE type = 'Incoming' AND content_type = 'flow' AND name > %(last_name)s
+			ORDER BY name
+			LIMIT %(page_size)s
+			""",
+			{"last_name": last_name, "page_size": BACKFILL_PAGE_SIZE},
+			as_dict=True,
+		)
+		if not messages:
+			break
+
+		done = set(frappe.get_all(
+			"WhatsApp Flow Response",
+			filters={"whatsapp_message": ("in", [m.name for m in messages])},
+			pluck="whatsapp_message",
+			distinct=True,
+		))
+		rows = []
+		for message in messages:
+			if message.name in done:
+				continue
+			try:
+				flow_response = json.loads(message.flow_response or "{}")
+			except ValueError:
+				continue
+			if isinstance(flow_response, dict):
+				rows.extend(get_rows(message, flow_response))
+
+		try:
+			if rows:
+				frappe.db.bulk_insert("WhatsApp Flow Response", FIELDS, rows)
+			frappe.db.commit()
+		except Exception:
+			# skip the page rather than fail the migration; running this
+			# again only fills in messages without responses
+			frappe.db.rollback()
+			frappe.log_error(title="WhatsApp Flow Response Backfill", message=frappe.get_traceback())
+		last_name = messages[-1].name
@@ -0,0 +1,110 @@
+"""Flow sessions for the data exchange endpoint.
+
+Screen data of a flow in progress is merged into a Redis hash keyed by
+``flow_token``, one pipelined round trip per request and no database write.
+A sorted set scored by last activity tracks open sessions. A session is
+written to ``WhatsApp Flow Data`` exactly once: when the flow's
+``nfm_reply`` arrives on the webhook, or when the scheduler finds it idle
+for longer than ``SESSION_TTL``. Removing the token from the sorted set is
+the claim, so a session racing between both paths is only persisted once.
+"""
+import json
+import time
+
+import frappe
+
+
+KEY_PREFIX = "whatsapp_flow_session"
+INDEX_KEY = f"{KEY_PREFIX}:index"
+SESSION_TTL = 60 * 60
+# keep the hash around after it goes idle so the sweeper can still persist it
+KEY_TTL = SESSION_TTL * 2
+LAST_SCREEN = "__last_screen__"
+LAST_SEEN = "__last_seen__"
+
+
+def get_key(flow_token):
+	return frappe.cache().make_key(f"{KEY_PREFIX}:{flow_token}")
+
+
+def get_index_key():
+	return frappe.cache().make_key(INDEX_KEY)
+
+
+def update_session(flow_token, screen, form_data):
+	"""Merge ``form_data`` into the session of ``flow_token``."""
+	now = time.time()
+	values = {field: json.dumps(value) for field, value in (form_data or {}).items()}
+	values[LAST_SEEN] = frappe.utils.now()
+	if screen:
+		values[LAST_SCREEN] = screen
+
+	pipe = frappe.cache().pipeline()
+	pipe.hset(get_key(flow_token), mapping=values)
+	pipe.expire(get_key(flow_token), KEY_TTL)
+	pipe.zadd(get_index_key(), {flow_token: now})
+	pipe.execute()
+
+
+def get_session(flow_token):
+	"""Return ``(data, last_screen, last_seen)`` of an open session."""
+	# written raw by update_session, so read raw: RedisWrapper.hgetall would
+	# prefix the key again and unpickle the values
+	raw = frappe.cache().execute_command("HGETALL", get_key(flow_token)) or {}
+	data = {}
+	last_screen = last_seen = None
+	for field, value in raw.items():
+		field, value = frappe.safe_decode(field), frappe.safe_decode(value)
+		if field == LAST_SCREEN:
+			last_screen = value
+		elif field == LAST_SEEN:
+			last_seen = value
+		else:
+			data[field] = json.loads(value)
+	return data, last_screen, last_seen
+
+
+def complete_session(flow_token, response=None):
+	"""Persist the session of a completed flow, with its final response merged in."""
+	if not flow_token:
+		return
+	try:
+		persist_session(flow_token, "Completed", response)
+	except Exception:
+		# never fail the incoming message for it
+		frappe.log_error(title="WhatsApp Flow Session", message=frappe.get_traceback())
+
+
+def persist_session(flow_token, status, response=None):
+	cache = frappe.cache()
+	if not cache.zrem(get_index_key(), flow_token):
+		# persisted already, or the flow never called the endpoint
+		return
+
+	data, last_screen, last_seen = get_session(flow_token)
+	data.update(response or {})
+	data.pop("flow_token", None)
+
+	frappe.get_doc({
+		"doctype": "WhatsApp Flow Data",
+		"flow_token": flow_token,
+		"status": status,
+		"last_screen": last_screen,
+		"last_seen": last_seen,
+		"data": json.dumps(data, indent=2),
+	}).insert(ignore_permissions=True)
+	cache.delete(get_key(flow_token))
+
+
+def persist_expired_sessions():
+	"""Write sessions idle for longer than ``SESSION_TTL`` as Expired."""
+	cutoff = time.time() - SESSION_TTL
+	for flow_token in frappe.cache().zrangebyscore(get_index_key(), 0, cutoff):
+		flow_token = frappe.safe_decode(flow_token)
+		try:
+			persist_session(flow_token, "Expired")
+			frappe.db.commit()
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(title="WhatsApp Flow Session", message=frappe.get_traceback())
+
@@ -0,0 +1,122 @@
+"""Flow sync from Meta.
+
+Flows of a WhatsApp Business Account are listed page by page, then their
+``flow.json`` assets are downloaded concurrently from a bounded thread pool.
+Workers only make HTTP calls; documents are written on the calling thread.
+Each flow is hashed together with its metadata, and only flows whose hash
+differs from the stored ``content_hash`` are re-parsed and saved.
+"""
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+
+
+MAX_WORKERS = 8
+TIMEOUT = 30
+
+
+def sync_flows(whatsapp_account):
+	"""Import new flows and update changed ones. Returns counts."""
+	account = frappe.get_doc("WhatsApp Account", whatsapp_account)
+	headers = {"Authorization": f"Bearer {account.get_password('token')}"}
+	base_url = f"{account.url}/{account.version}"
+
+	remote_flows = list(get_remote_flows(base_url, account.business_id, headers))
+	local = {
+		f.flow_id: f
+		for f in frappe.get_all("WhatsApp Flow", fields=["name", "flow_id", "content_hash"])
+		if f.flow_id
+	}
+
+	result = {"imported": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+	if not remote_flows:
+		return result
+
+	with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(remote_flows))) as pool:
+		flow_jsons = pool.map(lambda flow: get_flow_json(base_url, flow["id"], headers), remote_flows)
+
+		for flow, flow_json in zip(remote_flows, flow_jsons):
+			existing = local.get(flow["id"])
+			content_hash = get_content_hash(flow, flow_json)
+			if existing and existing.content_hash == content_hash:
+				result["unchanged"] += 1
+				continue
+
+			try:
+				save_flow(account.name, flow, flow_json, content_hash, existing and existing.name)
+				result["updated" if existing else "imported"] += 1
+			except Exception:
+				frappe.log_error(
+					title=f"Failed to sync flow {flow['id']}", message=frappe.get_traceback()
+				)
+				result["skipped"] += 1
+
+	frappe.db.commit()
+	return result
+
+
+def get_remote_flows(base_url, business_id, headers):
+	url = f"{base_url}/{business_id}/flows?fields=id,name,status,categories,json_version"
+	while url:
+		response = requests.get(url, headers=headers, timeout=TIMEOUT)
+		response.raise_for_status()
+		data = response.json()
+		yield from data.get("data", [])
+		url = data.get("paging", {}).get("next")
+
+
+def get_flow_json(base_url, flow_id, headers):
+	"""Download ``flow.json`` of a flow. Runs in a worker thread, so no frappe calls."""
+	try:
+		response = requests.get(f"{base_url}/{flow_id}/assets", headers=headers, timeout=TIMEOUT)
+		response.raise_for_status()
+		for asset in response.json().get("data", []):
+			if asset.get("name") == "flow.json" and asset.get("download_url"):
+				asset_response = requests.get(asset["download_url"], headers=headers, timeout=TIMEOUT)
+				if asset_response.status_code == 200:
+					return asset_response.json()
+	except (requests.RequestException, ValueError):
+		# the flow is still synced from its metadata
+		pass
+	return None
+
+
+def get_content_hash(flow, flow_json):
+	return hashlib.sha1(
+		json.dumps([flow, flow_json], sort_keys=True, default=str).encode()
+	).hexdigest()
+
+
+def save_flow(account_name, flow, flow_json, content_hash, name=None):
+	from frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_flow.whatsapp_flow import (
+		parse_flow_json_to_screens,
+	)
+
+	if name:
+		flow_doc = frappe.get_doc("WhatsApp Flow", name)
+	else:
+		flow_doc = frappe.get_doc({
+			"doctype": "WhatsApp Flow",
+			"flow_name": flow.get("name") or f"Flow {flow['id']}",
+			"whatsapp_account": account_name,
+			"flow_id": flow["id"],
+		})
+
+	flow_doc.status = flow.get("status", "Draft").title()
+	flow_doc.category = flow["categories"][0] if flow.get("categories") else flow_doc.category or "OTHER"
+	if flow_json:
+		flow_doc.flow_json = json.dumps(flow_json, indent=2)
+		flow_doc.data_api_version = flow_json.get("version", "6.0")
+		flow_doc.screens = []
+		flow_doc.fields = []
+		parse_flow_json_to_screens(flow_doc, flow_json)
+	flow_doc.content_hash = content_hash
+
+	flow_doc.flags.ignore_validate = True
+	if flow_doc.is_new():
+		flow_doc.insert(ignore_permissions=True)
+	else:
+		flow_doc.save(ignore_permissions=True)
@@ -0,0 +1,45 @@
+"""Idempotent outbound sends.
+
+A send derives a key from what makes it unique, e.g. (notification, document,
+event, version) or (campaign, recipient). Before calling the Graph API the
+key is looked up on ``WhatsApp Message.idempotency_key`` and then claimed in
+Redis, so duplicate doc events, RQ retries and re-run campaigns reuse the
+first message instead of sending again. The unique column backs the claim
+up if Redis is flushed mid-send.
+"""
+import hashlib
+
+import frappe
+
+
+CLAIM_TTL = 60 * 60
+# how long a claim outlives a send whose WhatsApp Message could not be saved
+SENT_TTL = 7 * 24 * 60 * 60
+
+
+def make_idempotency_key(*parts):
+	return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_sent_message(key):
+	"""Name of the WhatsApp Message already sent for ``key``."""
+	return frappe.db.get_value("WhatsApp Message", {"idempotency_key": key}, "name")
+
+
+def get_claim_key(key):
+	return frappe.cache().make_key(f"whatsapp_send_claim:{key}")
+
+
+def claim(key):
+	"""Reserve ``key`` for this send. False if another send holds it."""
+	return bool(frappe.cache().set(get_claim_key(key), 1, nx=True, ex=CLAIM_TTL))
+
+
+def release(key):
+	"""Give up a claim after a failed send so a retry can go through."""
+	frappe.cache().delete(get_claim_key(key))
+
+
+def keep(key):
+	"""Hold the claim of a sent message that has no WhatsApp Message to look it up by."""
+	frappe.cache().set(get_claim_key(key), 1, ex=SENT_TTL)
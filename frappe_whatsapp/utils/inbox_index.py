@@ -0,0 +1,153 @@
+"""Inbox index.
+
+Redis sorted sets of conversations scored by last activity, one for all
+conversations, one per WhatsApp Account and one per assignee. The sidebar
+reads a page with ZREVRANGE, so the cost of fetching the top N
+conversations does not depend on how many contacts exist.
+
+The index is only a cache of ``WhatsApp Conversation`` and can be rebuilt
+from it at any time.
+"""
+import frappe
+from frappe.utils import get_datetime
+
+
+KEY_PREFIX = "whatsapp_inbox"
+BUILT_MARKER = f"{KEY_PREFIX}:built"
+# outside KEY_PREFIX so a rebuild doesn't delete its own lock
+REBUILD_LOCK = f"{KEY_PREFIX}_rebuild_lock"
+REBUILD_LOCK_TTL = 60 * 60
+REBUILD_PAGE_SIZE = 5000
+
+
+def get_key(account=None, assignee=None):
+	"""Redis key of the sorted set for an account, an assignee or everything."""
+	if assignee:
+		key = f"{KEY_PREFIX}:assignee:{assignee}"
+	elif account:
+		key = f"{KEY_PREFIX}:account:{account}"
+	else:
+		key = f"{KEY_PREFIX}:all"
+	return frappe.cache().make_key(key)
+
+
+def get_score(timestamp):
+	return get_datetime(timestamp).timestamp() if timestamp else 0
+
+
+def touch(contact, account=None, assignee=None, timestamp=None):
+	"""Move ``contact`` to its new position after activity at ``timestamp``."""
+	score = get_score(timestamp or frappe.utils.now())
+	try:
+		pipe = frappe.cache().pipeline()
+		pipe.zadd(get_key(), {contact: score})
+		if account:
+			pipe.zadd(get_key(account=account), {contact: score})
+		if assignee:
+			pipe.zadd(get_key(assignee=assignee), {contact: score})
+		pipe.execute()
+	except Exception:
+		# The index is rebuilt from the database, never fail a message insert for it
+		frappe.log_error(title="WhatsApp Inbox Index", message=frappe.get_traceback())
+
+
+def reassign(contact, old_assignee, new_assignee, timestamp):
+	"""Move ``contact`` from one assignee's set to another's."""
+	try:
+		pipe = frappe.cache().pipeline()
+		if old_assignee:
+			pipe.zrem(get_key(assignee=old_assignee), contact)
+		if new_assignee:
+			pipe.zadd(get_key(assignee=new_assignee), {contact: get_score(timestamp)})
+		pipe.execute()
+	except Exception:
+		frappe.log_error(title="WhatsApp Inbox Index", message=frappe.get_traceback())
+
+
+def remove(contact, account=None, assignee=None):
+	"""Drop ``contact`` from the index."""
+	try:
+		pipe = frappe.cache().pipeline()
+		pipe.zrem(get_key(), contact)
+		if account:
+			pipe.zrem(get_key(account=account), contact)
+		if assignee:
+			pipe.zrem(get_key(assignee=assignee), contact)
+		pipe.execute()
+	except Exception:
+		frappe.log_error(title="WhatsApp Inbox Index", message=frappe.get_traceback())
+
+
+def get_range(account=None, assignee=None, start=0, page_length=None):
+	"""Return contact names ordered by last activity, newest first.
+
+	Returns None when Redis is unavailable or the index is not built yet, so
+	callers can fall back to SQL. A missing index is rebuilt in the background.
+	"""
+	try:
+		cache = frappe.cache()
+		# raw command: RedisWrapper.exists would prefix the key a second time
+		if not cache.execute_command("EXISTS", cache.make_key(BUILT_MARKER)):
+			enqueue_rebuild()
+			return None
+
+		end = start + page_length - 1 if page_length else -1
+		return [frappe.safe_decode(name) for name in cache.zrevrange(get_key(account, assignee), start, end)]
+	except Exception:
+		frappe.log_error(title="WhatsApp Inbox Index", message=frappe.get_traceback())
+		return None
+
+
+def enqueue_rebuild():
+	"""Queue one rebuild, however many requests find the index missing."""
+	cache = frappe.cache()
+	if cache.set(cache.make_key(REBUILD_LOCK), 1, nx=True, ex=REBUILD_LOCK_TTL):
+		frappe.enqueue(
+			"frappe_whatsapp.utils.inbox_index.run_rebuild",
+			queue="long",
+			timeout=REBUILD_LOCK_TTL,
+		)
+
+
+def run_rebuild():
+	cache = frappe.cache()
+	try:
+		rebuild_inbox_index()
+	finally:
+		cache.delete(cache.make_key(REBUILD_LOCK))
+
+
+def rebuild_inbox_index():
+	"""Rebuild every inbox sorted set from WhatsApp Conversation."""
+	cache = frappe.cache()
+	for key in cache.keys(cache.make_key(f"{KEY_PREFIX}:*")):
+		cache.delete(key)
+
+	last_name = ""
+	while True:
+		rows = frappe.db.sql(
+			"""
+			SELECT name, whatsapp_account, assigned_to, last_message_time
+			FROM `tabWhatsApp Conversation`
+			WHERE name > %(last_name)s
+			ORDER BY name
+			LIMIT %(page_size)s
+			""",
+			{"last_name": last_name, "page_size": REBUILD_PAGE_SIZE},
+			as_dict=True,
+		)
+		if not rows:
+			break
+
+		pipe = cache.pipeline()
+		for row in rows:
+			score = get_score(row.last_message_time)
+			pipe.zadd(get_key(), {row.name: score})
+			if row.whatsapp_account:
+				pipe.zadd(get_key(account=row.whatsapp_account), {row.name: score})
+			if row.assigned_to:
+				pipe.zadd(get_key(assignee=row.assigned_to), {row.name: score})
+		pipe.execute()
+		last_name = rows[-1].name
+
+	cache.set(cache.make_key(BUILT_MARKER), 1)
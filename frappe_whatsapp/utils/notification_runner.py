@@ -0,0 +1,318 @@
+"""Batched runners for date based and scheduled WhatsApp Notifications.
+
+The daily scheduler only queues one runner per notification. A runner pages
+through the due documents by name, fetching just the fields the template
+needs, and hands them to parallel chunk jobs. Every successful send is
+checkpointed in Redis, so running a notification again the same day only
+sends what is still missing. An hourly job does that for runs that queued
+documents, until a run finds nothing left to send or has been tried
+``MAX_RUN_ATTEMPTS`` times, so chunks lost to a worker crash or a Graph API
+outage are picked up without anyone re-running the notification.
+
+Scheduled (event frequency) notifications work the same way: the tick reads
+the due notifications from cache and queues one job each, which runs the
+notification script and fans its ``_data_list`` / ``_contact_list`` out to
+chunk jobs that bulk-load their documents in one query.
+"""
+import time
+
+import frappe
+from frappe.utils import add_to_date, cint, nowdate
+
+from frappe_whatsapp.utils import get_notification_queue
+from frappe_whatsapp.utils.condition import get_referenced_fields
+from frappe_whatsapp.utils.idempotency import make_idempotency_key
+from frappe_whatsapp.utils.template_payload import get_compiled_template
+
+
+CHUNK_SIZE = 500
+CHECKPOINT_TTL = 3 * 24 * 60 * 60
+MAX_RUN_ATTEMPTS = 3
+# leave a run's chunk jobs this long before sending what they missed
+RESUME_AFTER = 60 * 60
+SCHEDULED_CACHE_KEY = "whatsapp_scheduled_notifications"
+
+
+def get_checkpoint_key(notification, reference_date):
+	return f"whatsapp_notification_sent:{notification}:{reference_date}"
+
+
+def is_sent(checkpoint, name):
+	return frappe.cache().sismember(checkpoint, name)
+
+
+def mark_sent(checkpoint, name):
+	frappe.cache().sadd(checkpoint, name)
+	frappe.cache().expire(frappe.cache().make_key(checkpoint), CHECKPOINT_TTL)
+
+
+def get_run_key(notification, reference_date):
+	return frappe.cache().make_key(f"whatsapp_notification_run:{notification}:{reference_date}")
+
+
+def start_run(run_key):
+	cache = frappe.cache()
+	cache.execute_command("HINCRBY", run_key, "attempts", 1)
+	cache.execute_command("HSET", run_key, "started", int(time.time()))
+	cache.expire(run_key, CHECKPOINT_TTL)
+
+
+def queue_date_notifications():
+	"""Queue a runner for every enabled Days Before / Days After notification."""
+	for name in frappe.get_all(
+		"WhatsApp Notification",
+		filters={"doctype_event": ("in", ("Days Before", "Days After")), "disabled": 0},
+		pluck="name",
+	):
+		queue_date_notification(name)
+
+
+def queue_date_notification(notification):
+	frappe.enqueue(
+		"frappe_whatsapp.utils.notification_runner.run_date_notification",
+		queue="long",
+		notification=notification,
+		run_date=nowdate(),
+	)
+
+
+def get_reference_date(notification, run_date=None):
+	"""Date whose documents are due when the notification runs on ``run_date``."""
+	diff_days = notification.days_in_advance
+	if notification.doctype_event == "Days After":
+		diff_days = -diff_days
+	return add_to_date(run_date or nowdate(), days=diff_days)
+
+
+def get_format_fields(df):
+	"""Fields the formatted value of ``df`` depends on, besides its own."""
+	if df and df.fieldtype == "Currency" and df.options:
+		# either the field holding the currency, or "DocType:link_field:currency_field"
+		options = df.options.split(":")
+		return {options[1]} if len(options) == 3 else {df.options}
+	return set()
+
+
+def get_required_fields(notification, include_condition=True):
+	"""Fields a send needs from the reference document, or None for the whole document."""
+	meta = frappe.get_meta(notification.reference_doctype)
+	fields = {"name"}
+	if notification.field_name:
+		fields.add(notification.field_name)
+	if notification.attach_from_field:
+		fields.add(notification.attach_from_field)
+	for row in notification.fields:
+		# parameters are sent formatted, e.g. amounts in the document's currency
+		fields.add(row.field_name)
+		fields.update(get_format_fields(meta.get_field(row.field_name)))
+	if notification.button_fields:
+		fields.update(f.strip() for f in notification.button_fields.split(",") if f.strip())
+
+	if notification.condition and include_condition:
+		condition_fields = get_referenced_fields(notification.condition)
+		if condition_fields is None:
+			return None
+		fields.update(condition_fields)
+
+	valid_columns = set(meta.get_valid_columns())
+	if not fields.issubset(valid_columns):
+		# child tables or virtual fields, load full documents
+		return None
+
+	return sorted(fields)
+
+
+def run_date_notification(notification, run_date=None):
+	"""Page through today's documents and queue them in chunks."""
+	notification = frappe.get_doc("WhatsApp Notification", notification)
+	reference_date = get_reference_date(notification, run_date)
+	checkpoint = get_checkpoint_key(notification.name, reference_date)
+	run_key = get_run_key(notification.name, reference_date)
+	start_run(run_key)
+
+	fields = get_required_fields(notification)
+	last_name = ""
+	queued = 0
+	while True:
+		rows = frappe.get_all(
+			notification.reference_doctype,
+			fields=fields or ["name"],
+			filters=[
+				[notification.date_changed, ">=", f"{reference_date} 00:00:00.000000"],
+				[notification.date_changed, "<=", f"{reference_date} 23:59:59.000000"],
+				["name", ">", last_name],
+			],
+			order_by="name asc",
+			limit_page_length=CHUNK_SIZE,
+		)
+		if not rows:
+			break
+
+		last_name = rows[-1].name
+		pending = [row for row in rows if not is_sent(checkpoint, row.name)]
+		if pending:
+			queued += len(pending)
+			frappe.enqueue(
+				"frappe_whatsapp.utils.notification_runner.send_date_notification_chunk",
+				queue=get_notification_queue(),
+				notification=notification.name,
+				reference_date=reference_date,
+				rows=pending if fields else [row.name for row in pending],
+			)
+
+		if len(rows) < CHUNK_SIZE:
+			break
+
+	if not queued:
+		# everything due today is sent, nothing to resume
+		frappe.cache().delete(run_key)
+
+
+def resume_date_notifications():
+	"""Run today's date notifications again where the last run queued documents,
+	so sends lost to a crashed or failed chunk are retried."""
+	run_date = nowdate()
+	for notification in frappe.get_all(
+		"WhatsApp Notification",
+		filters={"doctype_event": ("in", ("Days Before", "Days After")), "disabled": 0},
+		fields=["name", "doctype_event", "days_in_advance"],
+	):
+		run_key = get_run_key(notification.name, get_reference_date(notification, run_date))
+		attempts, started = frappe.cache().execute_command("HMGET", run_key, "attempts", "started")
+		if (
+			attempts
+			and cint(attempts) < MAX_RUN_ATTEMPTS
+			and time.time() - cint(started) > RESUME_AFTER
+		):
+			queue_date_notification(notification.name)
+
+
+def send_date_notification_chunk(notification, reference_date, rows):
+	"""Send a chunk of documents, checkpointing each successful send.
+
+	``rows`` holds either prefetched field values or, when the notification
+	needs whole documents, plain document names.
+	"""
+	notification = frappe.get_doc("WhatsApp Notification", notification)
+	template = get_compiled_template(notification.template)
+	checkpoint = get_checkpoint_key(notification.name, reference_date)
+
+	for row in rows:
+		name = row if isinstance(row, str) else row["name"]
+		if is_sent(checkpoint, name):
+			continue
+
+		if send(notification, name, lambda: notification.send_template_message(
+			build_doc(notification, row),
+			default_template=template,
+			idempotency_key=make_idempotency_key(notification.name, name, reference_date),
+		)):
+			mark_sent(checkpoint, name)
+
+
+def build_doc(notification, row):
+	"""Reference document from prefetched field values, or loaded by name."""
+	if isinstance(row, str):
+		return frappe.get_doc(notification.reference_doctype, row)
+	return frappe.get_doc({**row, "doctype": notification.reference_doctype})
+
+
+def send(notification, recipient, send_message):
+	"""Run one send in its own transaction. Returns True if it was accepted."""
+	try:
+		sent = send_message()
+		frappe.db.commit()
+		return sent
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(
+			title="WhatsApp Notification",
+			message=f"Failed to send {notification.name} for {recipient}\n{frappe.get_traceback()}",
+		)
+		return False
+
+
+def get_scheduled_notifications(event):
+	"""Names of enabled notifications for an event frequency, cached between ticks."""
+	return frappe.cache().hget(
+		SCHEDULED_CACHE_KEY,
+		event,
+		lambda: frappe.get_all(
+			"WhatsApp Notification",
+			filters={"event_frequency": event, "disabled": 0},
+			pluck="name",
+		),
+	)
+
+
+def clear_scheduled_notifications_cache():
+	frappe.cache().delete_value(SCHEDULED_CACHE_KEY)
+
+
+def queue_scheduled_notifications(event):
+	"""Queue a job per notification due on this scheduler tick."""
+	for name in get_scheduled_notifications(event):
+		frappe.enqueue(
+			"frappe_whatsapp.utils.notification_runner.run_scheduled_notification",
+			queue="long",
+			notification=name,
+		)
+
+
+def run_scheduled_notification(notification):
+	frappe.get_doc("WhatsApp Notification", notification).send_scheduled_message()
+
+
+def queue_scheduled_chunks(notification, data_list=None, contact_list=None):
+	"""Fan a scheduled notification's recipients out to chunk jobs."""
+	if data_list:
+		data_list = [{"name": d.get("name"), "phone_no": d.get("phone_no")} for d in data_list]
+		method, items, key = "send_data_chunk", data_list, "data_list"
+	else:
+		method, items, key = "send_contact_chunk", list(contact_list or []), "contact_list"
+
+	for start in range(0, len(items), CHUNK_SIZE):
+		frappe.enqueue(
+			f"frappe_whatsapp.utils.notification_runner.{method}",
+			queue=get_notification_queue(),
+			notification=notification.name,
+			**{key: items[start:start + CHUNK_SIZE]},
+		)
+
+
+def send_data_chunk(notification, data_list):
+	"""Send a template for each ``{"name", "phone_no"}`` entry of a chunk.
+
+	The referenced documents are loaded in a single query when the template
+	only needs plain fields.
+	"""
+	notification = frappe.get_doc("WhatsApp Notification", notification)
+	template = get_compiled_template(notification.template)
+
+	rows = {}
+	fields = get_required_fields(notification, include_condition=False)
+	if fields:
+		rows = {
+			row.name: row
+			for row in frappe.get_all(
+				notification.reference_doctype,
+				fields=fields,
+				filters={"name": ("in", [data["name"] for data in data_list])},
+			)
+		}
+
+	for data in data_list:
+		row = rows.get(data["name"]) or data["name"]
+		send(notification, data["name"], lambda: notification.send_template_message(
+			build_doc(notification, row), data["phone_no"], template, True
+		))
+
+
+def send_contact_chunk(notification, contact_list):
+	"""Send a template without document data to a chunk of numbers."""
+	notification = frappe.get_doc("WhatsApp Notification", notification)
+	template = get_compiled_template(notification.template)
+
+	for contact in contact_list:
+		notification._contact_list = [contact]
+		send(notification, contact, lambda: notification.send_simple_template(template))
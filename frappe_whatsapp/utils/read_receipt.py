@@ -0,0 +1,115 @@
+"""Read receipts.
+
+Meta marks every earlier message in a conversation as read once the latest
+one is acknowledged, so a conversation only ever needs a single receipt for
+its newest inbound message.
+"""
+import json
+import frappe
+from frappe.integrations.utils import make_post_request
+
+
+READ_STATUS = "marked as read"
+
+
+def enqueue_read_receipts(mobile_no):
+	"""Queue read receipts for a contact so chat opens don't wait on Meta."""
+	if not mobile_no:
+		return
+
+	frappe.enqueue(
+		"frappe_whatsapp.utils.read_receipt.send_read_receipts",
+		queue="short",
+		enqueue_after_commit=True,
+		mobile_no=mobile_no,
+	)
+
+
+def send_read_receipts(mobile_no):
+	"""Send one read receipt per account for the newest unread inbound message."""
+	latest = frappe.db.sql(
+		"""
+		SELECT whatsapp_account, MAX(creation) AS creation
+		FROM `tabWhatsApp Message`
+		WHERE `from` = %(mobile_no)s
+			AND type = 'Incoming'
+			AND IFNULL(status, '') != %(status)s
+			AND IFNULL(whatsapp_account, '') != ''
+		GROUP BY whatsapp_account
+		""",
+		{"mobile_no": mobile_no, "status": READ_STATUS},
+		as_dict=True,
+	)
+
+	for row in latest:
+		if not frappe.db.get_value("WhatsApp Account", row.whatsapp_account, "allow_auto_read_receipt"):
+			continue
+
+		message_id = frappe.db.get_value(
+			"WhatsApp Message",
+			{
+				"from": mobile_no,
+				"type": "Incoming",
+				"whatsapp_account": row.whatsapp_account,
+				"creation": row.creation,
+			},
+			"message_id",
+		)
+		if not message_id:
+			continue
+
+		try:
+			if not post_read_receipt(row.whatsapp_account, message_id):
+				continue
+		except Exception:
+			frappe.log_error(
+				title="WhatsApp Chat Read Receipt",
+				message=f"Failed to send read receipt for {message_id}\n{frappe.get_traceback()}",
+			)
+			continue
+
+		mark_conversation_read(mobile_no, row.whatsapp_account, row.creation)
+
+	frappe.db.commit()
+
+
+def post_read_receipt(whatsapp_account, message_id):
+	"""Acknowledge ``message_id`` on Meta. Returns True on success."""
+	account = frappe.get_doc("WhatsApp Account", whatsapp_account)
+	token = account.get_password("token")
+
+	response = make_post_request(
+		f"{account.url}/{account.version}/{account.phone_id}/messages",
+		headers={
+			"authorization": f"Bearer {token}",
+			"content-type": "application/json",
+		},
+		data=json.dumps({
+			"messaging_product": "whatsapp",
+			"status": "read",
+			"message_id": message_id,
+		}),
+	)
+	return bool(response and response.get("success"))
+
+
+def mark_conversation_read(mobile_no, whatsapp_account, upto):
+	"""Flag every inbound message up to ``upto`` as read in one statement."""
+	frappe.db.sql(
+		"""
+		UPDATE `tabWhatsApp Message`
+		SET status = %(status)s, modified = %(now)s
+		WHERE `from` = %(mobile_no)s
+			AND type = 'Incoming'
+			AND whatsapp_account = %(whatsapp_account)s
+			AND creation <= %(upto)s
+			AND IFNULL(status, '') != %(status)s
+		""",
+		{
+			"status": READ_STATUS,
+			"mobile_no": mobile_no,
+			"whatsapp_account": whatsapp_account,
+			"upto": upto,
+			"now": frappe.utils.now(),
+		},
+	)
@@ -0,0 +1,331 @@
+"""Streaming recipient imports.
+
+Imports run as background jobs. The source, a DocType or an uploaded
+CSV/XLSX file, is read a page or row at a time, numbers are normalized and
+WhatsApp List Recipient rows are bulk inserted in chunks without loading or
+saving the recipient list document. Each chunk skips numbers the list
+already has, looked up on its (list, number) unique index, so memory stays
+flat whatever the file size; DocType imports also keep a set of numbers
+seen. The recipient count is stored once, at the end. Progress is published
+to the list's form after every chunk.
+"""
+import csv
+import io
+import json
+import os
+import re
+from datetime import date, datetime
+
+import frappe
+from frappe import _
+
+
+PAGE_SIZE = 5000
+NON_DIGITS = re.compile(r"[^\d+]")
+VALID_NUMBER = re.compile(r"^\+?\d{10,15}$")
+RECIPIENT_FIELDS = [
+	"name", "creation", "modified", "owner", "modified_by", "docstatus",
+	"recipient_list", "mobile_number", "recipient_name", "recipient_data",
+]
+MOBILE_INDEX = RECIPIENT_FIELDS.index("mobile_number")
+
+
+def normalize_number(mobile):
+	"""Digits and ``+`` of a mobile number."""
+	return NON_DIGITS.sub("", str(mobile)) if mobile else ""
+
+
+def get_variable_name(field):
+	return field.lower().replace(" ", "_")
+
+
+def get_recipient_row(list_name, mobile, recipient_name=None, recipient_data=None):
+	"""A WhatsApp List Recipient row for ``bulk_insert``, None without a number."""
+	mobile = normalize_number(mobile)
+	if not mobile:
+		return None
+	now = frappe.utils.now()
+	return (
+		frappe.generate_hash(), now, now, frappe.session.user, frappe.session.user, 0,
+		list_name, mobile, recipient_name, json.dumps(recipient_data or {}),
+	)
+
+
+def update_recipient_count(list_name):
+	count = frappe.db.count("WhatsApp List Recipient", {"recipient_list": list_name})
+	frappe.db.set_value("WhatsApp Recipient List", list_name, "recipient_count", count, update_modified=False)
+	return count
+
+
+class RecipientWriter:
+	"""Deduplicates and bulk inserts recipients of a list in chunks.
+
+	``count`` is the number of rows actually inserted.
+	"""
+
+	def __init__(self, list_name, dedupe=True):
+		self.list_name = list_name
+		# without it, only numbers already written are skipped
+		self.seen = set() if dedupe else None
+		self.rows = []
+		self.count = 0
+		self.skipped = 0
+
+	def add(self, mobile, recipient_name=None, recipient_data=None):
+		row = get_recipient_row(self.list_name, mobile, recipient_name, recipient_data)
+		if not row or (self.seen is not None and row[MOBILE_INDEX] in self.seen):
+			self.skipped += 1
+			return False
+		if self.seen is not None:
+			self.seen.add(row[MOBILE_INDEX])
+
+		self.rows.append(row)
+		if len(self.rows) >= PAGE_SIZE:
+			self.flush()
+		return True
+
+	def get_new_rows(self):
+		"""Pending rows whose number is neither earlier in the chunk nor in the list."""
+		rows = {}
+		for row in self.rows:
+			rows.setdefault(row[MOBILE_INDEX], row)
+		existing = frappe.get_all(
+			"WhatsApp List Recipient",
+			filters={"recipient_list": self.list_name, "mobile_number": ("in", list(rows))},
+			pluck="mobile_number",
+		)
+		for mobile in existing:
+			rows.pop(mobile, None)
+		return list(rows.values())
+
+	def flush(self):
+		"""Write pending rows and commit."""
+		if self.rows:
+			rows = self.get_new_rows()
+			self.skipped += len(self.rows) - len(rows)
+			if rows:
+				# no ignore_duplicates: a clash on name must fail, not drop a recipient
+				frappe.db.bulk_insert("WhatsApp List Recipient", RECIPIENT_FIELDS, rows)
+				self.count += len(rows)
+			self.rows = []
+		frappe.db.commit()
+
+	def finish(self):
+		"""Write pending rows and store and return the list's recipient count."""
+		self.flush()
+		count = update_recipient_count(self.list_name)
+		frappe.db.commit()
+		return count
+
+
+def clear_recipients(list_name):
+	frappe.db.delete("WhatsApp List Recipient", {"recipient_list": list_name})
+
+
+def publish_import_progress(list_name, done, total, finished=False, **kwargs):
+	frappe.publish_realtime(
+		"whatsapp_recipient_import",
+		{"list_name": list_name, "done": done, "total": total, "finished": finished, **kwargs},
+		doctype="WhatsApp Recipient List",
+		docname=list_name,
+		user=frappe.session.user,
+	)
+
+
+def get_keyset_filters(doctype, filters, last_name):
+	"""``filters`` as a list, restricted to records after ``last_name``."""
+	if isinstance(filters, dict):
+		filters = [
+			[doctype, key, *(value if isinstance(value, (list, tuple)) else ("=", value))]
+			for key, value in filters.items()
+		]
+	return [*(filters or []), [doctype, "name", ">", last_name]]
+
+
+def import_from_doctype(list_name, doctype, mobile_field, name_field=None, filters=None, limit=None, data_fields=None):
+	"""Replace the recipients of ``list_name`` with records of ``doctype``."""
+	limit = frappe.utils.cint(limit)
+	data_fields = data_fields or []
+
+	fields = ["name", mobile_field]
+	if name_field:
+		fields.append(name_field)
+	valid_fields = {f.fieldname for f in frappe.get_meta(doctype).fields}
+	data_fields = [f for f in data_fields if f in valid_fields]
+	fields.extend(f for f in data_fields if f not in fields)
+
+	total = frappe.db.count(doctype, filters)
+	if limit:
+		total = min(total, limit)
+
+	clear_recipients(list_name)
+	writer = RecipientWriter(list_name)
+	read = 0
+	last_name = ""
+	try:
+		while not limit or read < limit:
+			page_size = min(PAGE_SIZE, limit - read) if limit else PAGE_SIZE
+			records = frappe.get_all(
+				doctype,
+				filters=get_keyset_filters(doctype, filters, last_name),
+				fields=fields,
+				order_by="name asc",
+				limit=page_size,
+			)
+			if not records:
+				break
+
+			for record in records:
+				recipient_data = {
+					get_variable_name(field): record.get(field) for field in data_fields if record.get(field)
+				}
+				writer.add(record.get(mobile_field), name_field and record.get(name_field), recipient_data)
+
+			read += len(records)
+			last_name = records[-1].name
+			writer.flush()
+			publish_import_progress(list_name, read, total)
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title=f"WhatsApp Recipient Import: {list_name}", message=frappe.get_traceback())
+		publish_import_progress(list_name, read, total, finished=True, error=_("Import failed, see Error Log"))
+		return
+
+	writer.finish()
+	publish_import_progress(
+		list_name, read, total, finished=True, imported=writer.count, skipped=writer.skipped
+	)
+	return writer.count
+
+
+def enqueue_import_from_doctype(list_name, **kwargs):
+	frappe.enqueue(
+		"frappe_whatsapp.utils.recipient_import.import_from_doctype",
+		queue="long",
+		timeout=4 * 60 * 60,
+		list_name=list_name,
+		**kwargs,
+	)
+
+
+def get_file_path(file_url):
+	"""Path of an uploaded file the current user may read."""
+	file_doc = frappe.get_doc("File", {"file_url": file_url})
+	file_doc.check_permission("read")
+	return file_doc.get_full_path()
+
+
+def is_xlsx(path):
+	return os.path.splitext(path)[1].lower() == ".xlsx"
+
+
+def read_rows(path):
+	"""Yield ``(row, position)`` of a CSV or XLSX file without loading it.
+
+	``position`` counts towards :func:`get_file_size`: bytes for CSV, rows for XLSX.
+	"""
+	if is_xlsx(path):
+		from openpyxl import load_workbook
+
+		workbook = load_workbook(path, read_only=True, data_only=True)
+		try:
+			for i, row in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+				yield row, i
+		finally:
+			workbook.close()
+		return
+
+	with open(path, "rb") as raw:
+		# tell() of the binary file is the read-ahead position, close enough for progress
+		for row in csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")):
+			yield row, raw.tell()
+
+
+def get_file_size(path):
+	if is_xlsx(path):
+		from openpyxl import load_workbook
+
+		workbook = load_workbook(path, read_only=True)
+		try:
+			return workbook.active.max_row or 0
+		finally:
+			workbook.close()
+	return os.path.getsize(path)
+
+
+def get_header(path):
+	for row, _position in read_rows(path):
+		return [str(cell).strip() if cell is not None else "" for cell in row]
+	return []
+
+
+def get_cell_value(value):
+	"""A cell as a JSON value; spreadsheets store long numbers as floats."""
+	if isinstance(value, float) and value.is_integer():
+		return int(value)
+	if isinstance(value, (datetime, date)):
+		return value.isoformat()
+	return value
+
+
+def import_from_file(list_name, file_url, mobile_column, name_column=None, data_columns=None, replace=False):
+	"""Add the rows of a CSV or XLSX file to ``list_name``.
+
+	The first row holds column names. ``data_columns`` default to every column
+	other than the mobile and name columns.
+	"""
+	path = get_file_path(file_url)
+	header = get_header(path)
+	mobile_index = header.index(mobile_column)
+	name_index = header.index(name_column) if name_column else None
+	data_columns = data_columns or [c for c in header if c and c not in (mobile_column, name_column)]
+	data_indexes = [(get_variable_name(c), header.index(c)) for c in data_columns if c in header]
+
+	if frappe.utils.cint(replace):
+		clear_recipients(list_name)
+
+	total = get_file_size(path) or 1
+	writer = RecipientWriter(list_name, dedupe=False)
+	read = position = 0
+	try:
+		rows = read_rows(path)
+		next(rows, None)  # header
+		for row, position in rows:
+			read += 1
+			mobile = normalize_number(get_cell_value(row[mobile_index]) if mobile_index < len(row) else None)
+			if not VALID_NUMBER.match(mobile):
+				continue
+
+			recipient_data = {}
+			for variable, index in data_indexes:
+				value = get_cell_value(row[index]) if index < len(row) else None
+				if value not in (None, ""):
+					recipient_data[variable] = value
+			recipient_name = row[name_index] if name_index is not None and name_index < len(row) else None
+
+			writer.add(mobile, recipient_name and str(recipient_name), recipient_data)
+			if read % PAGE_SIZE == 0:
+				publish_import_progress(
+					list_name, position, total, description=_("{0} rows read").format(read)
+				)
+		writer.finish()
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title=f"WhatsApp Recipient Import: {list_name}", message=frappe.get_traceback())
+		publish_import_progress(list_name, position, total, finished=True, error=_("Import failed, see Error Log"))
+		return
+
+	publish_import_progress(
+		list_name, total, total, finished=True, imported=writer.count, skipped=read - writer.count
+	)
+	return writer.count
+
+
+def enqueue_import_from_file(list_name, **kwargs):
+	frappe.enqueue(
+		"frappe_whatsapp.utils.recipient_import.import_from_file",
+		queue="long",
+		timeout=4 * 60 * 60,
+		list_name=list_name,
+		**kwargs,
+	)
@@ -0,0 +1,126 @@
+"""Resumable uploads for template header samples.
+
+Meta's Resumable Upload API takes a file in an upload session. The file is
+streamed from disk in fixed-size chunks, each sent at the offset the server
+has acknowledged, so a dropped connection resumes where it stopped instead
+of starting over. The resulting ``header_handle`` is cached by file hash, so
+saving a template again with the same sample doesn't upload it again.
+Uploads run during a template save, so within a web request they retry
+less and back off for at most ``REQUEST_MAX_BACKOFF`` seconds, rather
+than hold the web worker.
+"""
+import hashlib
+import os
+import time
+
+import frappe
+import magic
+import requests
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+MAX_RETRIES = 5
+REQUEST_MAX_RETRIES = 2
+REQUEST_MAX_BACKOFF = 2
+TIMEOUT = 120
+HANDLE_TTL = 25 * 24 * 60 * 60
+
+
+def get_file_hash(file_path):
+	sha = hashlib.sha256()
+	with open(file_path, "rb") as f:
+		for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+			sha.update(block)
+	return sha.hexdigest()
+
+
+def get_header_handle(url, version, app_id, token, file_path):
+	"""Upload ``file_path`` once and return its ``header_handle``."""
+	cache_key = f"whatsapp_header_handle:{app_id}:{get_file_hash(file_path)}"
+	handle = frappe.cache().get_value(cache_key)
+	if handle:
+		return handle
+
+	session_id = start_session(url, version, app_id, token, file_path)
+	handle = upload_file(url, version, token, session_id, file_path)
+	frappe.cache().set_value(cache_key, handle, expires_in_sec=HANDLE_TTL)
+	return handle
+
+
+def start_session(url, version, app_id, token, file_path):
+	response = requests.post(
+		f"{url}/{version}/{app_id}/uploads",
+		headers={"Authorization": f"Bearer {token}"},
+		params={
+			"file_length": os.path.getsize(file_path),
+			"file_type": magic.from_file(file_path, mime=True),
+			"messaging_product": "whatsapp",
+		},
+		timeout=TIMEOUT,
+	)
+	response.raise_for_status()
+	return response.json()["id"]
+
+
+def get_offset(url, version, token, session_id):
+	"""Bytes of the session the server has already received."""
+	response = requests.get(
+		f"{url}/{version}/{session_id}",
+		headers={"Authorization": f"OAuth {token}"},
+		timeout=TIMEOUT,
+	)
+	response.raise_for_status()
+	return int(response.json().get("file_offset", 0))
+
+
+def get_retry_limits():
+	"""Retries per chunk and longest backoff, in seconds, for this process."""
+	if getattr(frappe.local, "request", None):
+		return REQUEST_MAX_RETRIES, REQUEST_MAX_BACKOFF
+	return MAX_RETRIES, None
+
+
+def upload_file(url, version, token, session_id, file_path):
+	"""Send the file chunk by chunk, resuming from the server's offset on failure."""
+	size = os.path.getsize(file_path)
+	max_retries, max_backoff = get_retry_limits()
+	offset = 0
+	retries = 0
+
+	with open(file_path, "rb") as f:
+		while True:
+			f.seek(offset)
+			chunk = f.read(CHUNK_SIZE)
+			try:
+				response = requests.post(
+					f"{url}/{version}/{session_id}",
+					headers={"Authorization": f"OAuth {token}", "file_offset": str(offset)},
+					data=chunk,
+					timeout=TIMEOUT,
+				)
+				response.raise_for_status()
+				result = response.json()
+				if result.get("h"):
+					return result["h"]
+
+				acknowledged = get_offset(url, version, token, session_id)
+				if acknowledged <= offset:
+					retries += 1
+					if retries > max_retries:
+						frappe.throw(frappe._("Upload made no progress at offset {0}").format(offset))
+				else:
+					retries = 0
+				offset = acknowledged
+			except requests.RequestException:
+				retries += 1
+				if retries > max_retries:
+					raise
+				time.sleep(min(2**retries, max_backoff or 2**retries))
+				try:
+					offset = get_offset(url, version, token, session_id)
+				except requests.RequestException:
+					# retry the same chunk
+					pass
+
+			if offset >= size:
+				frappe.throw(frappe._("Upload finished without a header handle"))
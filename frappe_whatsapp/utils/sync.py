@@ -0,0 +1,76 @@
+"""Delta sync for the chat frontend.
+
+A cursor is ``"<modified>|<name>"`` of the last row a client has seen.
+Rows are paged by ``(modified, name)`` so a cursor never skips rows that
+share a timestamp. Anything that changes a row the chat shows must bump
+its ``modified``.
+
+Deletions travel as tombstones: names from ``Deleted Document``, paged by
+``(creation, name)`` with a cursor of their own and narrowed to the
+documents a client holds by values they were deleted with.
+"""
+import frappe
+
+
+SYNC_EVENT = "whatsapp_sync"
+EPOCH = "1900-01-01 00:00:00"
+
+
+def make_cursor(modified, name):
+	return f"{modified}|{name}"
+
+
+def parse_cursor(cursor):
+	"""Return ``(modified, name)`` for a cursor, or the start of time."""
+	if not cursor or "|" not in cursor:
+		return EPOCH, ""
+	modified, name = cursor.split("|", 1)
+	return modified, name
+
+
+def publish_sync(contact, modified, name):
+	"""Tell clients that ``contact`` has changes up to the given cursor."""
+	frappe.publish_realtime(
+		SYNC_EVENT,
+		{"contact": contact, "cursor": make_cursor(modified, name)},
+		after_commit=True,
+	)
+
+
+def get_deleted(doctypes, cursor=None, limit=500, match=None):
+	"""Names of ``doctypes`` deleted since ``cursor``, only those whose fields
+	had the values in ``match`` when deleted if it is given.
+
+	Without a cursor there is nothing to remove from the client yet, so only
+	a cursor starting now is returned.
+	"""
+	if not cursor:
+		return {"names": [], "cursor": make_cursor(frappe.utils.now(), ""), "has_more": False}
+
+	creation, name = parse_cursor(cursor)
+	values = {"doctypes": tuple(doctypes), "creation": creation, "name": name, "limit": limit}
+	conditions = []
+	for i, (field, value) in enumerate((match or {}).items()):
+		# the deleted document is kept as JSON in ``data``
+		conditions.append(f"AND JSON_UNQUOTE(JSON_EXTRACT(data, %(path_{i})s)) = %(value_{i})s")
+		values[f"path_{i}"] = f"$.{field}"
+		values[f"value_{i}"] = value
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT name, deleted_name, creation
+		FROM `tabDeleted Document`
+		WHERE deleted_doctype IN %(doctypes)s
+			AND (creation > %(creation)s OR (creation = %(creation)s AND name > %(name)s))
+			{" ".join(conditions)}
+		ORDER BY creation ASC, name ASC
+		LIMIT %(limit)s
+		""",
+		values,
+		as_dict=True,
+	)
+	return {
+		"names": [row.deleted_name for row in rows],
+		"cursor": make_cursor(rows[-1].creation, rows[-1].name) if rows else cursor,
+		"has_more": len(rows) == limit,
+	}
@@ -0,0 +1,122 @@
+"""Compiled WhatsApp Templates.
+
+Sending a template needs its name, language, header type and the layout of
+its buttons. Those are compiled once per template into a small cached dict,
+so the send paths (WhatsApp Message, notifications, bulk and CRM) only fill
+in parameter values instead of loading the template with its buttons table
+on every message. Validation reads the same dict. The cache is dropped
+whenever the template changes, including status updates from the webhook.
+"""
+import copy
+
+import frappe
+
+
+CACHE_KEY = "whatsapp_compiled_template"
+
+
+def get_compiled_template(template):
+	"""Compiled form of a WhatsApp Templates record."""
+	return frappe.cache().hget(CACHE_KEY, template, lambda: compile_template(template))
+
+
+def clear_compiled_template(template=None):
+	if template:
+		frappe.cache().hdel(CACHE_KEY, template)
+	else:
+		frappe.cache().delete_value(CACHE_KEY)
+
+
+def compile_template(template):
+	doc = frappe.get_doc("WhatsApp Templates", template)
+
+	body_fields = []
+	if doc.sample_values:
+		body_fields = [f.strip() for f in (doc.field_names or doc.sample_values).split(",")]
+
+	buttons = []
+	quick_reply_index = 0
+	dynamic_url_index = 0
+	for position, btn in enumerate(doc.buttons):
+		button = frappe._dict(
+			position=position,
+			button_type=btn.button_type,
+			website_url=btn.website_url,
+			is_dynamic_url=btn.button_type == "Visit Website" and btn.url_type == "Dynamic",
+		)
+		if btn.button_type == "Quick Reply":
+			button.component = {
+				"type": "button",
+				"sub_type": "quick_reply",
+				"index": str(quick_reply_index),
+				"parameters": [{
+					"type": "payload",
+					# unique payload format for Meta API compliance
+					"payload": f"QR_{quick_reply_index}_{(btn.button_label or '')[:50]}",
+				}],
+			}
+			quick_reply_index += 1
+		elif button.is_dynamic_url:
+			# counts only URL buttons with a dynamic suffix
+			button.dynamic_url_index = dynamic_url_index
+			dynamic_url_index += 1
+		buttons.append(button)
+
+	return frappe._dict(
+		name=doc.name,
+		template_name=doc.template_name,
+		actual_name=doc.actual_name or doc.template_name,
+		language_code=doc.language_code,
+		status=doc.status,
+		header_type=doc.header_type,
+		has_sample=bool(doc.sample),
+		whatsapp_account=doc.whatsapp_account,
+		variable_count=len(doc.sample_values.split(",")) if doc.sample_values else 0,
+		body_fields=body_fields,
+		buttons=buttons,
+	)
+
+
+def build_template_payload(template, to):
+	"""A fresh message payload for ``template`` with no components filled in."""
+	return {
+		"messaging_product": "whatsapp",
+		"to": to,
+		"type": "template",
+		"template": {
+			"name": template.actual_name,
+			"language": {"code": template.language_code},
+			"components": [],
+		},
+	}
+
+
+def body_component(values):
+	return {
+		"type": "body",
+		"parameters": [{"type": "text", "text": value} for value in values],
+	}
+
+
+def header_component(media_type, link=None, media_id=None, filename=None):
+	"""Header parameter for an image, video or document header."""
+	media = {"id": media_id} if media_id else {"link": link}
+	if filename:
+		media["filename"] = filename
+	return {
+		"type": "header",
+		"parameters": [{"type": media_type, media_type: media}],
+	}
+
+
+def url_button_component(index, text):
+	return {
+		"type": "button",
+		"sub_type": "url",
+		"index": str(index),
+		"parameters": [{"type": "text", "text": text}],
+	}
+
+
+def quick_reply_components(template):
+	return [copy.deepcopy(btn.component) for btn in template.buttons if btn.get("component")]
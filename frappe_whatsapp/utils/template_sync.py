@@ -0,0 +1,205 @@
+"""Template sync from Meta.
+
+Follows ``paging.next`` through ``/{business_id}/message_templates`` for
+every active WhatsApp Account and hashes each remote template. Every
+language of a template has its own record, matched within the account by
+(name, language). Only templates whose hash differs from the stored
+``content_hash`` are written, parents and buttons together, in one
+transaction per account.
+"""
+import hashlib
+import json
+
+import frappe
+from frappe.integrations.utils import make_request
+
+from frappe_whatsapp.utils.template_payload import clear_compiled_template
+
+
+PAGE_SIZE = 100
+BUTTON_TYPES = {
+	"URL": "Visit Website",
+	"PHONE_NUMBER": "Call Phone",
+	"QUICK_REPLY": "Quick Reply",
+	"FLOW": "Flow",
+}
+
+
+def sync_templates(whatsapp_account=None):
+	"""Sync templates of one or all active accounts. Returns per account counts."""
+	filters = {"status": "Active"}
+	if whatsapp_account:
+		filters["name"] = whatsapp_account
+
+	summary = {}
+	for account in frappe.get_all("WhatsApp Account", filters=filters, pluck="name"):
+		try:
+			summary[account] = sync_account_templates(account)
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(title="WhatsApp Template Sync", message=frappe.get_traceback())
+			summary[account] = None
+	return summary
+
+
+def get_remote_templates(account):
+	"""Yield every template of an account, page by page."""
+	token = account.get_password("token")
+	headers = {"authorization": f"Bearer {token}", "content-type": "application/json"}
+
+	url = f"{account.url}/{account.version}/{account.business_id}/message_templates?limit={PAGE_SIZE}"
+	while url:
+		response = make_request("GET", url, headers=headers)
+		yield from response.get("data", [])
+		url = response.get("paging", {}).get("next")
+
+
+def get_content_hash(account_name, template):
+	return hashlib.sha1(
+		json.dumps([account_name, template], sort_keys=True, default=str).encode()
+	).hexdigest()
+
+
+def get_local_templates(account_name):
+	"""Templates of an account, and those not linked to any account yet."""
+	return frappe.get_all(
+		"WhatsApp Templates",
+		or_filters=[
+			["whatsapp_account", "=", account_name],
+			["whatsapp_account", "is", "not set"],
+		],
+		fields=["name", "actual_name", "language_code", "content_hash"],
+	)
+
+
+def get_new_template_name(remote, account_name):
+	"""Name of a new template record, as its autoname unless another account took it."""
+	name = f"{remote['name']}-{remote['language']}"
+	if frappe.db.exists("WhatsApp Templates", name):
+		name = f"{name}-{account_name}"
+	return name
+
+
+def sync_account_templates(account_name):
+	account = frappe.get_doc("WhatsApp Account", account_name)
+
+	local = get_local_templates(account.name)
+	by_language = {(t.actual_name, t.language_code): t for t in local}
+	# records that once held several languages are named after their first one
+	by_docname = {t.name: t for t in local}
+
+	changed = []
+	unchanged = 0
+	claimed = set()
+	for remote in get_remote_templates(account):
+		content_hash = get_content_hash(account.name, remote)
+		existing = None
+		for candidate in (
+			by_language.get((remote["name"], remote["language"])),
+			by_docname.get(f"{remote['name']}-{remote['language']}"),
+		):
+			# a record shared by languages goes to one of them, the others get their own
+			if candidate and candidate.name not in claimed:
+				existing = candidate
+				break
+		if existing:
+			claimed.add(existing.name)
+
+		if existing and existing.content_hash == content_hash:
+			unchanged += 1
+			continue
+
+		if existing:
+			doc = frappe.get_doc("WhatsApp Templates", existing.name)
+		else:
+			doc = frappe.new_doc("WhatsApp Templates")
+			doc.template_name = remote["name"]
+			doc.actual_name = remote["name"]
+			doc.name = get_new_template_name(remote, account.name)
+
+		set_template_values(doc, remote, account.name)
+		doc.content_hash = content_hash
+		changed.append(doc)
+
+	if changed:
+		upsert_templates(changed)
+		frappe.db.commit()
+		for doc in changed:
+			clear_compiled_template(doc.name)
+
+	return {"changed": len(changed), "unchanged": unchanged}
+
+
+def set_template_values(doc, template, account_name):
+	"""Copy a Meta template onto a WhatsApp Templates document."""
+	doc.status = template["status"]
+	doc.language_code = template["language"]
+	doc.category = template["category"]
+	doc.id = template["id"]
+	doc.whatsapp_account = account_name
+
+	for component in template["components"]:
+		if component["type"] == "HEADER":
+			doc.header_type = component["format"]
+			if component["format"] == "TEXT":
+				doc.header = component["text"]
+
+		elif component["type"] == "FOOTER":
+			doc.footer = component["text"]
+
+		elif component["type"] == "BODY":
+			doc.template = component["text"]
+			body_text = (component.get("example") or {}).get("body_text")
+			if body_text:
+				doc.sample_values = ",".join(body_text[0])
+
+		elif component["type"] == "BUTTONS":
+			doc.set("buttons", [])
+			for i, button in enumerate(component.get("buttons", []), start=1):
+				btn = {
+					"button_type": BUTTON_TYPES[button["type"]],
+					"button_label": button.get("text"),
+					"sequence": i,
+				}
+				if button["type"] == "URL":
+					btn["website_url"] = button.get("url")
+					btn["url_type"] = "Dynamic" if "{{" in (btn["website_url"] or "") else "Static"
+					if button.get("example"):
+						btn["example_url"] = ",".join(button["example"])
+				elif button["type"] == "PHONE_NUMBER":
+					btn["phone_number"] = button.get("phone_number")
+
+				doc.append("buttons", btn)
+
+
+def upsert_templates(docs):
+	"""Write changed templates and replace their buttons without running hooks."""
+	now = frappe.utils.now()
+	for doc in docs:
+		doc.modified = now
+		if doc.is_new():
+			doc.db_insert()
+		else:
+			doc.db_update()
+
+	frappe.db.delete(
+		"WhatsApp Button",
+		{"parenttype": "WhatsApp Templates", "parent": ("in", [doc.name for doc in docs])},
+	)
+
+	fields = [
+		"name", "parent", "parenttype", "parentfield", "idx",
+		"creation", "modified", "owner", "modified_by", "docstatus",
+		"button_type", "button_label", "phone_number", "website_url", "url_type", "example_url",
+	]
+	values = []
+	for doc in docs:
+		for idx, btn in enumerate(doc.buttons, start=1):
+			values.append((
+				frappe.generate_hash(), doc.name, doc.doctype, "buttons", idx,
+				now, now, frappe.session.user, frappe.session.user, 0,
+				btn.button_type, btn.button_label, btn.phone_number, btn.website_url, btn.url_type, btn.example_url,
+			))
+
+	if values:
+		frappe.db.bulk_insert("WhatsApp Button", fields, values)
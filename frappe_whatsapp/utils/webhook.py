@@ -8,6 +8,10 @@ import frappe.utils
 import traceback
 
 from frappe_whatsapp.utils import get_whatsapp_account
+from frappe_whatsapp.utils.sync import publish_sync
+from frappe_whatsapp.utils.flow_response import store_flow_response
+from frappe_whatsapp.utils.flow_session import complete_session
+from frappe_whatsapp.utils.template_payload import clear_compiled_template
 
 
 @frappe.whitelist(allow_guest=True)
@@ -211,6 +215,8 @@ def post():
 							})
 							msg_doc = frappe.get_doc(msg_dict).insert(ignore_permissions=True)
 							update_whatsapp_contact_stats(whatsapp_contact.name, summary_message, msg_doc.name)
+							store_flow_response(msg_doc, flow_response)
+							complete_session(flow_response.get("flow_token"), flow_response)
 
 							frappe.publish_realtime(
 								"whatsapp_flow_response",
@@ -318,6 +324,8 @@ def update_template_status(data):
 		WHERE id = %(message_template_id)s""",
 		data
 	)
+	for template in frappe.get_all("WhatsApp Templates", filters={"id": data.get("message_template_id")}, pluck="name"):
+		clear_compiled_template(template)
 
 def update_message_status(data):
 	"""Update message status using direct DB update to avoid race conditions."""
@@ -327,19 +335,29 @@ def update_message_status(data):
 		status = status_data['status']
 		conversation = status_data.get('conversation', {}).get('id')
 		
-		name = frappe.db.get_value("WhatsApp Message", filters={"message_id": message_id})
+		message = frappe.db.get_value(
+			"WhatsApp Message", filters={"message_id": message_id}, fieldname=["name", "whatsapp_contact"], as_dict=True
+		)
 
-		if name:
+		if message:
+			name = message.name
 			# Use set_value to avoid TimestampMismatchError
 			# Capitalize status (sent -> Sent, read -> Read) for frontend consistency
 			status = status.capitalize()
 			
-			update_dict = {"status": status}
+			# modified is bumped explicitly so chat clients pick the change up in their next delta sync
+			now = frappe.utils.now()
+			update_dict = {"status": status, "modified": now}
 			if conversation:
 				update_dict["conversation_id"] = conversation
+			if status_data.get("errors"):
+				update_dict["error_code"] = status_data["errors"][0].get("code")
 			
 			frappe.db.set_value("WhatsApp Message", name, update_dict, update_modified=False)
 			frappe.db.commit()
+
+			if message.whatsapp_contact:
+				publish_sync(message.whatsapp_contact, now, name)
 			
 			# Publish realtime event so UI updates instantly
 			frappe.publish_realtime(
@@ -435,27 +453,12 @@ def get_or_create_whatsapp_contact(mobile_no, contact_name, whatsapp_account):
 
 
 def update_whatsapp_contact_stats(contact_name, message_text=None, message_name=None):
-	"""Update conversation statistics and publish real-time events."""
+	"""Publish real-time events for a new incoming message."""
 	try:
 
-		# Use direct DB update to avoid TimestampMismatchError
-		now = frappe.utils.now()
-		updates = {
-			"last_message_date": now,
-			"is_read": 0
-		}
-		if message_text:
-			updates["last_message"] = message_text[:500]
-			
-		frappe.db.set_value("WhatsApp Contact", contact_name, updates, update_modified=False)
-		
-		# Increment stats safely
-		frappe.db.sql("""
-			UPDATE `tabWhatsApp Contact`
-			SET total_messages = total_messages + 1, unread_count = unread_count + 1
-			WHERE name = %(name)s
-		""", {"name": contact_name})
-		
+		# Inbox counters live in WhatsApp Conversation and are maintained by
+		# frappe_whatsapp.utils.conversation on message insert.
+
 		# Fetch only needed fields without loading full document (avoids timestamp conflicts)
 		contact_data = frappe.db.get_value("WhatsApp Contact", contact_name, 
 			["email", "lead_reference", "contact_name", "mobile_no"], as_dict=True)
@@ -0,0 +1,194 @@
+// Delta sync with a local IndexedDB cache
+// The server hands out opaque "<modified>|<name>" cursors; we keep the last
+// one per conversation and only ask for what changed after it. Deletions
+// come as names with a cursor of their own, kept under "deleted:<key>".
+
+import { frappeCall } from './frappe.js';
+
+const DB_NAME = 'frappe_whatsapp';
+const DB_VERSION = 1;
+const CONTACTS_CURSOR = '__contacts__';
+const OLDER_CONTACTS_PAGE = 100;
+
+const deletedKey = (key) => `deleted:${key}`;
+
+let dbPromise = null;
+
+const openDb = () => {
+  if (dbPromise) return dbPromise;
+
+  dbPromise = new Promise((resolve, reject) => {
+    if (typeof indexedDB === 'undefined') {
+      resolve(null);
+      return;
+    }
+
+    const request = indexedDB.open(DB_NAME, DB_VERSION);
+    request.onupgradeneeded = () => {
+      const db = request.result;
+      const messages = db.createObjectStore('messages', { keyPath: 'name' });
+      messages.createIndex('contact', 'contact');
+      db.createObjectStore('contacts', { keyPath: 'name' });
+      db.createObjectStore('cursors');
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  }).catch((error) => {
+    console.warn('IndexedDB unavailable, syncing without a local cache:', error);
+    return null;
+  });
+
+  return dbPromise;
+};
+
+const promisify = (request) => new Promise((resolve, reject) => {
+  request.onsuccess = () => resolve(request.result);
+  request.onerror = () => reject(request.error);
+});
+
+const getCursor = async (key) => {
+  const db = await openDb();
+  if (!db) return null;
+  return (await promisify(db.transaction('cursors').objectStore('cursors').get(key))) || null;
+};
+
+// Cursors compare as (modified, name); modified strings sort chronologically
+export const isCursorAhead = (cursor, than) => {
+  if (!cursor) return false;
+  if (!than) return true;
+  const [modified, name] = cursor.split('|');
+  const [thanModified, thanName] = than.split('|');
+  return modified > thanModified || (modified === thanModified && name > thanName);
+};
+
+// True when a realtime event's cursor is past what we have cached
+export const needsSync = async (contact, eventCursor) => isCursorAhead(eventCursor, await getCursor(contact));
+
+const sortByCreation = (messages) => messages.sort((a, b) => (a.creation < b.creation ? -1 : a.creation > b.creation ? 1 : 0));
+
+const sortByActivity = (contacts) => contacts.sort((a, b) => {
+  const left = a.last_message_date || '';
+  const right = b.last_message_date || '';
+  return left < right ? 1 : left > right ? -1 : 0;
+});
+
+export const getCachedMessages = async (contact) => {
+  const db = await openDb();
+  if (!db) return [];
+  const rows = await promisify(db.transaction('messages').objectStore('messages').index('contact').getAll(contact));
+  return sortByCreation(rows);
+};
+
+export const getCachedContacts = async () => {
+  const db = await openDb();
+  if (!db) return [];
+  return sortByActivity(await promisify(db.transaction('contacts').objectStore('contacts').getAll()));
+};
+
+const commit = (tx) => new Promise((resolve, reject) => {
+  tx.oncomplete = resolve;
+  tx.onerror = () => reject(tx.error);
+});
+
+const writeMessages = async (contact, messages, deleted, cursor, deletedCursor) => {
+  const db = await openDb();
+  if (!db) return;
+
+  const tx = db.transaction(['messages', 'cursors'], 'readwrite');
+  const store = tx.objectStore('messages');
+  messages.forEach((message) => store.put({ ...message, contact }));
+  deleted.forEach((name) => store.delete(name));
+  const cursors = tx.objectStore('cursors');
+  if (cursor) cursors.put(cursor, contact);
+  if (deletedCursor) cursors.put(deletedCursor, deletedKey(contact));
+  await commit(tx);
+};
+
+const writeContacts = async (contacts, deleted = [], cursor = null, deletedCursor = null) => {
+  const db = await openDb();
+  if (!db) return;
+
+  const tx = db.transaction(['contacts', 'cursors'], 'readwrite');
+  const store = tx.objectStore('contacts');
+  contacts.forEach((contact) => store.put(contact));
+  deleted.forEach((name) => store.delete(name));
+  const cursors = tx.objectStore('cursors');
+  if (cursor) cursors.put(cursor, CONTACTS_CURSOR);
+  if (deletedCursor) cursors.put(deletedCursor, deletedKey(CONTACTS_CURSOR));
+  await commit(tx);
+};
+
+// Pull everything that changed for a conversation since our cursor and
+// return the merged, creation-ordered message list.
+export const syncMessages = async (contact, cached = null) => {
+  const byName = new Map((cached || await getCachedMessages(contact)).map((m) => [m.name, m]));
+  let cursor = await getCursor(contact);
+  let deletedCursor = await getCursor(deletedKey(contact));
+
+  for (;;) {
+    const { message: delta } = await frappeCall('frappe_whatsapp.frappe_whatsapp.api.chat.get_message_changes', {
+      contact_id: contact,
+      cursor,
+      deleted_cursor: deletedCursor,
+    });
+
+    const changed = [...delta.inserts];
+    delta.updates.forEach(([name, status]) => {
+      const message = byName.get(name);
+      if (message) changed.push({ ...message, status });
+    });
+    changed.forEach((m) => byName.set(m.name, m));
+    // tombstones are not scoped to the conversation, only drop what we hold
+    const deleted = delta.deleted.filter((name) => byName.delete(name));
+
+    if (delta.cursor !== cursor || delta.deleted_cursor !== deletedCursor) {
+      await writeMessages(contact, changed, deleted, delta.cursor, delta.deleted_cursor);
+    }
+    cursor = delta.cursor;
+    deletedCursor = delta.deleted_cursor;
+
+    if (!delta.has_more) break;
+  }
+
+  return { messages: sortByCreation([...byName.values()]), cursor };
+};
+
+// On the first load only the most recent conversations come back, and
+// hasOlder tells whether loadOlderContacts has more; later syncs leave it null.
+export const syncContacts = async (cached = null) => {
+  const byName = new Map((cached || await getCachedContacts()).map((c) => [c.name, c]));
+  let cursor = await getCursor(CONTACTS_CURSOR);
+  let deletedCursor = await getCursor(deletedKey(CONTACTS_CURSOR));
+  let hasOlder = null;
+
+  for (;;) {
+    const { message: delta } = await frappeCall('frappe_whatsapp.frappe_whatsapp.api.chat.get_contact_changes', {
+      cursor,
+      deleted_cursor: deletedCursor,
+    });
+
+    delta.contacts.forEach((c) => byName.set(c.name, c));
+    delta.deleted.forEach((name) => byName.delete(name));
+    if (delta.has_older !== undefined) hasOlder = delta.has_older;
+    if (delta.cursor !== cursor || delta.deleted_cursor !== deletedCursor) {
+      await writeContacts(delta.contacts, delta.deleted, delta.cursor, delta.deleted_cursor);
+    }
+    cursor = delta.cursor;
+    deletedCursor = delta.deleted_cursor;
+
+    if (!delta.has_more) break;
+  }
+
+  return { contacts: sortByActivity([...byName.values()]), cursor, hasOlder };
+};
+
+// Fetch the next page of older conversations, after the `start` most recent.
+// Later changes to them reach us through syncContacts like any other.
+export const loadOlderContacts = async (start) => {
+  const { message: contacts } = await frappeCall('frappe_whatsapp.frappe_whatsapp.api.chat.get_contacts', {
+    start,
+    page_length: OLDER_CONTACTS_PAGE,
+  });
+  await writeContacts(contacts || []);
+  return { contacts: contacts || [], hasOlder: (contacts || []).length === OLDER_CONTACTS_PAGE };
+};